@@ -0,0 +1,189 @@
+"""
+Offline benchmarks for :mod:`doit_interface`.
+
+Benchmarks are registered using the :func:`benchmark` decorator. Each benchmark function receives
+one combination of its parameters as keyword arguments, carries out any setup, and returns a
+callable that executes the code under test. The callable returns the number of items processed
+(e.g., tasks declared) so throughput can be reported. It may also return a tuple of the number of
+items and a dictionary of additional metrics measured by the benchmark itself, e.g., import times
+reported by a subprocess. Run all benchmarks and save the results with
+:code:`python -m benchmarks --output benchmarks.json`.
+"""
+from __future__ import annotations
+import gc
+import importlib
+import itertools
+import json
+import platform
+import re
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterable
+
+
+BENCHMARKS: dict[str, tuple[Callable, dict]] = {}
+MODULES = [
+    "declaration",
+    "provenance",
+    "sweep",
+    "loading",
+    "imports",
+    "checkers",
+    "scheduling",
+    "execution",
+    "spawn",
+]
+
+
+def benchmark(**params: Iterable) -> Callable:
+    """
+    Register a benchmark evaluated for the Cartesian product of `params`.
+
+    Args:
+        **params: Sequences of parameter values keyed by parameter name.
+    """
+    def _decorator(func: Callable) -> Callable:
+        module = func.__module__.rsplit(".", 1)[-1]
+        BENCHMARKS[f"{module}.{func.__name__}"] = (func, params)
+        return func
+    return _decorator
+
+
+def discover() -> dict[str, tuple[Callable, dict]]:
+    """
+    Import all benchmark modules and return the registered benchmarks.
+    """
+    for module in MODULES:
+        importlib.import_module(f"{__name__}.{module}")
+    return BENCHMARKS
+
+
+def measure(func: Callable, params: dict, repeat: int) -> dict:
+    """
+    Measure the run time and memory usage of a benchmark for a single set of parameters.
+
+    Args:
+        func: Benchmark function.
+        params: Parameters passed to the benchmark function.
+        repeat: Number of timed repetitions. Setup is carried out afresh for each repetition.
+
+    Returns:
+        result: Timing and memory statistics.
+    """
+    times = []
+    metrics = None
+    for _ in range(repeat):
+        run = func(**params)
+        gc.collect()
+        start = time.perf_counter()
+        num_items = run()
+        times.append(time.perf_counter() - start)
+        del run
+        # Keep the additional metrics of the fastest repetition.
+        if isinstance(num_items, tuple):
+            num_items, current = num_items
+            if metrics is None or times[-1] == min(times):
+                metrics = current
+
+    # Measure memory separately because tracing allocations distorts the timing.
+    run = func(**params)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del run
+
+    best = min(times)
+    return {
+        "times": times,
+        "best": best,
+        "num_items": num_items,
+        "throughput": num_items / best if best else None,
+        "peak_memory": peak,
+        "retained_memory": retained,
+        "metrics": metrics or {},
+    }
+
+
+def run(pattern: str = None, repeat: int = 3, overrides: dict = None,
+        log: Callable = None) -> dict:
+    """
+    Run benchmarks and collect the results.
+
+    Args:
+        pattern: Regular expression to select benchmarks by name.
+        repeat: Number of timed repetitions for each set of parameters.
+        overrides: Parameter values that replace the registered values for all benchmarks that
+            accept the parameter.
+        log: Callable to report progress (defaults to no reporting).
+
+    Returns:
+        report: Metadata and results for each benchmark and set of parameters.
+    """
+    results = []
+    for name, (func, params) in discover().items():
+        if pattern and not re.search(pattern, name):
+            continue
+        params = {key: (overrides or {}).get(key, values) for key, values in params.items()}
+        for values in itertools.product(*params.values()):
+            kwargs = dict(zip(params, values))
+            result = {"name": name, "params": kwargs, **measure(func, kwargs, repeat)}
+            if log:
+                log(result)
+            results.append(result)
+    return {
+        "metadata": {
+            "python": sys.version,
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float = 1.1) -> list[dict]:
+    """
+    Compare benchmark results with a baseline.
+
+    Args:
+        report: Current results as returned by :func:`run`.
+        baseline: Previous results as returned by :func:`run`.
+        threshold: Ratio of best times above which a result is considered a regression.
+
+    Returns:
+        comparisons: Ratio of best times for each benchmark present in both reports.
+    """
+    def _key(result):
+        return result["name"], json.dumps(result["params"], sort_keys=True)
+
+    previous = {_key(result): result for result in baseline["results"]}
+    comparisons = []
+    for result in report["results"]:
+        if (other := previous.get(_key(result))) is None:
+            continue
+        ratio = result["best"] / other["best"]
+        comparisons.append({
+            "name": result["name"],
+            "params": result["params"],
+            "ratio": ratio,
+            "regression": ratio > threshold,
+        })
+    return comparisons
+
+
+def default_manager():
+    """
+    Create a fresh manager with the same context stack as :meth:`.Manager.get_instance`.
+    """
+    from doit_interface import Manager
+
+    previous = Manager._DEFAULT_MANAGER
+    Manager._DEFAULT_MANAGER = None
+    try:
+        return Manager.get_instance()
+    finally:
+        Manager._DEFAULT_MANAGER = previous
@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+from . import compare, run
+
+
+def _format_result(result: dict) -> str:
+    params = ", ".join(f"{key}={value}" for key, value in result["params"].items())
+    metrics = "".join(f", {key} {value:.4g}" for key, value in result["metrics"].items())
+    return f"{result['name']}({params}): {result['best'] * 1e3:.1f} ms, " \
+        f"{result['throughput'] or float('nan'):.0f} items/s, " \
+        f"peak {result['peak_memory'] / 2 ** 20:.1f} MiB, " \
+        f"retained {result['retained_memory'] / 2 ** 20:.1f} MiB{metrics}"
+
+
+def __main__(args: list = None) -> int:
+    parser = argparse.ArgumentParser("benchmarks", description="Run doit_interface benchmarks.")
+    parser.add_argument("--filter", help="regular expression to select benchmarks by name")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed repetitions")
+    parser.add_argument("--size", type=int, nargs="+",
+                        help="override the problem size of all benchmarks")
+    parser.add_argument("--output", help="JSON file to write results to")
+    parser.add_argument("--compare", help="JSON file with baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="ratio of run times above which a result is a regression")
+    args = parser.parse_args(args)
+
+    overrides = {"size": args.size} if args.size else None
+    report = run(args.filter, args.repeat, overrides,
+                 log=lambda result: print(_format_result(result)))
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+    if not args.compare:
+        return 0
+    with open(args.compare) as fp:
+        baseline = json.load(fp)
+    regressions = 0
+    for comparison in compare(report, baseline, args.threshold):
+        params = ", ".join(f"{key}={value}" for key, value in comparison["params"].items())
+        status = "REGRESSION" if comparison["regression"] else "ok"
+        print(f"{status}: {comparison['name']}({params}) {comparison['ratio']:.2f}x baseline")
+        regressions += comparison["regression"]
+    return int(regressions > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(__main__())
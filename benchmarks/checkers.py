@@ -0,0 +1,65 @@
+"""
+Throughput of checking whether file dependencies have changed using doit's :code:`md5` checker
+and the :class:`.HashChecker` for a few large files with and without a memoized digest and for
+many small files.
+"""
+import doit.dependency
+import doit_interface as di
+import os
+import tempfile
+from . import benchmark
+
+
+@benchmark(size=[8], file_size=[2 ** 25], checker=["md5", "hash", "memo"])
+def check_modified(size: int, file_size: int, checker: str):
+    tmp = tempfile.TemporaryDirectory()
+    block = os.urandom(2 ** 20)
+    filenames = [os.path.join(tmp.name, f"file{i}.bin") for i in range(size)]
+    for filename in filenames:
+        with open(filename, "wb") as fp:
+            for _ in range(file_size // len(block)):
+                fp.write(block)
+
+    class _HashChecker(di.HashChecker):
+        MEMO_PATH = os.path.join(tmp.name, "memo.sqlite")
+
+    instance = doit.dependency.MD5Checker() if checker == "md5" else _HashChecker()
+    if checker == "memo":
+        for filename in filenames:
+            instance.hash_file(filename)
+    # Use a state with a different modification time but the same size so the files are hashed.
+    states = [(0, file_size, "digest") for _ in filenames]
+
+    def _run():
+        with tmp:
+            for filename, state in zip(filenames, states):
+                assert instance.check_modified(filename, os.stat(filename), state)
+        return size
+    return _run
+
+
+@benchmark(size=[5000], file_size=[2 ** 10], checker=["md5", "hash", "prefetch"])
+def get_state(size: int, file_size: int, checker: str):
+    tmp = tempfile.TemporaryDirectory()
+    filenames = [os.path.join(tmp.name, f"file{i}.bin") for i in range(size)]
+    for filename in filenames:
+        with open(filename, "wb") as fp:
+            fp.write(os.urandom(file_size))
+
+    class _HashChecker(di.HashChecker):
+        MEMO_PATH = os.path.join(tmp.name, "memo.sqlite")
+
+    instance = doit.dependency.MD5Checker() if checker == "md5" else _HashChecker()
+
+    # Save the state of each file as doit does after a task completes, optionally prefetching
+    # digests as the `run` command used by `Manager.run` does, and flush the memo.
+    def _run():
+        with tmp:
+            if checker == "prefetch":
+                instance.prefetch((filename, None) for filename in filenames)
+            for filename in filenames:
+                assert instance.get_state(filename, None)
+            if checker != "md5":
+                instance.flush()
+        return size
+    return _run
@@ -0,0 +1,121 @@
+"""
+Throughput of task declarations using :meth:`.Manager.__call__` with different context stacks
+and the memory retained by dictionaries and compact :class:`.TaskRecord` instances.
+"""
+import contextlib
+import doit_interface as di
+from . import benchmark, default_manager
+
+
+SIZES = [10_000, 100_000]
+
+
+def _declare(manager: di.Manager, size: int) -> None:
+    for i in range(size):
+        manager(name=f"task{i}", targets=[f"outputs/{i}/result.txt"], file_dep=["inputs.txt"],
+                actions=["cp $^ $@"])
+
+
+@benchmark(size=SIZES)
+def bare(size: int):
+    manager = di.Manager()
+
+    def _run():
+        with manager:
+            for i in range(size):
+                manager(basename="task", name=f"task{i}", actions=["cp $^ $@"])
+        return size
+    return _run
+
+
+@benchmark(size=SIZES)
+def default_stack(size: int):
+    manager = default_manager()
+
+    def _run():
+        with manager, di.defaults(basename="task"):
+            _declare(manager, size)
+        return size
+    return _run
+
+
+@benchmark(size=SIZES, depth=[1, 4])
+def defaults(size: int, depth: int):
+    manager = default_manager()
+
+    def _run():
+        with manager, contextlib.ExitStack() as stack:
+            stack.enter_context(di.defaults(basename="task"))
+            for i in range(depth - 1):
+                stack.enter_context(di.defaults(doc=f"level{i}", verbosity=i % 3))
+            _declare(manager, size)
+        return size
+    return _run
+
+
+@benchmark(size=SIZES, depth=[1, 4])
+def path_prefix(size: int, depth: int):
+    manager = default_manager()
+
+    def _run():
+        with manager, contextlib.ExitStack() as stack:
+            stack.enter_context(di.defaults(basename="task"))
+            for i in range(depth):
+                stack.enter_context(di.path_prefix(f"level{i}"))
+            _declare(manager, size)
+        return size
+    return _run
+
+
+@benchmark(size=SIZES, depth=[1, 4])
+def prefix(size: int, depth: int):
+    manager = default_manager()
+
+    def _run():
+        with manager, contextlib.ExitStack() as stack:
+            for i in range(depth):
+                stack.enter_context(di.prefix(basename=f"level{i}_"))
+            for i in range(size):
+                manager(basename="task", name=f"task{i}", actions=["true"])
+        return size
+    return _run
+
+
+@benchmark(size=SIZES, depth=[1, 4])
+def group_tasks(size: int, depth: int):
+    manager = default_manager()
+
+    def _run():
+        with manager, contextlib.ExitStack() as stack:
+            for i in range(depth):
+                stack.enter_context(di.group_tasks(f"group{i}"))
+            stack.enter_context(di.defaults(basename="task"))
+            _declare(manager, size)
+        return size
+    return _run
+
+
+@benchmark(size=SIZES)
+def validate(size: int):
+    manager = di.Manager()
+    with manager:
+        for i in range(size):
+            manager(basename="task", name=f"task{i}", targets=[f"{i}.txt"],
+                    file_dep=[f"{i - 1}.txt"] if i else [])
+
+    def _run():
+        manager.validate(infer_task_dep=True)
+        return size
+    return _run
+
+
+@benchmark(size=SIZES, representation=["dict", "compact"])
+def records(size: int, representation: str):
+    manager = default_manager()
+    manager.compact = representation == "compact"
+
+    def _run():
+        with manager, di.defaults(basename="task"), di.path_prefix("/data/project/outputs"):
+            _declare(manager, size)
+        return size
+    return _run
@@ -0,0 +1,45 @@
+r"""
+Time to execute many short :class:`.SubprocessAction`\s using doit's runners and the
+:class:`.runners.AsyncioRunner`, and to execute them in batches using :class:`.BatchAction`\s.
+"""
+import doit_interface as di
+import os
+import tempfile
+from . import benchmark
+
+
+@benchmark(size=[500], par_type=["serial", "process", "thread", "asyncio"])
+def run(size: int, par_type: str):
+    manager = di.Manager()
+    with manager, di.SubprocessAction.use_as_default():
+        for i in range(size):
+            manager(basename="task", name=f"task{i}", actions=["true"])
+    tmp = tempfile.TemporaryDirectory()
+    args = ["--always-execute", "--reporter=zero", f"--db-file={os.path.join(tmp.name, 'db')}"]
+    if par_type != "serial":
+        args.extend(["--process=16", f"--parallel-type={par_type}"])
+
+    def _run():
+        with tmp:
+            assert not manager.run(args)
+        return size
+    return _run
+
+
+@benchmark(size=[500], batch_size=[1, 100])
+def batch(size: int, batch_size: int):
+    tmp = tempfile.TemporaryDirectory()
+    manager = di.Manager()
+    with manager:
+        for i in range(size):
+            target = os.path.join(tmp.name, f"{i}.txt")
+            manager(basename="task", name=f"task{i}", targets=[target],
+                    actions=[di.BatchAction("touch", ["$@"], batch_size=batch_size)])
+    args = ["--always-execute", "--reporter=zero", f"--db-file={os.path.join(tmp.name, 'db')}",
+            "--process=128", "--parallel-type=asyncio"]
+
+    def _run():
+        with tmp:
+            assert not manager.run(args)
+        return size
+    return _run
@@ -0,0 +1,54 @@
+"""
+Import time of :mod:`doit_interface` for typical usage patterns as reported by
+:code:`python -X importtime`.
+"""
+from __future__ import annotations
+import functools
+import os
+import subprocess
+import sys
+from . import benchmark
+
+
+STATEMENTS = {
+    "package": "import doit_interface",
+    "contexts": "import doit_interface as di; di.group_tasks; di.defaults",
+    "manager": "import doit_interface as di; di.Manager",
+    "all": "from doit_interface import *",
+}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_times(statement: str) -> dict[str, int]:
+    """
+    Get the import time in microseconds of each module imported by the interpreter at startup and
+    while executing `statement`, excluding the time spent importing nested modules.
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [
+        ROOT, os.environ.get("PYTHONPATH")]))}
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], env=env,
+                             capture_output=True, text=True, check=True)
+    times = {}
+    prefix = "import time:"
+    for line in process.stderr.splitlines():
+        if not line.startswith(prefix) or "self [us]" in line:
+            continue
+        self_time, _, name = line[len(prefix):].split("|")
+        times[name.strip()] = int(self_time)
+    return times
+
+
+@functools.lru_cache
+def _startup_modules() -> frozenset[str]:
+    return frozenset(_import_times("pass"))
+
+
+@benchmark(statement=list(STATEMENTS))
+def startup(statement: str):
+    startup_modules = _startup_modules()
+
+    def _run():
+        times = {name: time for name, time in _import_times(STATEMENTS[statement]).items()
+                 if name not in startup_modules}
+        return len(times), {"import_time": sum(times.values()) / 1e6}
+    return _run
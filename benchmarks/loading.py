@@ -0,0 +1,63 @@
+"""
+Time and peak memory to declare tasks and convert them to doit tasks, comparing eager
+declarations, frozen managers, and lazy factories registered using :meth:`.Manager.lazy`, and
+time to load all tasks or only the subgraph required for a single target, and time to resolve the
+dependencies of a large group with and without intermediate tasks.
+"""
+from doit.control import TaskControl
+from doit.loader import generate_tasks
+import doit_interface as di
+from . import benchmark, default_manager
+
+
+def _task(i: int) -> dict:
+    return {"basename": "task", "name": f"task{i}", "targets": [f"outputs/{i}/result.txt"],
+            "file_dep": ["inputs.txt"], "actions": ["cp $^ $@"]}
+
+
+@benchmark(size=[10_000, 100_000], mode=["eager", "frozen", "lazy"])
+def load(size: int, mode: str):
+    manager = default_manager()
+
+    def _run():
+        with manager:
+            if mode == "lazy":
+                manager.lazy(lambda: map(_task, range(size)))
+            else:
+                for i in range(size):
+                    manager(_task(i))
+        if mode != "eager":
+            manager.freeze()
+        tasks = generate_tasks("manager", manager.create_doit_tasks())
+        return len(tasks) - 1  # Discount the group task created by doit.
+    return _run
+
+
+@benchmark(size=[10_000, 100_000], selection=["all", "subgraph"])
+def load_target(size: int, selection: str):
+    manager = default_manager()
+    with manager:
+        for i in range(size):
+            manager(_task(i))
+    selected = None if selection == "all" else ["outputs/0/result.txt"]
+
+    def _run():
+        tasks = generate_tasks("manager", manager.create_doit_tasks(selected))
+        TaskControl(tasks)
+        return size
+    return _run
+
+
+@benchmark(size=[10_000, 100_000], fan_in=[None, 1000])
+def load_group(size: int, fan_in: int):
+    manager = default_manager()
+    with manager, di.group_tasks("group", fan_in=fan_in):
+        for i in range(size):
+            manager(basename="task", name=f"task{i}", actions=["true"])
+
+    def _run():
+        # Resolve the dependencies of the group as doit does when the group is executed.
+        control = TaskControl(generate_tasks("manager", manager.create_doit_tasks()))
+        control.process(["group"])
+        return size
+    return _run
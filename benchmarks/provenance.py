@@ -0,0 +1,17 @@
+"""
+Cost of recording where tasks were declared for each provenance mode of :class:`.Manager`.
+"""
+import doit_interface as di
+from . import benchmark
+
+
+@benchmark(size=[10_000, 100_000], provenance=di.Manager.PROVENANCE_MODES)
+def declare(size: int, provenance: str):
+    manager = di.Manager(provenance=provenance)
+
+    def _run():
+        with manager:
+            for i in range(size):
+                manager(basename="task", name=f"task{i}", actions=["true"])
+        return size
+    return _run
@@ -0,0 +1,60 @@
+"""
+Makespan of a synthetic graph of independent chains of tasks executed by a simulated pool of
+workers when ready tasks are dispatched in declaration order or by critical path.
+"""
+from __future__ import annotations
+from doit.control import TaskControl
+from doit.task import Task
+from doit_interface import durations
+from doit_interface.runners import ResourceDispatcher
+import heapq
+import itertools
+import random
+from . import benchmark
+
+
+def _simulate(dispatcher: ResourceDispatcher, task_durations: dict[str, float]) -> float:
+    """
+    Simulate the execution of tasks without running them and return the makespan.
+    """
+    now = 0
+    events = []
+    sequence = itertools.count()
+    completed = None
+    while True:
+        try:
+            node = dispatcher.generator.send(completed)
+        except StopIteration:
+            return now
+        completed = None
+        if node == "hold on":
+            now, _, completed = heapq.heappop(events)
+            completed.run_status = "successful"
+        else:
+            node.run_status = "run"
+            heapq.heappush(events, (now + task_durations[node.task.name], next(sequence), node))
+
+
+@benchmark(size=[1_000], priority=["declaration", "critical-path"])
+def makespan(size: int, priority: str):
+    # Declare many short chains followed by a few long chains.
+    rng = random.Random(0)
+    tasks = []
+    task_durations = {}
+    while len(tasks) < size:
+        long = len(tasks) > 0.8 * size
+        length = rng.randint(10, 20) if long else rng.randint(1, 3)
+        for i in range(min(length, size - len(tasks))):
+            name = f"task{len(tasks)}"
+            task_durations[name] = rng.uniform(5, 10) if long else rng.uniform(1, 10)
+            tasks.append(Task(name, ["true"], task_dep=[f"task{len(tasks) - 1}"] if i else [],
+                              meta={"resources": {"cpu": 1}}))
+
+    def _run():
+        control = TaskControl(tasks)
+        control.process(None)
+        priorities = durations.critical_path(control.tasks, task_durations) \
+            if priority == "critical-path" else None
+        dispatcher = ResourceDispatcher(control.task_dispatcher(), {"cpu": 16}, priorities)
+        return size, {"makespan": _simulate(dispatcher, task_durations)}
+    return _run
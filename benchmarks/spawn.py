@@ -0,0 +1,34 @@
+r"""
+Rate of launching trivial :class:`.SubprocessAction`\s using a shell and launching the program
+directly after splitting the command into program arguments, and rate of running python code in
+new interpreters and in processes forked from the warm worker of the :class:`.PythonWorkerAction`.
+"""
+from doit.task import Task
+import doit_interface as di
+from . import benchmark
+
+
+@benchmark(size=[500], shell=[True, False])
+def spawn(size: int, shell: bool):
+    kwargs = {"shell": True} if shell else {}
+    task = Task("spawn", [di.SubprocessAction("true --flag", **kwargs) for _ in range(size)])
+    di.SubprocessAction.reset_caches()
+
+    def _run():
+        for action in task.actions:
+            assert action.execute() is None
+        return size
+    return _run
+
+
+@benchmark(size=[100], worker=[False, True])
+def python(size: int, worker: bool):
+    cls = di.PythonWorkerAction if worker else di.SubprocessAction
+    task = Task("python", [cls(["$!", "-c", "import json"]) for _ in range(size)])
+    di.PythonWorkerAction.set_preload(["json"])
+
+    def _run():
+        for action in task.actions:
+            assert action.execute() is None
+        return size
+    return _run
@@ -0,0 +1,41 @@
+"""
+Throughput of declaring parameter sweeps using :meth:`.Manager.sweep` compared with nested loops.
+"""
+import doit_interface as di
+import math
+from . import benchmark, default_manager
+
+
+def _params(size: int) -> dict:
+    # Split the size across two parameters with up to ten learning rates.
+    num_lrs = math.gcd(size, 10)
+    return {"seed": range(size // num_lrs), "lr": [10 ** -i for i in range(num_lrs)]}
+
+
+@benchmark(size=[10_000, 100_000])
+def loop(size: int):
+    manager = default_manager()
+    params = _params(size)
+
+    def _run():
+        with manager:
+            for seed in params["seed"]:
+                for lr in params["lr"]:
+                    manager(basename="train", name=f"seed-{seed}_lr-{lr}",
+                            targets=[f"results/{seed}/{lr}.pt"],
+                            actions=[["$!", "train.py", *di.dict2args(seed=seed, lr=lr)]])
+        return len(manager.tasks)
+    return _run
+
+
+@benchmark(size=[10_000, 100_000])
+def sweep(size: int):
+    manager = default_manager()
+    params = _params(size)
+
+    def _run():
+        with manager:
+            manager.sweep("train", params, actions=[["$!", "train.py"]],
+                          template=lambda seed, lr: {"targets": [f"results/{seed}/{lr}.pt"]})
+        return len(manager.tasks)
+    return _run
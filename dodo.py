@@ -27,6 +27,9 @@ with di.group_tasks("build"):
         manager(name="pypi-readme", file_dep=["README.rst", "setup.py"],
                 targets=["docs/_build/pypi.html"], actions=["$! pypi-readme.py $@"])
 
+manager(basename="benchmarks", actions=["$! -m benchmarks --output benchmarks.json"],
+        targets=["benchmarks.json"], uptodate=[False])
+
 with di.defaults(basename="requirements"):
     manager(name="test", targets=["test_requirements.txt"],
             file_dep=["test_requirements.in", "setup.py"],
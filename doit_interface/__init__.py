@@ -1,15 +1,67 @@
-from .actions import SubprocessAction
-from .config import DOIT_CONFIG
-from .contexts import create_target_dirs, defaults, group_tasks, normalize_dependencies, \
-    path_prefix, prefix
-from .manager import Manager
-from .reporters import DoitInterfaceReporter
-from .util import NoTasksError, dict2args
+from typing import TYPE_CHECKING
+from .util import DeclarationLocation, NoTasksError, dict2args
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .actions import SubprocessAction
+    from .batching import BatchAction
+    from .cache import ArtifactCache
+    from .checkers import HashChecker
+    from .config import DOIT_CONFIG
+    from .contexts import create_target_dirs, defaults, group_tasks, normalize_dependencies, \
+        path_prefix, prefix
+    from .manager import Manager
+    from .records import TaskRecord
+    from .reporters import DoitInterfaceReporter, ProgressReporter
+    from .workers import PythonWorkerAction
+    from .workqueue import WorkQueue
+
+
+# Modules providing public names. They are imported on first access to keep `import doit_interface`
+# fast because importing doit, subprocess, and colorama is slow.
+_LAZY_ATTRIBUTES = {
+    "SubprocessAction": "actions",
+    "BatchAction": "batching",
+    "ArtifactCache": "cache",
+    "HashChecker": "checkers",
+    "DOIT_CONFIG": "config",
+    "create_target_dirs": "contexts",
+    "defaults": "contexts",
+    "group_tasks": "contexts",
+    "normalize_dependencies": "contexts",
+    "path_prefix": "contexts",
+    "prefix": "contexts",
+    "Manager": "manager",
+    "TaskRecord": "records",
+    "DoitInterfaceReporter": "reporters",
+    "ProgressReporter": "reporters",
+    "PythonWorkerAction": "workers",
+    "WorkQueue": "workqueue",
+}
+
+
+def __getattr__(name: str):
+    if (module := _LAZY_ATTRIBUTES.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Use `__import__` rather than `importlib.import_module` so the import is reported by
+    # `python -X importtime`.
+    value = getattr(__import__(f"{__name__}.{module}", fromlist=[name]), name)
+    # Cache the value so the module-level `__getattr__` is not called again.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
 
 __all__ = [
+    "ArtifactCache",
+    "DeclarationLocation",
+    "HashChecker",
     "Manager",
     "NoTasksError",
+    "TaskRecord",
+    "WorkQueue",
     "create_target_dirs",
     "defaults",
     "group_tasks",
@@ -17,7 +69,10 @@ __all__ = [
     "path_prefix",
     "prefix",
     "SubprocessAction",
+    "PythonWorkerAction",
+    "BatchAction",
     "DoitInterfaceReporter",
+    "ProgressReporter",
     "DOIT_CONFIG",
     "dict2args",
 ]
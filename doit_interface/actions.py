@@ -1,12 +1,24 @@
+from __future__ import annotations
+import asyncio
+import collections
 from doit.action import BaseAction
 from doit.exceptions import TaskFailed
 from doit.task import Task
+import functools
 import os
+import re
+import shlex
+import shutil
+import string
 import subprocess
 import sys
-from typing import Iterable, Union
+from typing import Iterable, Optional, TYPE_CHECKING, Union
+import warnings
 from .contexts import _BaseContext
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .cache import ArtifactCache
+
 
 class SubprocessAction(BaseAction):
     """
@@ -23,7 +35,14 @@ class SubprocessAction(BaseAction):
     details).
 
     Python format string substitution is also supported with keys matching the valid attributes of
-    :code:`doit.task.Task`.
+    :code:`doit.task.Task`. Templates are parsed when the action is created so invalid format
+    strings and unsupported substitutions raise a :class:`ValueError` when the task is declared.
+
+    String commands are executed by the shell unless :code:`shell` is given explicitly. However,
+    commands that only consist of words and quotes, e.g., :code:`python script.py --flag`, are split
+    into program arguments and launched without a shell if the program can be found on the
+    :code:`PATH`, allowing :mod:`subprocess` to use the faster :func:`os.posix_spawn`. The
+    environment shared by all actions is assembled once per run.
 
     Args:
         args: Sequence of program arguments or shell command.
@@ -31,6 +50,16 @@ class SubprocessAction(BaseAction):
         inherit_env: Inherit the environment from the parent process. The environment is updated
             with `env` if `True` and replaced by `env` if `False`.
         check_targets: Check that targets are created.
+        log: Path of a log file to stream the output of the subprocess to instead of the terminal,
+            e.g., :code:`logs/{name}.log`. The path supports the same format string substitutions
+            as `args`. Standard output and error are combined in the log file.
+        tail: Number of lines at the end of the output to keep in memory if `log` is given. The
+            lines are stored as :code:`err` and reported by the :class:`.DoitInterfaceReporter`
+            if the task fails.
+        cache: Restore targets from the artifact cache set using :meth:`set_artifact_cache`
+            instead of executing the subprocess if the command and its inputs have not changed.
+            The cache is only used for tasks with targets that have a single
+            :class:`SubprocessAction`.
         **kwargs: Keyword arguments passed to :func:`subprocess.check_call`.
 
     Example:
@@ -42,59 +71,94 @@ class SubprocessAction(BaseAction):
         >>> # Write the task name to the first target of the task.
         >>> SubprocessAction("echo {name} > $@")
         <doit_interface.actions.SubprocessAction object at 0x...>
+
+        >>> # Write output to a log file for each task.
+        >>> SubprocessAction("make all", log="logs/{name}.log", tail=50)
+        <doit_interface.actions.SubprocessAction object at 0x...>
     """
     _GLOBAL_ENV = {}
+    _ARTIFACT_CACHE: Optional[ArtifactCache] = None
+    _CHUNK_SIZE = 2 ** 16
+    # Environment keyed by whether it is inherited together with copies of the variables it was
+    # assembled from, and executables keyed by name and search path. Both are reset at the start
+    # of each run by :meth:`reset_caches`.
+    _ENV_CACHE: dict[bool, tuple[dict, dict, dict[str, str]]] = {}
+    _EXECUTABLES: dict[tuple[str, str], Optional[str]] = {}
 
     def __init__(self, args: Union[str, Iterable[str]], task: Task = None, env: dict = None,
-                 inherit_env: bool = True, check_targets: bool = True, **kwargs):
+                 inherit_env: bool = True, check_targets: bool = True, log: str = None,
+                 tail: int = 20, cache: bool = True, **kwargs):
         self.args = args
         self.task = task
         self.env = env or {}
         self.inherit_env = inherit_env
         self.check_targets = check_targets
+        self.log = log
+        self.tail = tail
+        self.cache = cache
         self.kwargs = kwargs
         self.err = self.out = self.result = None
         self.values = {}
+        if isinstance(args, str):
+            self._templates = _Template.parse(args)
+        elif isinstance(args, Iterable):
+            self._templates = [_Template.parse(str(arg)) for arg in args]
+        else:
+            self._templates = None
+        self._log = None if log is None else _Template.parse(log)
 
-    def _format_arg(self, arg: str, variables: dict):
-        arg = arg.format(**variables)
+    def check_task(self, task: dict) -> None:
+        """
+        Check that a task declaration provides the targets and file dependencies substituted in
+        the command.
+
+        Args:
+            task: Task declaration the action belongs to.
+        """
+        templates = [self._templates] if isinstance(self._templates, _Template) else \
+            self._templates or []
+        if any("$@" in template.template for template in templates) and not task.get("targets"):
+            raise ValueError(f"task `{task.get('basename')}` substitutes `$@` but does not have "
+                             "any targets")
+        # Dependencies may also be calculated while the task is executed.
+        if any("$^" in template.template for template in templates) \
+                and not task.get("file_dep") and not task.get("calc_dep"):
+            raise ValueError(f"task `{task.get('basename')}` substitutes `$^` but does not have "
+                             "any file dependencies")
+
+    def _format_arg(self, template: _Template) -> str:
+        arg = template.format(self.task)
         arg = arg.replace("$!", sys.executable)
         if "$@" in arg:
-            if not (targets := variables.get("targets")):
+            if not (targets := self.task.targets):
                 raise ValueError(f"task {self.task} does not have any targets")
             target, *_ = targets
             arg = arg.replace("$@", target)
-        if "$<" in arg:
-            raise ValueError(
-                "first dependency substitution is not supported because doit uses unordered sets "
-                "for dependencies; see https://github.com/pydoit/doit/pull/430"
-            )
         return arg
 
-    def execute(self, out=None, err=None) -> None:
-        if self.inherit_env:
-            env = dict(os.environ)
-        else:
-            env = {}
-        env.update(self._GLOBAL_ENV)
-        env.update(self.env)
-        env = {key: str(value) for key, value in env.items() if value is not None}
+    def _prepare(self) -> tuple[Union[str, list[str]], dict]:
+        """
+        Substitute variables and assemble the environment.
 
-        variables = {key: getattr(self.task, key) for key in self.task.valid_attr
-                     if hasattr(self.task, key)}
+        Returns:
+            args: Shell command or sequence of program arguments.
+            kwargs: Keyword arguments for launching the subprocess, including :code:`env` and
+                :code:`shell`.
+        """
         kwargs = dict(self.kwargs)
-        if isinstance(self.args, str):
+        kwargs["env"] = self._get_env()
+        if isinstance(self._templates, _Template):
             kwargs.setdefault("shell", True)
-            args = self._format_arg(self.args, variables)
+            args = self._format_arg(self._templates)
             if "$^" in args:
                 if not self.task.file_dep:
                     raise ValueError(f"task {self.task} does not have any file dependencies")
                 args = args.replace("$^", " ".join(self.task.file_dep))
-        elif isinstance(self.args, Iterable):
+        elif self._templates is not None:
             kwargs.setdefault("shell", False)
             args = []
-            for arg in map(str, self.args):
-                arg = self._format_arg(arg, variables)
+            for template in self._templates:
+                arg = self._format_arg(template)
                 # Apply string substitutions.
                 if arg == "$^":
                     if not self.task.file_dep:
@@ -104,23 +168,166 @@ class SubprocessAction(BaseAction):
                 args.append(arg)
         else:
             raise ValueError(f"{self.args} is not a valid command")
+        return args, kwargs
+
+    def _get_env(self) -> dict[str, str]:
+        """
+        Get the environment of the subprocess, reusing the environment shared by all actions
+        unless :data:`os.environ` or the global environment have changed since it was assembled.
+        """
+        # Comparing the encoded variables underlying `os.environ` is much faster than decoding
+        # and comparing them or assembling the environment from scratch.
+        environ = getattr(os.environ, "_data", os.environ) if self.inherit_env else {}
+        cached = self._ENV_CACHE.get(self.inherit_env)
+        if cached and cached[0] == environ and cached[1] == self._GLOBAL_ENV:
+            env = cached[2]
+        else:
+            env = {**os.environ, **self._GLOBAL_ENV} if self.inherit_env else self._GLOBAL_ENV
+            env = {key: str(value) for key, value in env.items() if value is not None}
+            self._ENV_CACHE[self.inherit_env] = (dict(environ), dict(self._GLOBAL_ENV), env)
+        if not self.env:
+            return env
+        env = dict(env)
+        for key, value in self.env.items():
+            if value is None:
+                env.pop(key, None)
+            else:
+                env[key] = str(value)
+        return env
+
+    @classmethod
+    def _which(cls, name: str, path: str) -> Optional[str]:
+        key = (name, path)
+        if (executable := cls._EXECUTABLES.get(key, key)) is key:
+            executable = cls._EXECUTABLES[key] = shutil.which(name, path=path)
+        return executable
 
+    def _spawn_args(self, args: Union[str, list[str]], kwargs: dict) \
+            -> tuple[Union[str, list[str]], dict]:
+        """
+        Split simple shell commands into program arguments and resolve the program so the
+        subprocess can be launched using :func:`os.posix_spawn`.
+        """
+        if kwargs["shell"]:
+            if "shell" in self.kwargs or (argv := _split_command(args)) is None:
+                return args, kwargs
+        else:
+            argv = args
+        if not argv or "executable" in kwargs or "cwd" in kwargs:
+            return args, kwargs
+        path = kwargs["env"].get("PATH", os.defpath)
+        if (executable := self._which(argv[0], path)) is None:
+            return args, kwargs
+        # File descriptors are not inheritable by default (PEP 446) so they need not be closed
+        # explicitly, and closing them prevents `subprocess` from using `posix_spawn`.
+        return argv, {"close_fds": False, **kwargs, "shell": False, "executable": executable}
+
+    def get_log_path(self) -> str:
+        """
+        Get the path of the log file for the task this action belongs to.
+        """
+        return self._format_arg(self._log)
+
+    def _open_log(self):
+        path = self.get_log_path()
+        if directory := os.path.dirname(path):
+            os.makedirs(directory, exist_ok=True)
+        return open(path, "wb"), _TailBuffer(self.tail)
+
+    def _get_cache_key(self, args: Union[str, list[str]]) -> Optional[str]:
+        """
+        Get the key of the artifact cache entry for this action or `None` if it is not cached.
+        """
+        if (cache := self._ARTIFACT_CACHE) is None or not self.cache or not self.task.targets \
+                or sum(isinstance(action, SubprocessAction) for action in self.task.actions) != 1:
+            return None
+        env = {key: str(value) for key, value in {**self._GLOBAL_ENV, **self.env}.items()
+               if value is not None}
         try:
-            subprocess.check_call(args, env=env, **kwargs)
-        except Exception as ex:
-            return TaskFailed(str(ex), exception=ex)
+            return cache.key(args, env, self.task.file_dep, self.task.targets,
+                             self.kwargs.get("cwd"))
+        except OSError:
+            return None
+
+    def _restore_targets(self, key: Optional[str]) -> bool:
+        return key is not None and self._ARTIFACT_CACHE.restore(key, self.task.targets)
+
+    def _store_targets(self, key: Optional[str]) -> None:
+        if key is None or not all(os.path.isfile(target) for target in self.task.targets):
+            return
+        try:
+            self._ARTIFACT_CACHE.store(key, self.task.targets)
+        except OSError as ex:
+            warnings.warn(f"targets of task {self.task} could not be cached: {ex}")
 
+    def _check_targets(self) -> Optional[TaskFailed]:
         if self.check_targets:
             for target in self.task.targets:
                 if not os.path.isfile(target):
                     return TaskFailed(f"target {target} was not created")
 
+    def execute(self, out=None, err=None) -> Optional[TaskFailed]:
+        args, kwargs = self._prepare()
+        if self._restore_targets(key := self._get_cache_key(args)):
+            return
+        args, kwargs = self._spawn_args(args, kwargs)
+        try:
+            if self.log is None:
+                subprocess.check_call(args, **kwargs)
+            else:
+                fp, tail = self._open_log()
+                with fp, subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                          **kwargs) as process:
+                    while chunk := process.stdout.read1(self._CHUNK_SIZE):
+                        fp.write(chunk)
+                        tail.feed(chunk)
+                self.err = tail.text()
+                if process.returncode:
+                    raise subprocess.CalledProcessError(process.returncode, args)
+        except Exception as ex:
+            return TaskFailed(str(ex), exception=ex)
+        if failure := self._check_targets():
+            return failure
+        self._store_targets(key)
+
+    async def execute_async(self, out=None, err=None) -> Optional[TaskFailed]:
+        """
+        Execute the action using :mod:`asyncio` subprocesses, e.g., in the
+        :class:`.runners.AsyncioRunner`.
+        """
+        args, kwargs = self._prepare()
+        if self._restore_targets(key := self._get_cache_key(args)):
+            return
+        args, kwargs = self._spawn_args(args, kwargs)
+        try:
+            if self.log is not None:
+                kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if kwargs.pop("shell"):
+                process = await asyncio.create_subprocess_shell(args, **kwargs)
+            else:
+                process = await asyncio.create_subprocess_exec(*args, **kwargs)
+            if self.log is not None:
+                fp, tail = self._open_log()
+                with fp:
+                    while chunk := await process.stdout.read(self._CHUNK_SIZE):
+                        fp.write(chunk)
+                        tail.feed(chunk)
+                self.err = tail.text()
+            if returncode := await process.wait():
+                raise subprocess.CalledProcessError(returncode, args)
+        except Exception as ex:
+            return TaskFailed(str(ex), exception=ex)
+        if failure := self._check_targets():
+            return failure
+        self._store_targets(key)
+
     @classmethod
     def set_global_env(cls, env):
         r"""
         Set global environment variables for all :class:`SubprocessAction`\s.
         """
         cls._GLOBAL_ENV = env
+        cls.reset_caches()
 
     @classmethod
     def get_global_env(cls):
@@ -129,10 +336,36 @@ class SubprocessAction(BaseAction):
         """
         return cls._GLOBAL_ENV
 
+    @classmethod
+    def reset_caches(cls) -> None:
+        r"""
+        Reset the environment and program paths cached by all :class:`SubprocessAction`\s. Caches
+        are reset at the start of each run, and the environment is assembled once more whenever
+        :data:`os.environ` or the global environment change.
+        """
+        cls._ENV_CACHE.clear()
+        cls._EXECUTABLES.clear()
+
+    @classmethod
+    def set_artifact_cache(cls, cache: Optional[ArtifactCache]) -> None:
+        r"""
+        Set the :class:`.ArtifactCache` used by all :class:`SubprocessAction`\s or disable caching
+        if `cache` is `None`.
+        """
+        cls._ARTIFACT_CACHE = cache
+
+    @classmethod
+    def get_artifact_cache(cls) -> Optional[ArtifactCache]:
+        r"""
+        Get the :class:`.ArtifactCache` used by all :class:`SubprocessAction`\s.
+        """
+        return cls._ARTIFACT_CACHE
+
     class use_as_default(_BaseContext):
         """
         Use the :class:`SubprocessAction` as the default action for strings (with shell execution)
-        and lists of strings (without shell execution).
+        and lists of strings (without shell execution). Substitutions of targets and file
+        dependencies are checked when the task is declared.
         """
         def __call__(self, task: dict) -> dict:
             if actions := task.get("actions"):
@@ -140,4 +373,110 @@ class SubprocessAction(BaseAction):
                     SubprocessAction(action) if isinstance(action, (str, list)) else action
                     for action in actions
                 ]
+                for action in task["actions"]:
+                    if isinstance(action, SubprocessAction):
+                        action.check_task(task)
             return task
+
+
+class _Template:
+    """
+    Format string parsed once so only the task attributes it references are looked up when it is
+    formatted and invalid templates are reported when the action is created. Templates are
+    immutable so actions with the same command share them (see :meth:`parse`).
+    """
+    __slots__ = ["template", "fields", "literal"]
+
+    def __init__(self, template: str) -> None:
+        self.template = template
+        fields = set()
+        try:
+            self._parse(template, fields)
+        except ValueError as ex:
+            raise ValueError(f"invalid template `{template}`: {ex}") from ex
+        self.fields = frozenset(fields)
+        if "$<" in template:
+            raise ValueError(
+                "first dependency substitution is not supported because doit uses unordered sets "
+                "for dependencies; see https://github.com/pydoit/doit/pull/430"
+            )
+        # Format templates without fields right away, e.g., to replace escaped braces.
+        self.literal = None if self.fields else template.format()
+
+    @classmethod
+    @functools.lru_cache(maxsize=2 ** 12)
+    def parse(cls, template: str) -> _Template:
+        """
+        Get a template, reusing templates recently created for the same format string.
+        """
+        return cls(template)
+
+    def _parse(self, template: str, fields: set[str]) -> None:
+        for _, field, spec, _ in string.Formatter().parse(template):
+            if field is None:
+                continue
+            key = re.match(r"[^.[]*", field).group()
+            if key not in Task.valid_attr:
+                raise ValueError(f"`{key}` is not a valid attribute of tasks")
+            fields.add(key)
+            if spec:
+                self._parse(spec, fields)
+
+    def format(self, task: Task) -> str:
+        if self.literal is not None:
+            return self.literal
+        return self.template.format_map({key: getattr(task, key) for key in self.fields
+                                         if hasattr(task, key)})
+
+
+# Characters with a special meaning in the shell beyond separating words and quoting them.
+_SHELL_CHARACTERS = frozenset("|&;<>()$`\\*?[]{}#~!\n")
+# Builtins and keywords of the shell that are not programs or behave differently from programs.
+_SHELL_BUILTINS = frozenset([
+    ".", ":", "alias", "bg", "break", "case", "cd", "command", "continue", "do", "done", "echo",
+    "elif", "else", "esac", "eval", "exec", "exit", "export", "fg", "fi", "for", "function",
+    "getopts", "hash", "if", "in", "jobs", "kill", "local", "pwd", "read", "readonly", "return",
+    "select", "set", "shift", "source", "then", "times", "trap", "type", "ulimit", "umask",
+    "unalias", "unset", "until", "wait", "while",
+])
+
+
+def _split_command(command: str) -> Optional[list[str]]:
+    """
+    Split a shell command into program arguments if the shell would only split it into words and
+    remove quotes, or return `None` otherwise.
+    """
+    if not _SHELL_CHARACTERS.isdisjoint(command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    if not argv or "=" in argv[0] or argv[0] in _SHELL_BUILTINS:
+        return None
+    return argv
+
+
+class _TailBuffer:
+    """
+    Ring buffer holding the last lines of a byte stream.
+    """
+    # Longest partial line to keep so memory is bounded even if there are no line breaks.
+    MAX_LINE_LENGTH = 2 ** 12
+
+    def __init__(self, maxlen: int) -> None:
+        self.lines = collections.deque(maxlen=maxlen)
+        self.partial = b""
+
+    def feed(self, data: bytes) -> None:
+        *lines, partial = (self.partial + data).split(b"\n")
+        self.lines.extend(lines)
+        self.partial = partial[-self.MAX_LINE_LENGTH:]
+
+    def text(self) -> str:
+        lines = list(self.lines)
+        if self.partial:
+            lines.append(self.partial)
+        if (maxlen := self.lines.maxlen) is not None:
+            lines = lines[max(len(lines) - maxlen, 0):]
+        return "".join(line.decode(errors="replace") + "\n" for line in lines)
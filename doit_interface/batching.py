@@ -0,0 +1,163 @@
+"""
+Coalesced execution of many small tasks sharing a command in batches.
+"""
+from __future__ import annotations
+import asyncio
+from concurrent import futures
+from doit.exceptions import TaskFailed
+from doit.task import Task
+import shlex
+import subprocess
+import threading
+from typing import Iterable, Optional, Union
+from .actions import _Template, SubprocessAction
+
+
+class BatchAction(SubprocessAction):
+    """
+    Launch a single subprocess for a batch of tasks sharing the same command, akin to
+    :code:`xargs`.
+
+    Each task contributes its arguments `args` to the batch, and the subprocess is launched with
+    the `command` followed by the arguments of all tasks in the batch. For example, tasks with
+    the action :code:`BatchAction("gzip --keep", ["$^"])` are executed as
+    :code:`gzip --keep a.txt b.txt ...`. Tasks are batched if the substituted `command`, the
+    environment, and the keyword arguments for launching the subprocess are the same. Whether a
+    task is up to date and whether its targets were created is determined for each task, but all
+    tasks of a batch fail if the subprocess fails.
+
+    A batch is launched once it has :code:`batch_size` tasks or :code:`max_latency` seconds after
+    its first task was added. Tasks must thus be executed concurrently to be batched, e.g., using
+    :code:`manager.run(["--process=256", "--parallel-type=asyncio"])`. Tasks executed in
+    different processes are not batched with one another, and the subprocess is launched without
+    a shell.
+
+    Args:
+        command: Program and arguments shared by all tasks supporting the same substitutions as
+            :class:`.SubprocessAction` except :code:`$^`.
+        args: Arguments of the task appended to the command supporting the same substitutions as
+            :class:`.SubprocessAction`.
+        batch_size: Maximum number of tasks in a batch.
+        max_latency: Maximum time in seconds to wait for tasks to join a batch.
+        env: Environment variables.
+        inherit_env: Inherit the environment from the parent process. The environment is updated
+            with `env` if `True` and replaced by `env` if `False`.
+        check_targets: Check that targets are created.
+        **kwargs: Keyword arguments passed to :func:`subprocess.check_call`.
+
+    Example:
+
+        >>> # Compress the file dependency of each task in batches of up to 100 files.
+        >>> BatchAction("gzip --keep", ["$^"], batch_size=100)
+        <doit_interface.batching.BatchAction object at 0x...>
+    """
+    _BATCHERS: dict[tuple, _Batcher] = {}
+    _LOCK = threading.Lock()
+
+    def __init__(self, command: Union[str, Iterable[str]], args: Union[str, Iterable[str]],
+                 batch_size: int = 100, max_latency: float = 0.1, task: Task = None,
+                 env: dict = None, inherit_env: bool = True, check_targets: bool = True,
+                 **kwargs) -> None:
+        if isinstance(args, str):
+            args = shlex.split(args)
+        super().__init__(args, task=task, env=env, inherit_env=inherit_env,
+                         check_targets=check_targets, cache=False, **kwargs)
+        if batch_size < 1:
+            raise ValueError(f"batch size must be positive but got {batch_size}")
+        self.command = command
+        self._command = [_Template.parse(arg) for arg in
+                         (shlex.split(command) if isinstance(command, str) else map(str, command))]
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+
+    def _submit(self) -> futures.Future:
+        """
+        Add the task to a batch and return a future that resolves to the exception raised while
+        launching the subprocess or `None`.
+        """
+        args, kwargs = self._prepare()
+        kwargs["shell"] = False
+        command = [self._format_arg(template) for template in self._command]
+        key = (tuple(command), self.inherit_env, repr(sorted(self.env.items())),
+               repr(sorted(self.kwargs.items())), self.batch_size, self.max_latency)
+        with self._LOCK:
+            if (batcher := self._BATCHERS.get(key)) is None:
+                batcher = self._BATCHERS[key] = _Batcher(command, self.batch_size,
+                                                         self.max_latency)
+        return batcher.submit(self, args, kwargs)
+
+    def _complete(self, error: Optional[Exception]) -> Optional[TaskFailed]:
+        if error is not None:
+            return TaskFailed(f"batch including task {self.task.name} failed: {error}",
+                              exception=error)
+        return self._check_targets()
+
+    def execute(self, out=None, err=None) -> Optional[TaskFailed]:
+        return self._complete(self._submit().result())
+
+    async def execute_async(self, out=None, err=None) -> Optional[TaskFailed]:
+        """
+        Execute the action without blocking the event loop while waiting for the batch, e.g., in
+        the :class:`.runners.AsyncioRunner`.
+        """
+        return self._complete(await asyncio.wrap_future(self._submit()))
+
+
+class _Batcher:
+    """
+    Collect the arguments of tasks and launch a subprocess for each batch in a thread.
+    """
+    def __init__(self, command: list[str], batch_size: int, max_latency: float) -> None:
+        self.command = command
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.lock = threading.Lock()
+        self.pending = []
+        self.timer = None
+
+    def submit(self, action: BatchAction, args: list[str], kwargs: dict) -> futures.Future:
+        future = futures.Future()
+        with self.lock:
+            self.pending.append((action, args, kwargs, future))
+            if len(self.pending) >= self.batch_size:
+                batch = self._take()
+            else:
+                batch = None
+                if self.timer is None:
+                    self.timer = threading.Timer(self.max_latency, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+        if batch:
+            threading.Thread(target=self._run, args=(batch,), daemon=True).start()
+        return future
+
+    def _take(self) -> list:
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def flush(self) -> None:
+        """
+        Launch a subprocess for the pending tasks.
+        """
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _run(self, batch: list) -> None:
+        # Tasks in a batch share the environment and keyword arguments so we use the first task's.
+        action, _, kwargs, _ = batch[0]
+        args = self.command + [arg for _, args, _, _ in batch for arg in args]
+        try:
+            args, kwargs = action._spawn_args(args, kwargs)
+            subprocess.check_call(args, **kwargs)
+            error = None
+        except Exception as ex:
+            error = ex
+        for *_, future in batch:
+            # Futures are cancelled if the run is interrupted, e.g., by the asyncio runner.
+            if not future.cancelled():
+                future.set_result(error)
@@ -0,0 +1,216 @@
+"""
+Content-addressed cache of task targets shared by different checkouts on the same machine.
+"""
+from __future__ import annotations
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from typing import ContextManager, Iterable, Union
+import uuid
+from .util import hash_file, sqlite_transaction
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+# ioctl request to clone the extents of one file into another on Linux.
+FICLONE = 0x40049409
+
+
+def _reflink(src: str, dst: str) -> None:
+    if fcntl is None:  # pragma: no cover
+        raise OSError("reflinks are not supported on this platform")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def _copy(src: str, dst: str) -> None:
+    shutil.copy2(src, dst)
+
+
+_LINK_METHODS = {
+    "reflink": _reflink,
+    "hardlink": os.link,
+    "copy": _copy,
+}
+
+
+class ArtifactCache:
+    """
+    Content-addressed cache of task targets.
+
+    Targets are stored under a key derived from the fully substituted command, the environment
+    variables set explicitly for the command, and the contents of file dependencies. On a cache
+    hit, targets are restored using the first of the `methods` supported by the file system
+    instead of executing the command. The least recently used entries are evicted if the cache
+    exceeds `max_size`. Hardlinks share storage with the cache, and targets restored by hardlink
+    must not be modified in place.
+
+    Args:
+        directory: Directory holding cached targets and the index.
+        max_size: Maximum total size of cached targets in bytes (defaults to no limit).
+        methods: Methods to try in turn when restoring and storing targets; :code:`reflink`,
+            :code:`hardlink`, or :code:`copy`. Targets are never stored by hardlink so a target
+            modified in place after it was created cannot corrupt the cache.
+
+    Example:
+
+        >>> cache = ArtifactCache("cache", max_size=2 ** 30)
+        >>> SubprocessAction.set_artifact_cache(cache)
+        >>> cache.stats()
+        {'entries': 0, 'size': 0, 'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        >>> SubprocessAction.set_artifact_cache(None)
+    """
+    STATS = ("hits", "misses", "stores", "evictions")
+
+    def __init__(self, directory: str, max_size: int = None,
+                 methods: Iterable[str] = ("reflink", "hardlink", "copy")) -> None:
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_size = max_size
+        self.methods = list(methods)
+        if invalid := set(self.methods) - set(_LINK_METHODS):
+            raise ValueError(f"invalid methods {invalid}; supported methods are "
+                             f"{list(_LINK_METHODS)}")
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, "
+                               "size INTEGER NOT NULL, last_access REAL NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, "
+                               "value INTEGER NOT NULL)")
+            connection.executemany("INSERT OR IGNORE INTO stats VALUES (?, 0)",
+                                   [(name,) for name in self.STATS])
+
+    def _connect(self) -> ContextManager[sqlite3.Connection]:
+        return sqlite_transaction(os.path.join(self.directory, "index.sqlite"))
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, "objects", key[:2], key)
+
+    def key(self, args: Union[str, list[str]], env: dict, file_dep: Iterable[str],
+            targets: Iterable[str], cwd: str = None) -> str:
+        """
+        Compute the key for a command.
+
+        Args:
+            args: Fully substituted shell command or sequence of program arguments.
+            env: Environment variables set explicitly for the command.
+            file_dep: File dependencies whose contents are hashed.
+            targets: Targets created by the command.
+            cwd: Working directory of the command if it differs from the current directory.
+
+        Returns:
+            key: Hexadecimal digest identifying the command and its inputs.
+        """
+        payload = {
+            "args": args,
+            "env": env,
+            "file_dep": {filename: hash_file(filename) for filename in sorted(file_dep)},
+            "targets": list(targets),
+        }
+        # The working directory is resolved so the same command run in different directories
+        # has different keys. It is omitted otherwise so checkouts in different directories
+        # share entries.
+        if cwd is not None:
+            payload["cwd"] = os.path.abspath(cwd)
+        payload = json.dumps(payload, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _transfer(self, src: str, dst: str, methods: Iterable[str]) -> None:
+        if directory := os.path.dirname(dst):
+            os.makedirs(directory, exist_ok=True)
+        error = None
+        for method in methods:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(dst)
+            try:
+                return _LINK_METHODS[method](src, dst)
+            except OSError as ex:
+                error = ex
+        raise error
+
+    def _increment(self, connection: sqlite3.Connection, name: str) -> None:
+        connection.execute("UPDATE stats SET value = value + 1 WHERE name = ?", (name,))
+
+    def restore(self, key: str, targets: Iterable[str]) -> bool:
+        """
+        Restore targets from the cache.
+
+        Args:
+            key: Key of the command that creates the targets.
+            targets: Paths to restore the targets to.
+
+        Returns:
+            hit: Whether the targets were restored.
+        """
+        with self._connect() as connection:
+            hit = connection.execute("UPDATE entries SET last_access = ? WHERE key = ?",
+                                     (time.time(), key)).rowcount
+            path = self._path(key)
+            try:
+                if hit:
+                    for i, target in enumerate(targets):
+                        self._transfer(os.path.join(path, str(i)), target, self.methods)
+            except OSError:
+                # The entry may have been evicted concurrently.
+                hit = False
+            self._increment(connection, "hits" if hit else "misses")
+        return bool(hit)
+
+    def store(self, key: str, targets: Iterable[str]) -> None:
+        """
+        Store targets in the cache and evict the least recently used entries if the cache exceeds
+        its maximum size.
+
+        Args:
+            key: Key of the command that created the targets.
+            targets: Paths of the targets to store.
+        """
+        path = self._path(key)
+        tmp = os.path.join(self.directory, f"tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        size = 0
+        try:
+            methods = [method for method in self.methods if method != "hardlink"] or ["copy"]
+            for i, target in enumerate(targets):
+                self._transfer(target, os.path.join(tmp, str(i)), methods)
+                size += os.path.getsize(target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                               (key, size, time.time()))
+            self._increment(connection, "stores")
+            if self.max_size is None:
+                return
+            total, = connection.execute("SELECT SUM(size) FROM entries").fetchone()
+            evicted = connection.execute("SELECT key, size FROM entries WHERE key != ? "
+                                         "ORDER BY last_access", (key,))
+            for other, other_size in evicted.fetchall():
+                if total <= self.max_size:
+                    break
+                connection.execute("DELETE FROM entries WHERE key = ?", (other,))
+                shutil.rmtree(self._path(other), ignore_errors=True)
+                self._increment(connection, "evictions")
+                total -= other_size
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the number of entries, their total size in bytes, and the number of hits, misses,
+        stores, and evictions.
+        """
+        with self._connect() as connection:
+            entries, size = connection.execute("SELECT COUNT(*), SUM(size) FROM entries") \
+                .fetchone()
+            stats = dict(connection.execute("SELECT name, value FROM stats"))
+        return {"entries": entries, "size": size or 0, **{name: stats[name] for name in self.STATS}}
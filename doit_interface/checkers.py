@@ -0,0 +1,221 @@
+"""
+Checkers determining whether file dependencies have changed.
+"""
+from __future__ import annotations
+import atexit
+from concurrent import futures
+from doit.dependency import FileChangedChecker
+import hashlib
+import itertools
+import mmap
+import os
+import sqlite3
+from typing import Iterable, Optional
+import weakref
+
+
+class HashChecker(FileChangedChecker):
+    """
+    Checker for file dependencies that hashes large files in parallel and memoizes digests.
+
+    Like doit's default :code:`md5` checker, a file is unchanged if its modification time matches
+    the saved state and changed if its size differs. Otherwise, the file is memory-mapped and
+    blocks of :attr:`BLOCK_SIZE` bytes are hashed concurrently in a thread pool (:mod:`hashlib`
+    releases the global interpreter lock while hashing). The digest is memoized on disk in
+    :attr:`MEMO_PATH` keyed by the absolute path, hashing method, size, modification time in
+    nanoseconds, and inode so each version of a file is only hashed once even if it is a dependency
+    of many tasks or the tasks are executed in different runs. Digests are written to the memo in a
+    single transaction by :meth:`flush` at the end of each run rather than one file at a time.
+
+    doit checks file dependencies one at a time, but the :code:`run` command used by
+    :meth:`.Manager.run` calls :meth:`prefetch` with all file dependencies of a task before doit
+    checks them so small files are hashed concurrently in the thread pool.
+
+    The checker is not used by default. Enable it using :code:`check_file_uptodate` in the
+    :code:`DOIT_CONFIG`. Changing the checker, the :attr:`ALGORITHM`, or the :attr:`BLOCK_SIZE`
+    changes the state of dependencies so all tasks are executed once more, and the memo is created
+    in the working directory so you may want to add it to your :code:`.gitignore`.
+
+    Example:
+
+        .. code-block:: python
+
+            DOIT_CONFIG = {"check_file_uptodate": HashChecker}
+    """
+    #: Name of the :mod:`hashlib` algorithm.
+    ALGORITHM = "blake2b"
+    #: Number of bytes hashed by each thread.
+    BLOCK_SIZE = 2 ** 24
+    #: Path of the digest memo relative to the working directory.
+    MEMO_PATH = ".doit-hashes.sqlite"
+    #: Maximum number of threads (defaults to the :class:`concurrent.futures.ThreadPoolExecutor`
+    #: default).
+    MAX_WORKERS = None
+    #: Number of small files hashed by each thread in :meth:`prefetch`.
+    PREFETCH_CHUNK_SIZE = 64
+
+    def __init__(self) -> None:
+        self.memo_path = os.path.abspath(self.MEMO_PATH)
+        self._connection = None
+        self._executor = None
+        # Digests that have not yet been written to the memo keyed by absolute path.
+        self._pending = {}
+        _CHECKERS.add(self)
+
+    def __getstate__(self) -> dict:
+        # Connections and thread pools cannot be pickled, e.g., when doit starts worker processes
+        # using the `spawn` method, and pending digests are written by this instance.
+        return {**self.__dict__, "_connection": None, "_executor": None, "_pending": {}}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        _CHECKERS.add(self)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.memo_path, timeout=60,
+                                               check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, "
+                                     "method TEXT, size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                                     "digest TEXT)")
+        return self._connection
+
+    def _get_executor(self) -> futures.ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(self.MAX_WORKERS)
+        return self._executor
+
+    def _hash_block(self, view: memoryview) -> bytes:
+        with view:
+            return hashlib.new(self.ALGORITHM, view).digest()
+
+    def _hash_small_files(self, paths: list[str]) -> list[Optional[str]]:
+        digests = []
+        for path in paths:
+            try:
+                with open(path, "rb") as fp:
+                    digests.append(hashlib.new(self.ALGORITHM, fp.read()).hexdigest())
+            except OSError:
+                digests.append(None)
+        return digests
+
+    def _get_key(self, stat: os.stat_result) -> tuple:
+        return f"{self.ALGORITHM}:{self.BLOCK_SIZE}", stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+    def _lookup(self, path: str, key: tuple) -> Optional[str]:
+        """
+        Get the memoized digest of a file or `None` if the file has not been hashed with `key`.
+        """
+        if (row := self._pending.get(path)) is None:
+            row = self._connect().execute("SELECT method, size, mtime_ns, inode, digest FROM "
+                                          "digests WHERE path = ?", (path,)).fetchone()
+        if row and tuple(row[:4]) == key:
+            return row[4]
+        return None
+
+    def hash_file(self, path: str, stat: os.stat_result = None) -> str:
+        """
+        Compute the digest of a file or get it from the memo if the file is unchanged.
+
+        Args:
+            path: File to hash.
+            stat: Result of :func:`os.stat` for the file.
+
+        Returns:
+            digest: Hexadecimal digest of the file contents.
+        """
+        path = os.path.abspath(path)
+        stat = stat or os.stat(path)
+        key = self._get_key(stat)
+        if (digest := self._lookup(path, key)) is not None:
+            return digest
+
+        if stat.st_size <= self.BLOCK_SIZE:
+            with open(path, "rb") as fp:
+                digest = hashlib.new(self.ALGORITHM, fp.read()).hexdigest()
+        else:
+            with open(path, "rb") as fp, \
+                    mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer, \
+                    memoryview(buffer) as view:
+                blocks = self._get_executor().map(self._hash_block, [
+                    view[start:start + self.BLOCK_SIZE]
+                    for start in range(0, len(view), self.BLOCK_SIZE)
+                ])
+                # Hash the concatenated digests of blocks to obtain the digest of the file.
+                digest = hashlib.new(self.ALGORITHM, b"".join(blocks)).hexdigest()
+        self._pending[path] = (*key, digest)
+        return digest
+
+    def prefetch(self, deps: Iterable[tuple[str, Optional[tuple]]]) -> None:
+        """
+        Hash small files concurrently so their digests are memoized before :meth:`check_modified`
+        or :meth:`get_state` are called for each file.
+
+        Files are only hashed if they exist, their modification time differs from the saved
+        state, and their digest has not been memoized. Files larger than :attr:`BLOCK_SIZE` are
+        skipped because their blocks are hashed concurrently when they are checked.
+
+        Args:
+            deps: Paths of file dependencies and their saved states or `None`.
+        """
+        misses = {}
+        for dep, state in deps:
+            try:
+                stat = os.stat(dep)
+            except OSError:
+                continue
+            if (state and state[0] == stat.st_mtime) or stat.st_size > self.BLOCK_SIZE:
+                continue
+            path = os.path.abspath(dep)
+            key = self._get_key(stat)
+            if self._lookup(path, key) is None:
+                misses[path] = key
+        if len(misses) < 2:
+            return
+        # Files are hashed in chunks because the overhead of submitting each small file to the
+        # thread pool exceeds the time it takes to hash it.
+        paths = list(misses)
+        chunks = [paths[start:start + self.PREFETCH_CHUNK_SIZE]
+                  for start in range(0, len(paths), self.PREFETCH_CHUNK_SIZE)]
+        digests = itertools.chain.from_iterable(
+            self._get_executor().map(self._hash_small_files, chunks))
+        for (path, key), digest in zip(misses.items(), digests):
+            if digest is not None:
+                self._pending[path] = (*key, digest)
+
+    def flush(self) -> None:
+        """
+        Write digests computed since the last flush to the memo in a single transaction.
+        """
+        if not self._pending:
+            return
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?)",
+                                   [(path, *row) for path, row in self._pending.items()])
+        self._pending.clear()
+
+    def check_modified(self, file_path: str, file_stat: os.stat_result, state: tuple) -> bool:
+        timestamp, size, digest = state
+        if file_stat.st_mtime == timestamp:
+            return False
+        if file_stat.st_size != size:
+            return True
+        return digest != self.hash_file(file_path, file_stat)
+
+    def get_state(self, dep: str, current_state: tuple) -> tuple:
+        stat = os.stat(dep)
+        # Skip hashing if the state was saved with the current modification time.
+        if current_state and current_state[0] == stat.st_mtime:
+            return None
+        return stat.st_mtime, stat.st_size, self.hash_file(dep, stat)
+
+
+# Checkers whose pending digests are written when the interpreter exits, e.g., if tasks are
+# executed by the `doit` command rather than `Manager.run`.
+_CHECKERS: weakref.WeakSet[HashChecker] = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_checkers() -> None:
+    for checker in list(_CHECKERS):
+        checker.flush()
@@ -1,20 +1,26 @@
 from __future__ import annotations
-from doit.tools import create_folder
+from collections.abc import Mapping
+import itertools
 import operator
 import os
 import pathlib
-from typing import Callable, Iterable
-from . import manager as manager_
+from typing import Callable, Iterable, Iterator, Optional, TYPE_CHECKING
 from .util import normalize_task_name, NoTasksError
 
+if TYPE_CHECKING:  # pragma: no cover
+    from .manager import Manager
+
 
 class _BaseContext:
     """
     Base class for contexts that can modify tasks. Inheriting classes should override
     :code:`__call__` to modify tasks.
     """
-    def __init__(self, *, manager: "manager_.Manager" = None) -> None:
-        self.manager = manager or manager_.Manager.get_instance()
+    def __init__(self, *, manager: Manager = None) -> None:
+        if manager is None:
+            from .manager import Manager
+            manager = Manager.get_instance()
+        self.manager = manager
 
     def __enter__(self):
         self.manager.context_stack.append(self)
@@ -28,6 +34,38 @@ class _BaseContext:
     def __call__(self, task: dict) -> dict:
         raise NotImplementedError
 
+    def _register_lazy(self) -> None:
+        """
+        Notify the context that a factory was registered using :meth:`.Manager.lazy` while the
+        context is active. The tasks of the factory are transformed when doit loads them.
+        """
+
+    def _declared(self, task: dict) -> None:
+        """
+        Notify the context that a task it transformed was declared after all contexts have been
+        applied. Side effects, e.g., recording the task, belong here rather than in
+        :code:`__call__` so a task that cannot be declared, e.g., because another task declares
+        the same target, does not modify the state of contexts or the manager.
+        """
+
+    def _merge(self, outer) -> Optional[_BaseContext]:
+        """
+        Merge this context with an `outer` context that is applied immediately afterwards.
+
+        The manager merges adjacent contexts when it compiles the context stack so tasks can be
+        transformed with fewer calls. Merged contexts refer to the contexts they were merged from
+        rather than copying their attributes so modifying an active context affects tasks declared
+        afterwards as it would without merging.
+
+        Args:
+            outer: Context applied after this context.
+
+        Returns:
+            merged: Context equivalent to applying this context and then the `outer` context or
+                :code:`None` if the contexts cannot be merged.
+        """
+        return None
+
 
 class normalize_dependencies(_BaseContext):
     """
@@ -51,7 +89,7 @@ class normalize_dependencies(_BaseContext):
             for dep in file_dep:
                 if isinstance(dep, (str, pathlib.Path)):
                     transformed.append(dep)
-                elif isinstance(dep, dict):
+                elif isinstance(dep, Mapping):
                     if targets := dep.get("targets"):
                         transformed.extend(targets)
                     else:
@@ -79,7 +117,7 @@ class defaults(_BaseContext):
         {'basename': 'basename', 'name': 'task1', ...}
         {'basename': 'basename', 'name': 'task2', ...}
     """
-    def __init__(self, *, manager: "manager_.Manager" = None, **defaults):
+    def __init__(self, *, manager: Manager = None, **defaults):
         super().__init__(manager=manager)
         self.defaults = defaults
 
@@ -88,27 +126,89 @@ class defaults(_BaseContext):
         transformed.update(task)
         return transformed
 
+    def _merge(self, outer) -> Optional[_merged_defaults]:
+        if type(self) is not defaults or type(outer) is not defaults:
+            return None
+        return _merged_defaults([self, outer])
+
+
+class _merged_defaults(_BaseContext):
+    """
+    Adjacent :class:`defaults` contexts applied with a single copy of each task.
+
+    Args:
+        contexts: Contexts in the order they are applied, i.e., innermost first.
+    """
+    def __init__(self, contexts: list[defaults]) -> None:
+        super().__init__(manager=contexts[0].manager)
+        self.contexts = contexts
+
+    def __call__(self, task: dict) -> dict:
+        # Inner defaults take precedence, and the defaults are looked up for each task so
+        # modifications of the contexts take effect.
+        transformed = {}
+        for context in reversed(self.contexts):
+            transformed.update(context.defaults)
+        transformed.update(task)
+        return transformed
+
+    def _merge(self, outer) -> Optional[_merged_defaults]:
+        if type(outer) is not defaults:
+            return None
+        return _merged_defaults([*self.contexts, outer])
+
 
 class create_target_dirs(_BaseContext):
     """
     Create parent directories for all targets.
 
+    Each task starts with an action shared by all tasks that creates the directories of its
+    targets. The :code:`run` command used by :meth:`.Manager.run` removes the action from the
+    tasks it executes and instead creates the directories of all selected tasks and their
+    dependencies in a single pass over the sorted directory tree before executing any task. The
+    action only runs if tasks are executed by other commands, e.g., the default :code:`doit`
+    command line interface.
+
     Example:
 
         >>> with create_target_dirs():
         ...     manager(basename="task", targets=["missing/directories/output.txt"])
         {'basename': 'task',
          'targets': ['missing/directories/output.txt'],
-         'actions': [(<function create_folder at 0x...>, ['missing/directories'])],
+         'actions': [<function _create_parent_dirs at 0x...>],
          ...}
     """
     def __call__(self, task: dict) -> dict:
-        # Prepend actions to create parent directories of all targets.
-        actions = [(create_folder, [basename]) for target in task.get("targets", [])
-                   if (basename := os.path.dirname(target))]
-        task["actions"] = actions + task.get("actions", [])
+        if any(os.path.dirname(target) for target in task.get("targets", [])):
+            task["actions"] = [_create_parent_dirs, *task.get("actions", [])]
         return task
 
+    @staticmethod
+    def create_dirs(directories: Iterable[str]) -> None:
+        """
+        Create directories and their parents if they are missing.
+
+        Directories are sorted by their components so each directory is followed by its
+        subdirectories, and only the deepest directories are created because their parents are
+        created with them.
+
+        Args:
+            directories: Directories to create.
+        """
+        directories = sorted({os.fspath(directory) for directory in directories},
+                             key=lambda directory: directory.split(os.sep))
+        for directory, following in itertools.zip_longest(directories, directories[1:]):
+            if following is None or not following.startswith(directory + os.sep):
+                os.makedirs(directory, exist_ok=True)
+
+
+def _create_parent_dirs(targets: list[str]) -> None:
+    """
+    Create the parent directories of targets (see :class:`create_target_dirs`).
+    """
+    create_target_dirs.create_dirs(directory for target in targets
+                                   if (directory := os.path.dirname(target)))
+
 
 class prefix(_BaseContext):
     """
@@ -118,23 +218,89 @@ class prefix(_BaseContext):
         op: Operation used to join prefixes (defaults to addition).
         **kwargs: Keyword arguments of different prefixes.
     """
-    def __init__(self, *, manager: "manager_.Manager" = None, op: Callable = None,
+    def __init__(self, *, manager: Manager = None, op: Callable = None,
                  **kwargs) -> None:
         super().__init__(manager=manager)
         self.kwargs = kwargs
         self.op = op or operator.add
 
     def __call__(self, task: dict) -> dict:
-        for key, prefix in self.kwargs.items():
+        return self._apply(task, self.op, self.kwargs)
+
+    @staticmethod
+    def _apply(task: dict, op: Callable, kwargs: dict) -> dict:
+        for key, prefix in kwargs.items():
             if not (value := task.get(key)):
                 continue
             if isinstance(value, str):
-                value = self.op(prefix, value)
+                value = op(prefix, value)
             elif isinstance(value, Iterable):
-                value = [self.op(prefix, x) for x in value]
+                value = [op(prefix, x) for x in value]
             task[key] = value
         return task
 
+    def _merge(self, outer) -> Optional[_merged_prefix]:
+        if type(self) not in _MERGEABLE_PREFIXES or type(outer) not in _MERGEABLE_PREFIXES \
+                or _merge_prefixes([self, outer]) is None:
+            return None
+        return _merged_prefix([self, outer])
+
+
+class _merged_prefix(_BaseContext):
+    """
+    Adjacent :class:`prefix` contexts applied with a single pass over the properties of each
+    task.
+
+    Args:
+        contexts: Contexts in the order they are applied, i.e., innermost first.
+    """
+    def __init__(self, contexts: list[prefix]) -> None:
+        super().__init__(manager=contexts[0].manager)
+        self.contexts = contexts
+        # Copies of the operations and prefixes the combined prefixes were computed from.
+        self._state = None
+        self._kwargs = None
+
+    def __call__(self, task: dict) -> dict:
+        # Prefixes are combined again if the contexts were modified so modifications take effect,
+        # and the contexts are applied in turn if they can no longer be combined.
+        state = [(context.op, context.kwargs) for context in self.contexts]
+        if state != self._state:
+            self._state = [(op, dict(kwargs)) for op, kwargs in state]
+            self._kwargs = _merge_prefixes(self.contexts)
+        if self._kwargs is None:
+            for context in self.contexts:
+                task = context(task)
+            return task
+        return prefix._apply(task, self.contexts[0].op, self._kwargs)
+
+    def _merge(self, outer) -> Optional[_merged_prefix]:
+        if type(outer) not in _MERGEABLE_PREFIXES \
+                or _merge_prefixes([*self.contexts, outer]) is None:
+            return None
+        return _merged_prefix([*self.contexts, outer])
+
+
+def _merge_prefixes(contexts: list[prefix]) -> Optional[dict]:
+    """
+    Combine the prefixes of contexts in the order they are applied or return `None` if they
+    cannot be combined. Prefixes can be combined if they are strings and the operation is
+    associative.
+    """
+    op = contexts[0].op
+    if op not in _ASSOCIATIVE_OPS or any(context.op is not op for context in contexts):
+        return None
+    kwargs = {}
+    for context in contexts:
+        for key, value in context.kwargs.items():
+            if key not in kwargs:
+                kwargs[key] = value
+            elif isinstance(value, str) and isinstance(kwargs[key], str):
+                kwargs[key] = op(value, kwargs[key])
+            else:
+                return None
+    return kwargs
+
 
 class path_prefix(prefix):
     """
@@ -152,7 +318,7 @@ class path_prefix(prefix):
         {'basename': 'task', 'targets': ['outputs/out.txt'], 'file_dep': ['inputs/in.txt'], ...}
     """
     def __init__(self, prefix: str = None, *, targets: str = None,
-                 file_dep: str = None, manager: "manager_.Manager" = None):
+                 file_dep: str = None, manager: Manager = None):
         if not any([prefix, targets, file_dep]):
             raise ValueError("at least one of `prefix`, `targets`, or `file_dep` must be given")
         if prefix and any([targets, file_dep]):
@@ -166,14 +332,25 @@ class path_prefix(prefix):
         super().__init__(manager=manager, op=os.path.join, **kwargs)
 
 
+_MERGEABLE_PREFIXES = {prefix, path_prefix}
+_ASSOCIATIVE_OPS = {operator.add, os.path.join}
+
+
 class group_tasks(dict, _BaseContext):
     """
     Group of tasks.
 
+    If `fan_in` is given, groups with more than `fan_in` task dependencies are split when doit
+    loads them. The group then depends on a balanced tree of intermediate tasks named
+    :code:`_{basename}.{index}`, each depending on at most `fan_in` tasks. The names of
+    intermediate tasks start with an underscore so they are hidden by :code:`doit list`.
+
     Args:
         basename: Basename of the task aggregating all constituent tasks.
         actions: Actions to be performed as part of this group.
         task_dep: Further task dependencies in addition to the constituent tasks.
+        fan_in: Maximum number of task dependencies of the group and intermediate tasks
+            (defaults to never splitting the group).
         manager: Task manager (defaults to :code:`Manager.get_instance()`).
 
     Example:
@@ -187,24 +364,68 @@ class group_tasks(dict, _BaseContext):
         <doit_interface.contexts.group_tasks object at 0x...> named `my_group` with 2 tasks
     """
     def __init__(self, basename: str, *, actions: list = None, task_dep: list = None,
-                 manager: "manager_.Manager" = None, **kwargs) -> None:
+                 fan_in: Optional[int] = None, manager: Manager = None, **kwargs) -> None:
+        if fan_in is not None and fan_in < 2:
+            raise ValueError(f"fan-in must be at least two but got {fan_in}")
         dict.__init__(self, basename=basename, actions=actions or [], task_dep=task_dep or [],
                       **kwargs)
         _BaseContext.__init__(self, manager=manager)
+        self.fan_in = fan_in
+        # Index of members so tasks are not added repeatedly, e.g., if lazy tasks are reloaded.
+        self._members = set(self["task_dep"])
+        self._has_lazy_tasks = False
 
         # Automatically add the group to the manager.
         self.manager(self)
 
     def __exit__(self, *_) -> None:
         super().__exit__(*_)
-        if not self["task_dep"]:
+        if not self["task_dep"] and not self._has_lazy_tasks:
             raise NoTasksError(f"group {self['basename']} must contain at least one task")
 
     def __call__(self, task: dict) -> dict:
-        self["task_dep"].append(normalize_task_name(task))
         return task
 
+    def _declared(self, task: dict) -> None:
+        if (name := normalize_task_name(task)) not in self._members:
+            self._members.add(name)
+            self["task_dep"].append(name)
+
+    def _register_lazy(self) -> None:
+        self._has_lazy_tasks = True
+
+    def _fan_in(self, task: dict) -> Iterator[dict]:
+        """
+        Yield the intermediate tasks aggregating the task dependencies of the declared group task
+        level by level followed by the group task itself.
+        """
+        task_dep = task.get("task_dep") or []
+        if self.fan_in is None or len(task_dep) <= self.fan_in:
+            yield dict(task)
+            return
+        basename = task["basename"]
+        index = 0
+        while len(task_dep) > self.fan_in:
+            # Split dependencies into the smallest number of chunks with sizes differing by one.
+            num_chunks = -(-len(task_dep) // self.fan_in)
+            bounds = [len(task_dep) * i // num_chunks for i in range(num_chunks + 1)]
+            level = []
+            for start, stop in zip(bounds, bounds[1:]):
+                name = f"_{basename}.{index}"
+                index += 1
+                yield {"basename": name, "task_dep": task_dep[start:stop], "actions": []}
+                level.append(name)
+            task_dep = level
+        yield {**task, "task_dep": task_dep}
+
     def __repr__(self) -> str:
         num_tasks = len(self['task_dep'])
-        return f"{_BaseContext.__repr__(self)} named `{normalize_task_name(self)}` with " \
+        description = f"{_BaseContext.__repr__(self)} named `{normalize_task_name(self)}` with " \
             f"{num_tasks} {'tasks' if num_tasks > 1 else 'task'}"
+        num_intermediate = 0
+        while self.fan_in is not None and num_tasks > self.fan_in:
+            num_tasks = -(-num_tasks // self.fan_in)
+            num_intermediate += num_tasks
+        if num_intermediate:
+            description += f" aggregated by {num_intermediate} intermediate tasks"
+        return description
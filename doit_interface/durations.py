@@ -0,0 +1,108 @@
+"""
+Wall-clock durations of tasks recorded across runs to prioritize tasks on the critical path.
+"""
+from __future__ import annotations
+import collections
+import contextlib
+import os
+import sqlite3
+from typing import Mapping
+
+
+# Path of the database relative to the working directory.
+DEFAULT_PATH = ".doit-durations.sqlite"
+
+
+def load(path: str = DEFAULT_PATH) -> dict[str, float]:
+    """
+    Load recorded task durations.
+
+    Args:
+        path: Path of the database.
+
+    Returns:
+        durations: Most recent duration of each task in seconds keyed by task name.
+    """
+    if not os.path.isfile(path):
+        return {}
+    with contextlib.closing(sqlite3.connect(path, timeout=60)) as connection:
+        return dict(connection.execute("SELECT name, duration FROM durations"))
+
+
+def load_recorded(reporter) -> dict[str, float]:
+    """
+    Load the durations recorded by a reporter, e.g., a :class:`.DoitInterfaceReporter` whose
+    :attr:`~.DoitInterfaceReporter.DURATIONS_PATH` is set.
+
+    Args:
+        reporter: Reporter class or instance.
+
+    Returns:
+        durations: Most recent duration of each task in seconds keyed by task name or an empty
+            dictionary if the reporter does not record durations.
+    """
+    path = getattr(reporter, "DURATIONS_PATH", None)
+    return load(path) if path else {}
+
+
+def save(durations: Mapping[str, float], path: str = DEFAULT_PATH) -> None:
+    """
+    Record task durations, replacing previously recorded durations of the same tasks.
+
+    Args:
+        durations: Duration of each task in seconds keyed by task name.
+        path: Path of the database.
+    """
+    with contextlib.closing(sqlite3.connect(path, timeout=60)) as connection, connection:
+        connection.execute("CREATE TABLE IF NOT EXISTS durations (name TEXT PRIMARY KEY, "
+                           "duration REAL NOT NULL)")
+        connection.executemany("INSERT OR REPLACE INTO durations VALUES (?, ?)",
+                               durations.items())
+
+
+def critical_path(tasks: Mapping, durations: Mapping[str, float]) -> dict[str, float]:
+    """
+    Compute the length of the longest chain of tasks starting at each task, i.e., the time
+    required to complete the task and all tasks that depend on it with unlimited parallelism.
+
+    Tasks without actions take no time, and tasks without a recorded duration are assumed to take
+    the mean recorded duration (or one second if no durations have been recorded).
+
+    Args:
+        tasks: :code:`doit.task.Task` objects keyed by name.
+        durations: Recorded duration of tasks in seconds keyed by task name.
+
+    Returns:
+        lengths: Length of the critical path starting at each task keyed by task name.
+
+    Example:
+
+        >>> from doit.task import Task
+        >>> from doit_interface.durations import critical_path
+        >>> tasks = [Task("a", ["true"]), Task("b", ["true"], task_dep=["a"]), Task("c", ["true"])]
+        >>> critical_path({task.name: task for task in tasks}, {"a": 2, "b": 3})
+        {'a': 5.0, 'b': 3.0, 'c': 2.5}
+    """
+    known = [durations[name] for name in tasks if name in durations]
+    default = sum(known) / len(known) if known else 1.0
+    own = {name: float(durations.get(name, default)) if task.actions else 0.0
+           for name, task in tasks.items()}
+
+    # Count the number of tasks depending on each task and process tasks in reverse topological
+    # order, starting with tasks no other task depends on.
+    num_dependents = collections.Counter()
+    for task in tasks.values():
+        for dep in set(task.task_dep) | set(task.setup_tasks):
+            num_dependents[dep] += 1
+    lengths = dict(own)
+    queue = collections.deque(name for name in tasks if not num_dependents[name])
+    while queue:
+        task = tasks[queue.popleft()]
+        for dep in set(task.task_dep) | set(task.setup_tasks):
+            if dep not in tasks:
+                continue
+            lengths[dep] = max(lengths[dep], own[dep] + lengths[task.name])
+            num_dependents[dep] -= 1
+            if not num_dependents[dep]:
+                queue.append(dep)
+    return lengths
@@ -0,0 +1,132 @@
+"""
+On-disk cache of declared tasks so the declaration code does not need to be executed if neither
+the code nor its inputs have changed.
+"""
+from __future__ import annotations
+import glob
+import os
+import pickle
+import sys
+from typing import Iterable
+from .util import hash_file
+
+
+# Increment the version if the format of the cache changes.
+CACHE_VERSION = 1
+
+
+def find_local_modules(root: str) -> list[str]:
+    """
+    Find the source files of imported modules that reside in a directory but not in installed
+    packages, e.g., helper modules imported by a :code:`dodo.py` file.
+
+    Args:
+        root: Directory to search for imported modules.
+
+    Returns:
+        filenames: Absolute paths of the source files.
+    """
+    root = os.path.join(os.path.abspath(root), "")
+    filenames = set()
+    for module in list(sys.modules.values()):
+        if not (filename := getattr(module, "__file__", None)):
+            continue
+        filename = os.path.abspath(filename)
+        if filename.startswith(root) and "site-packages" not in filename \
+                and "dist-packages" not in filename and os.path.isfile(filename):
+            filenames.add(filename)
+    return sorted(filenames)
+
+
+def stat_inputs(patterns: Iterable[str]) -> dict[str, list]:
+    """
+    Get the size and modification time of all files matching glob patterns.
+
+    Args:
+        patterns: Glob patterns, supporting :code:`**` for recursive matching.
+
+    Returns:
+        inputs: Sorted list of tuples of filename, size, and modification time in nanoseconds
+            keyed by pattern.
+    """
+    inputs = {}
+    for pattern in patterns:
+        matches = []
+        for filename in sorted(glob.glob(pattern, recursive=True)):
+            stat = os.stat(filename)
+            matches.append((filename, stat.st_size, stat.st_mtime_ns))
+        inputs[pattern] = matches
+    return inputs
+
+
+def fingerprint(filenames: Iterable[str], inputs: Iterable[str]) -> dict:
+    """
+    Compute a fingerprint of the code and inputs used to declare tasks.
+
+    Args:
+        filenames: Source files whose contents affect the declared tasks.
+        inputs: Glob patterns of input files whose presence, size, or modification time affect
+            the declared tasks.
+
+    Returns:
+        fingerprint: Digests of source files and statistics of input files.
+    """
+    return {
+        "version": CACHE_VERSION,
+        "python": list(sys.version_info[:2]),
+        "files": {filename: hash_file(filename) for filename in filenames},
+        "inputs": stat_inputs(inputs),
+    }
+
+
+def load(path: str, filename: str, inputs: Iterable[str]) -> list[dict]:
+    """
+    Load cached tasks if the cache is valid.
+
+    Args:
+        path: Path of the cache file.
+        filename: Source file containing the declaration code.
+        inputs: Glob patterns of input files.
+
+    Returns:
+        tasks: Cached tasks or :code:`None` if the cache does not exist or is stale.
+    """
+    filename = os.path.abspath(filename)
+    try:
+        with open(path, "rb") as fp:
+            cached = pickle.load(fp)
+        expected = cached["fingerprint"]
+        if filename not in expected["files"] or sorted(expected["inputs"]) != sorted(inputs):
+            return None
+        if fingerprint(expected["files"], inputs) != expected:
+            return None
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError, AttributeError,
+            ImportError):
+        return None
+    return cached["tasks"]
+
+
+def save(path: str, tasks: list[dict], filename: str, inputs: Iterable[str]) -> None:
+    """
+    Save tasks to the cache together with a fingerprint of their declaration code and inputs.
+
+    Args:
+        path: Path of the cache file.
+        tasks: Tasks to cache.
+        filename: Source file containing the declaration code.
+        inputs: Glob patterns of input files.
+    """
+    filenames = {os.path.abspath(filename)}
+    filenames.update(find_local_modules(os.path.dirname(filename)))
+    # The cache is only valid for the same version of this package.
+    filenames.update(map(os.path.abspath, glob.glob(os.path.join(os.path.dirname(__file__),
+                                                                 "*.py"))))
+    data = pickle.dumps({
+        "fingerprint": fingerprint(sorted(filenames), inputs),
+        "tasks": tasks,
+    })
+    # Write to a temporary file first so concurrent readers never see a partial cache.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fp:
+        fp.write(data)
+    os.replace(tmp, path)
@@ -1,21 +1,61 @@
 from __future__ import annotations
-from doit.cmd_base import NamespaceTaskLoader
-from doit.doit_cmd import DoitMain
 import inspect
+import itertools
+import os
+import pickle
+import shlex
+import sys
+import time
+import traceback
+import warnings
+from typing import Callable, Iterable, NamedTuple, Optional, TYPE_CHECKING
 from . import contexts
-from .config import DOIT_CONFIG as _DEFAULT_DOIT_CONFIG
-from .util import NoTasksError
+from .records import TaskRecord
+from .util import DeclarationLocation, dict2args, normalize_task_name, NoTasksError
+
+if TYPE_CHECKING:  # pragma: no cover
+    from doit.doit_cmd import DoitMain
 
 
 class Manager:
     """
     Task manager.
 
+    Tasks may declare the resources they require, e.g., :code:`resources={"cpu": 8, "mem_gb": 30}`.
+    Resources are moved to the task :code:`meta` information because doit does not accept
+    additional task attributes, and the :code:`run` command used by :meth:`run` only executes tasks
+    in parallel if their resources fit within a budget (see :class:`.runners.Run` for details).
+    Targets are indexed as tasks are declared so a target declared by two tasks raises an error
+    immediately rather than when doit loads the tasks (see :meth:`validate`). Tasks are also
+    indexed by name so :meth:`run` only hands the tasks requested on the command line and the
+    tasks they transitively depend on to doit, and the time to load tasks for a targeted build
+    scales with the size of its subgraph rather than the number of declared tasks.
+
     Args:
         context_stack: Stack of context managers that will be applied to all associated tasks.
+        provenance: How to record where tasks were declared (see :attr:`PROVENANCE_MODES`).
+        compact: Store declared tasks as :class:`.TaskRecord` instances rather than dictionaries
+            to reduce the memory usage of very many tasks. Records are converted to dictionaries
+            when tasks are handed to doit.
 
     Attributes:
         context_stack: Stack of context managers that will be applied to all associated tasks.
+        provenance: How to record where tasks were declared (see :attr:`PROVENANCE_MODES`).
+        compact: Whether declared tasks are stored as :class:`.TaskRecord` instances.
+        frozen: Whether the manager has been frozen using :meth:`freeze`.
+        PROVENANCE_MODES: Supported modes for recording where tasks were declared.
+
+            - :code:`none`: Do not record declaration locations.
+            - :code:`lazy`: Record a :class:`.DeclarationLocation` as :code:`declared_at` in the
+              task :code:`meta` information. The location is shared by all tasks declared on the
+              same line and only resolved when required, e.g., to report a failure. Tasks declared
+              without :code:`meta` information on the same line also share the same :code:`meta`
+              dictionary.
+            - :code:`location`: Record the :code:`filename` and :code:`lineno` in the task
+              :code:`meta` information (default).
+            - :code:`stack`: Record the :code:`filename` and :code:`lineno` as well as the full
+              call stack as :code:`stack` in the task :code:`meta` information, e.g., for
+              debugging.
 
     Example:
         Get the default manager and create a single task.
@@ -28,33 +68,606 @@ class Manager:
     """
     _DEFAULT_MANAGER: Manager = None
     _CURRENT_MANAGER: Manager = None
+    PROVENANCE_MODES = ("none", "lazy", "location", "stack")
 
-    def __init__(self, context_stack: list["contexts._BaseContext"] = None) -> None:
+    def __init__(self, context_stack: list["contexts._BaseContext"] = None,
+                 provenance: str = "location", compact: bool = False) -> None:
         # We assign this attribute late because doit will otherwise try to discover tasks at the
         # class level.
         self.create_doit_tasks = self._create_doit_tasks
 
+        if provenance not in self.PROVENANCE_MODES:
+            raise ValueError(f"provenance mode must be one of {self.PROVENANCE_MODES} but got "
+                             f"{provenance}")
         self.tasks = []
         self.context_stack = context_stack or []
+        self.provenance = provenance
+        self.compact = compact
+        # Compiled context stack and the identities of the contexts it was compiled from.
+        self._pipeline = []
+        self._pipeline_contexts = ()
+        self._pipeline_ids = ()
+        # Shared `meta` information keyed by code object and line number for lazy provenance.
+        self._shared_meta = {}
+        # Factories registered using `lazy` and whether tasks of a frozen manager were consumed.
+        self._lazy_tasks: list[_LazyTasks] = []
+        self.frozen = False
+        self._consumed = False
+        # Index of tasks keyed by their targets and positions of tasks keyed by name and basename.
+        self._targets: dict[str, dict] = {}
+        self._positions: dict[str, list[int]] = {}
+        # Groups keyed by the name of the declared task, which may be a copy of the group, e.g.,
+        # within `defaults`.
+        self._groups: dict[str, contexts.group_tasks] = {}
 
     def __call__(self, task=None, **kwargs: dict) -> dict:
-        task = task or kwargs
-        for context in reversed(self.context_stack):
+        return self._declare(task or kwargs, self._get_pipeline(), sys._getframe(1))
+
+    def _declare(self, task: dict, pipeline: list[Callable], frame) -> dict:
+        """
+        Apply a compiled context stack to a task, record its provenance, and add it.
+        """
+        self._check_not_frozen()
+        # Groups acquire task dependencies as members are declared so they are never compacted.
+        group = task if isinstance(task, contexts.group_tasks) else None
+        compact = self.compact and group is None
+        task = self._apply_pipeline(task, pipeline)
+        if "resources" in task:
+            self._move_resources(task)
+        # Store where this task was declared.
+        self._record_provenance(task, frame)
+        if not task.get("basename"):
+            raise ValueError(f"task declared at {frame.f_code.co_filename}:{frame.f_lineno} is "
+                             "missing a basename")
+        if compact:
+            task = TaskRecord(task)
+        # Check for duplicate targets before the task is recorded by the manager or contexts.
+        self._index_targets(task, self._targets)
+        if group is not None:
+            self._groups[normalize_task_name(task)] = group
+        self._index_positions(task, len(self.tasks), self._positions)
+        self.tasks.append(task)
+        self._notify_declared(task, pipeline)
+        return task
+
+    @staticmethod
+    def _index_targets(task: dict, index: dict[str, dict]) -> None:
+        """
+        Add the targets of a task to an index of tasks keyed by target. The index is not modified
+        if a target is already a target of another task.
+        """
+        targets = [os.fspath(target) for target in task.get("targets") or ()]
+        for target in targets:
+            if (other := index.get(target, task)) is not task:
+                raise ValueError(f"target `{target}` of {_describe_task(task)} is already a "
+                                 f"target of {_describe_task(other)}")
+        index.update(dict.fromkeys(targets, task))
+
+    def _rebuild_indices(self) -> None:
+        """
+        Rebuild the indices of targets and task positions in case tasks were modified after they
+        were declared. The indices are not modified if two tasks share a target.
+        """
+        targets = {}
+        positions = {}
+        for position, task in enumerate(self.tasks):
+            if task is not None:
+                self._index_targets(task, targets)
+                self._index_positions(task, position, positions)
+        self._targets = targets
+        self._positions = positions
+
+    @staticmethod
+    def _notify_declared(task: dict, pipeline: list[Callable]) -> None:
+        """
+        Notify the contexts of a compiled context stack that a task was declared.
+        """
+        for context in pipeline:
+            if isinstance(context, contexts._BaseContext):
+                context._declared(task)
+
+    @staticmethod
+    def _index_positions(task: dict, position: int, index: dict[str, list[int]]) -> None:
+        """
+        Add the position of a task to an index of positions keyed by task name and, for subtasks,
+        the basename of their group.
+        """
+        index.setdefault(normalize_task_name(task), []).append(position)
+        if task.get("name"):
+            index.setdefault(task["basename"], []).append(position)
+
+    @staticmethod
+    def _apply_pipeline(task: dict, pipeline: list[Callable]) -> dict:
+        for context in pipeline:
             task = context(task)
             if task is None:
                 raise ValueError(f"{context} context did not return a task but `None`")
-        # Store where this task was declared.
+        return task
+
+    @staticmethod
+    def _move_resources(task: dict) -> None:
+        """
+        Move the resources required by a task to its :code:`meta` information.
+        """
+        resources = task.pop("resources")
+        if not isinstance(resources, dict):
+            raise TypeError(f"resources must be a dictionary but got {resources}")
+        # Copy the meta information because it may be shared with other tasks.
+        task["meta"] = {**(task.get("meta") or {}), "resources": resources}
+
+    def lazy(self, factory: Callable[[], Iterable[dict]]) -> None:
+        """
+        Register a factory that creates tasks only when doit loads them.
+
+        Tasks returned by the factory are transformed by the contexts that are active when the
+        factory is registered, but they are neither transformed nor stored until doit iterates
+        over the tasks of the manager. This reduces the peak memory usage for very large numbers of
+        tasks because expanded tasks are handed to doit one at a time without copies. The factory
+        is called each time tasks are loaded and must return task dictionaries rather than declare
+        tasks using the manager.
+
+        Args:
+            factory: Callable returning an iterable of tasks, e.g., a generator function.
+
+        Example:
+
+            >>> def create_tasks():
+            ...     for i in range(3):
+            ...         yield {"basename": "lazy", "name": str(i), "actions": ["true"]}
+            >>> manager.lazy(create_tasks)
+            >>> [task["name"] for task in manager.create_doit_tasks() if task["basename"] == "lazy"]
+            ['0', '1', '2']
+        """
+        self._check_not_frozen()
+        for context in self.context_stack:
+            if isinstance(context, contexts._BaseContext):
+                context._register_lazy()
+        # Record provenance for the location at which the factory was registered.
+        template = {}
+        self._record_provenance(template, sys._getframe(1))
+        self._lazy_tasks.append(_LazyTasks(
+            len(self.tasks), factory, self._get_pipeline(), template.get("meta"),
+        ))
+
+    def _expand_lazy(self, lazy: _LazyTasks) -> Iterable[dict]:
+        """
+        Expand the tasks of a factory registered using :meth:`lazy`.
+        """
+        for task in lazy.factory():
+            task = self._apply_pipeline(task, lazy.pipeline)
+            if "resources" in task:
+                self._move_resources(task)
+            if lazy.meta is not None:
+                if (meta := task.get("meta")) is None:
+                    # Lazy provenance shares meta information for all tasks of the factory.
+                    task["meta"] = lazy.meta if self.provenance == "lazy" else dict(lazy.meta)
+                else:
+                    meta.update(lazy.meta)
+            if not task.get("basename"):
+                raise ValueError(f"task created by {lazy.factory} is missing a basename")
+            self._notify_declared(task, lazy.pipeline)
+            yield task
+
+    def declare_cached(self, declare: Callable[[], None], path: str,
+                       inputs: Iterable[str] = None) -> list[dict]:
+        """
+        Declare tasks by calling `declare` or load them from an on-disk cache if neither the
+        declaration code nor its inputs have changed.
+
+        The cache stores the tasks declared by `declare` after all contexts have been applied.
+        It is invalidated if the file containing `declare`, any local module imported from the
+        same directory, or this package change, or if the files matching the `inputs` glob
+        patterns are added, removed, or modified. Tasks loaded from the cache are added to
+        :class:`.group_tasks` that are active but are not transformed by any other contexts
+        because they have already been applied. Tasks must be picklable to be cached; a warning
+        is issued otherwise, and the tasks are declared as usual.
+
+        Args:
+            declare: Callable that declares tasks using this manager.
+            path: Path of the cache file.
+            inputs: Glob patterns of input files that affect which tasks are declared, e.g.,
+                datasets that are scanned by `declare`.
+
+        Returns:
+            tasks: Tasks that were declared or loaded from the cache.
+        """
+        from . import graph_cache
+
+        self._check_not_frozen()
+        inputs = list(inputs or [])
+        filename = getattr(getattr(declare, "__code__", None), "co_filename", None) \
+            or inspect.getfile(declare)
+        groups = [context for context in reversed(self.context_stack)
+                  if isinstance(context, contexts.group_tasks)]
+
+        if (tasks := graph_cache.load(path, filename, inputs)) is not None:
+            for position, task in enumerate(tasks, len(self.tasks)):
+                if self.compact:
+                    task = tasks[position - len(self.tasks)] = TaskRecord(task)
+                self._index_targets(task, self._targets)
+                self._index_positions(task, position, self._positions)
+                for group in groups:
+                    group._declared(task)
+            self.tasks.extend(tasks)
+            return tasks
+
+        num_tasks = len(self.tasks)
+        num_lazy = len(self._lazy_tasks)
+        declare()
+        tasks = self.tasks[num_tasks:]
+        # Lazily declared tasks need to be expanded so they can be cached.
+        cached = [dict(task) for task in tasks]
+        cached.extend(task for lazy in self._lazy_tasks[num_lazy:]
+                      for task in self._expand_lazy(lazy))
+        try:
+            graph_cache.save(path, cached, filename, inputs)
+        except (pickle.PicklingError, AttributeError, TypeError) as ex:
+            warnings.warn(f"tasks declared by {declare} could not be cached: {ex}")
+        return tasks
+
+    def validate(self, infer_task_dep: bool = False) -> None:
+        """
+        Check that no two tasks share a target and that dependencies between tasks are acyclic.
+
+        The indices of targets and task names are rebuilt in case tasks were modified after they
+        were declared. Task dependencies, setup tasks, and file dependencies that are targets of
+        other tasks form the dependency graph whose cycles are detected by a depth-first search in
+        time linear in the size of the graph. Dependencies on tasks not declared by this manager
+        are ignored, and tasks created by factories registered using :meth:`lazy` are not
+        validated.
+
+        Args:
+            infer_task_dep: Add task dependencies on the tasks that create file dependencies,
+                linking plain paths to the tasks that produce them before doit loads the tasks.
+
+        Example:
+
+            >>> other = Manager()
+            >>> _ = other(basename="a", file_dep=["b.txt"], targets=["a.txt"])
+            >>> _ = other(basename="b", file_dep=["a.txt"], targets=["b.txt"])
+            >>> other.validate()
+            Traceback (most recent call last):
+            ...
+            ValueError: cyclic dependency: a -> b -> a
+        """
+        tasks = [task for task in self.tasks if task is not None]
+        self._rebuild_indices()
+        targets = self._targets
+
+        # Build the graph of task names, including groups of subtasks with the same basename.
+        graph = {}
+        producers = {}
+        for task in tasks:
+            name = normalize_task_name(task)
+            # Wildcard task dependencies are expanded by doit and cannot be resolved here.
+            deps = [dep for key in ["task_dep", "setup"]
+                    for dep in map(normalize_task_name, task.get(key) or ()) if "*" not in dep]
+            producers[name] = [normalize_task_name(targets[dep]) for dep in map(
+                os.fspath, task.get("file_dep") or ()) if dep in targets]
+            graph.setdefault(name, []).extend(deps + producers[name])
+            if task.get("name"):
+                graph.setdefault(task["basename"], []).append(name)
+
+        # Iterative depth-first search tracking the nodes on the current path.
+        visited = set()
+        for root in graph:
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(graph[root]))]
+            on_path = {root}
+            while stack:
+                node, children = stack[-1]
+                for child in children:
+                    if child in on_path:
+                        path = [node for node, _ in stack]
+                        cycle = path[path.index(child):] + [child]
+                        raise ValueError(f"cyclic dependency: {' -> '.join(cycle)}")
+                    if child in graph and child not in visited:
+                        visited.add(child)
+                        on_path.add(child)
+                        stack.append((child, iter(graph[child])))
+                        break
+                else:
+                    on_path.discard(node)
+                    stack.pop()
+
+        if infer_task_dep:
+            for task in tasks:
+                task_dep = task.get("task_dep") or []
+                existing = {normalize_task_name(dep) for dep in task_dep}
+                if inferred := [dep for dep in dict.fromkeys(producers[normalize_task_name(task)])
+                                if dep not in existing]:
+                    # Create a new list because the dependencies may be shared with other tasks.
+                    task["task_dep"] = [*task_dep, *inferred]
+
+    def publish(self, path: str, tasks: Iterable[str] = None, reporter=None, **kwargs) -> int:
+        """
+        Publish tasks and the tasks they depend on to a :class:`.WorkQueue` so they can be
+        executed by any number of workers on this and other hosts sharing the filesystem (see
+        :meth:`work`).
+
+        Tasks are loaded as doit loads them, including dependencies on tasks that create file
+        dependencies, and they are prioritized by the length of the critical path starting at
+        each task based on durations recorded by the `reporter`. Publishing replaces the tasks in
+        the queue.
+
+        Args:
+            path: Path of the queue database.
+            tasks: Names of tasks to publish (defaults to all tasks).
+            reporter: Reporter class whose recorded durations are used to prioritize tasks
+                (defaults to the :class:`.DoitInterfaceReporter`, see
+                :attr:`~.DoitInterfaceReporter.DURATIONS_PATH`).
+            **kwargs: Keyword arguments passed to :class:`.WorkQueue`.
+
+        Returns:
+            num_tasks: Number of published tasks.
+        """
+        from doit.control import TaskControl
+        from doit.loader import load_tasks
+        from . import durations
+        from .reporters import DoitInterfaceReporter
+        from .workqueue import WorkQueue
+
+        reporter = reporter or DoitInterfaceReporter
+        control = TaskControl(load_tasks({"manager": self}, allow_delayed=False))
+        selected = set()
+        stack = list(control.tasks if tasks is None else tasks)
+        while stack:
+            if (name := stack.pop()) in selected:
+                continue
+            if (task := control.tasks.get(name)) is None:
+                raise ValueError(f"task `{name}` does not exist")
+            selected.add(name)
+            stack.extend(task.task_dep)
+            stack.extend(task.setup_tasks)
+
+        graph = {name: [*task.task_dep, *task.setup_tasks] for name, task in control.tasks.items()
+                 if name in selected}
+        priority = durations.critical_path({name: control.tasks[name] for name in graph},
+                                           durations.load_recorded(reporter))
+        WorkQueue(path, **kwargs).publish(graph, priority)
+        return len(graph)
+
+    def work(self, path: str, args: list[str] = None, poll_interval: float = 1.0,
+             worker: str = None, lease: float = 300, **kwargs) -> int:
+        """
+        Execute tasks claimed from a :class:`.WorkQueue` populated by :meth:`publish` until all
+        tasks have completed or depend on failed tasks.
+
+        Each claimed task is executed by :meth:`run` without its task dependencies (using
+        :code:`--single`) because they have already been executed by a worker. Workers use doit's
+        :code:`sqlite3` backend for the dependency database so they can update it concurrently,
+        and the database is stored next to the queue unless :code:`--db-file` is given in
+        `args`. Tasks claimed by a worker that is interrupted are returned to the queue. The worker
+        renews its lease on the claimed task in a background thread so tasks claimed by a worker
+        that is killed, e.g., because it ran out of memory or its host was lost, are returned to
+        the queue once the lease expires.
+
+        Args:
+            path: Path of the queue database.
+            args: Command line arguments for :meth:`run`, e.g., to select a reporter.
+            poll_interval: Time in seconds to wait before trying to claim a task again if no task
+                is ready.
+            worker: Identifier of the worker (defaults to the host name and process identifier).
+            lease: Time in seconds after which tasks claimed by workers that stopped renewing
+                their lease are returned to the queue (see :class:`.WorkQueue`).
+            **kwargs: Keyword arguments passed to :meth:`run`.
+
+        Returns:
+            status: Zero if all tasks in the queue completed successfully and one otherwise.
+
+        Example:
+
+            .. code-block:: python
+
+                # Publish the tasks on one host and execute them on each host.
+                manager.publish("/shared/queue.sqlite")
+                manager.work("/shared/queue.sqlite")
+        """
+        from .workqueue import default_worker_id, WorkQueue
+
+        queue = WorkQueue(path, lease=lease)
+        worker = worker or default_worker_id()
+        args = ["--backend=sqlite3", f"--db-file={path}.doit", *(args or [])]
+        while True:
+            if (name := queue.claim(worker)) is not None:
+                try:
+                    with queue.keep_alive(name, worker):
+                        returncode = self.run([*args, "--single", name], **kwargs)
+                except BaseException:
+                    queue.requeue(worker)
+                    raise
+                queue.complete(name, returncode)
+            elif queue.is_finished():
+                return int(any(status != "done" for status in queue.counts()))
+            else:
+                time.sleep(poll_interval)
+
+    def watch(self, args: list[str] = None, debounce: float = 0.1, max_runs: int = None,
+              **kwargs) -> int:
+        """
+        Run tasks and re-execute the tasks affected by changes to their file dependencies until
+        interrupted, akin to :code:`doit auto` but without polling or re-declaring tasks.
+
+        File dependencies that are not targets of other tasks are watched using Linux inotify.
+        Changes are debounced, and the tasks depending on the changed files are passed to
+        :meth:`run` together with the tasks that depend on them, either by task dependencies or
+        by file dependencies on their targets. Tasks are declared once so changes to the
+        declarations themselves require restarting the watch.
+
+        Args:
+            args: Command line arguments for :meth:`run` except task names, e.g., to select a
+                reporter.
+            debounce: Time in seconds without changes before affected tasks are re-executed.
+            max_runs: Maximum number of re-executions (defaults to watching until interrupted).
+            **kwargs: Keyword arguments passed to :meth:`run`.
+
+        Returns:
+            status: Status code of the last run.
+
+        Example:
+
+            .. code-block:: python
+
+                # Rebuild figures whenever a notebook or dataset changes.
+                manager.watch(["--verbosity=2"])
+        """
+        from .watch import DependencyIndex, Inotify
+
+        if self.frozen:
+            raise RuntimeError("tasks of a frozen manager can only be loaded once and cannot be "
+                               "watched")
+        args = list(args or [])
+        index = DependencyIndex(self._create_doit_tasks())
+        # Start watching before the first run so changes while it executes are not missed.
+        with Inotify(index.sources) as inotify:
+            status = self.run(args, **kwargs)
+            runs = 0
+            while max_runs is None or runs < max_runs:
+                if names := index.affected(inotify.wait(debounce)):
+                    status = self.run([*args, *names], **kwargs)
+                    runs += 1
+        return status
+
+    def freeze(self) -> Manager:
+        """
+        Freeze the manager so no more tasks can be declared.
+
+        Tasks of a frozen manager are handed to doit without defensive copies and released by
+        the manager as they are loaded. Tasks can thus only be loaded once, e.g., by a single call
+        to :meth:`run`.
+
+        Returns:
+            manager: The frozen manager.
+        """
+        self.frozen = True
+        return self
+
+    def _check_not_frozen(self) -> None:
+        if self.frozen:
+            raise RuntimeError("tasks cannot be declared because the manager is frozen")
+
+    def sweep(self, basename: str, params: dict[str, Iterable],
+              template: Callable[..., dict] = None, *, name: Callable[..., str] = None,
+              append_args: bool = True, **kwargs) -> list[dict]:
+        """
+        Declare one task for each point in the Cartesian product of parameter values.
+
+        The context stack is compiled once for the whole sweep, and the declaration location is
+        shared by all tasks of the sweep, which makes sweeps considerably faster than declaring
+        tasks in nested loops.
+
+        Args:
+            basename: Basename shared by all tasks of the sweep.
+            params: Sequences of parameter values keyed by parameter name.
+            template: Callable that receives the parameter values of a point as keyword arguments
+                and returns task properties specific to that point, e.g., targets.
+            name: Callable that receives the parameter values of a point as keyword arguments and
+                returns the name of the task (defaults to joining :code:`{key}-{value}` pairs with
+                underscores).
+            append_args: Append named command line arguments for the parameter values of each
+                point (see :func:`.dict2args`) to actions given as strings or lists in `kwargs`.
+            **kwargs: Task properties shared by all tasks of the sweep.
+
+        Returns:
+            tasks: Tasks declared for each point of the sweep.
+
+        Example:
+
+            >>> manager.sweep("train", {"seed": [0, 1], "lr": [0.1]}, actions=[["$!", "train.py"]],
+            ...               template=lambda seed, lr: {"targets": [f"model-{seed}-{lr}.pt"]})
+            [{'basename': 'train', 'actions': [['$!', 'train.py', '--seed=0', '--lr=0.1']],
+              'name': 'seed-0_lr-0.1', 'targets': ['model-0-0.1.pt'], ...},
+             {'basename': 'train', 'actions': [['$!', 'train.py', '--seed=1', '--lr=0.1']],
+              'name': 'seed-1_lr-0.1', 'targets': ['model-1-0.1.pt'], ...}]
+        """
+        self._check_not_frozen()
+        pipeline = self._get_pipeline()
+        frame = sys._getframe(1)
+        actions = kwargs.pop("actions", None)
+        keys = list(params)
+        # Format arguments and names for each parameter value once rather than for each point.
+        columns = [[(value, dict2args({key: value})[0], f"{key}-{value}") for value in values]
+                   for key, values in params.items()]
+        tasks = []
+        for entries in itertools.product(*columns):
+            values, args, parts = zip(*entries) if entries else ((), (), ())
+            point = dict(zip(keys, values))
+            task = {"basename": basename, **kwargs}
+            if actions is not None:
+                task["actions"] = self._sweep_actions(actions, list(args)) if append_args else \
+                    list(actions)
+            if name:
+                task["name"] = name(**point)
+            elif parts:
+                task["name"] = "_".join(parts)
+            if template:
+                task.update(template(**point))
+            tasks.append(self._declare(task, pipeline, frame))
+        return tasks
+
+    @staticmethod
+    def _sweep_actions(actions: list, args: list[str]) -> list:
+        """
+        Append named command line arguments for a point of a sweep to string and list actions.
+        """
+        transformed = []
+        for action in actions:
+            if isinstance(action, str):
+                action = " ".join([action, *map(shlex.quote, args)])
+            elif isinstance(action, list):
+                action = action + args
+            transformed.append(action)
+        return transformed
+
+    def _get_pipeline(self) -> list[Callable]:
+        """
+        Get the compiled context stack, recompiling it if contexts were added or removed.
+        """
+        # We keep references to the contexts so their identities cannot be reused.
+        if tuple(map(id, self.context_stack)) != self._pipeline_ids:
+            self._pipeline_contexts = tuple(self.context_stack)
+            self._pipeline_ids = tuple(map(id, self._pipeline_contexts))
+            self._pipeline = self._compile_context_stack()
+        return self._pipeline
+
+    def _compile_context_stack(self) -> list[Callable]:
+        """
+        Compile the context stack to a sequence of transforms in the order they are applied to
+        tasks, merging adjacent contexts where possible.
+        """
+        pipeline = []
+        for context in reversed(self.context_stack):
+            if pipeline and isinstance(pipeline[-1], contexts._BaseContext) \
+                    and (merged := pipeline[-1]._merge(context)) is not None:
+                pipeline[-1] = merged
+            else:
+                pipeline.append(context)
+        return pipeline
+
+    def _record_provenance(self, task: dict, frame) -> None:
+        """
+        Record where a task was declared according to the :attr:`provenance` mode.
+        """
+        if self.provenance == "none":
+            return
+        if self.provenance == "lazy":
+            key = (frame.f_code, frame.f_lineno)
+            if (shared := self._shared_meta.get(key)) is None:
+                shared = self._shared_meta[key] = {"declared_at": DeclarationLocation(*key)}
+            if (meta := task.get("meta")) is None:
+                task["meta"] = shared
+            else:
+                meta["declared_at"] = shared["declared_at"]
+            return
         meta = task.setdefault("meta", {})
-        parent = inspect.currentframe().f_back
         meta.update({
-            "filename": parent.f_code.co_filename,
-            "lineno": parent.f_lineno,
+            "filename": frame.f_code.co_filename,
+            "lineno": frame.f_lineno,
         })
-        if not task.get("basename"):
-            raise ValueError(
-                "task declared at {filename}:{lineno} is missing a basename".format(**meta))
-        self.tasks.append(task)
-        return task
+        if self.provenance == "stack":
+            meta["stack"] = traceback.extract_stack(frame)
 
     def __enter__(self) -> Manager:
         if (other := self.__class__._CURRENT_MANAGER):
@@ -67,11 +680,112 @@ class Manager:
             raise RuntimeError(f"manager state is corrupted: another manager {other} is active")
         self.__class__._CURRENT_MANAGER = None
 
-    def _create_doit_tasks(self):
-        if not self.tasks:
+    def _create_doit_tasks(self, selected: Iterable[str] = None):
+        # Create doit tasks, optionally only the `selected` tasks, given by name or target, and
+        # their transitive task dependencies, setup tasks, calculated dependencies, and the tasks
+        # that create their file dependencies. All tasks are created if a task cannot be resolved
+        # using the index of declared tasks, e.g., because it is created by a factory registered
+        # using `lazy` or selected by a wildcard, so doit can resolve it. This is a comment rather
+        # than a docstring because doit uses the docstring of the task creator as the default
+        # documentation of all tasks.
+        if self._consumed:
+            raise RuntimeError("tasks of the frozen manager have already been loaded")
+        if not self.tasks and not self._lazy_tasks:
             raise NoTasksError("task manager must have at least one task")
-        for task in self.tasks:
-            yield dict(task)
+        positions = None if selected is None else self._select_positions(selected)
+        tasks = self.tasks
+        lazy_tasks = self._lazy_tasks
+        if self.frozen:
+            # Release the tasks so they can be garbage collected once doit has processed them.
+            self.tasks = []
+            self._lazy_tasks = []
+            self._consumed = True
+
+        if positions is not None:
+            for i in positions:
+                task = tasks[i]
+                if self.frozen:
+                    tasks[i] = None
+                yield from self._to_doit_tasks(task)
+            return
+
+        # Groups may acquire members while lazy tasks are expanded so we yield them last.
+        deferred = []
+        lazy_groups = {id(context) for lazy in lazy_tasks for context in lazy.pipeline
+                       if isinstance(context, contexts.group_tasks)}
+        deferred_names = {name for name, group in self._groups.items()
+                          if id(group) in lazy_groups}
+        lazy_iter = iter(lazy_tasks)
+        lazy = next(lazy_iter, None)
+        for i in range(len(tasks) + 1):
+            while lazy is not None and lazy.position == i:
+                yield from self._expand_lazy(lazy)
+                lazy = next(lazy_iter, None)
+            if i == len(tasks):
+                break
+            task = tasks[i]
+            if self.frozen:
+                tasks[i] = None
+            if deferred_names and normalize_task_name(task) in deferred_names:
+                deferred.append(task)
+            else:
+                yield from self._to_doit_tasks(task)
+        for task in deferred:
+            yield from self._to_doit_tasks(task)
+
+    def _to_doit_tasks(self, task: dict) -> Iterable[dict]:
+        """
+        Convert a declared task to the dictionaries handed to doit, copying it unless the manager
+        is frozen. Groups are preceded by the tasks aggregating their members (see
+        :class:`.group_tasks`).
+        """
+        if self._groups and (group := self._groups.get(normalize_task_name(task))) is not None:
+            return group._fan_in(task)
+        if isinstance(task, TaskRecord):
+            return [task.to_dict()]
+        return [task if self.frozen else dict(task)]
+
+    def _select_positions(self, selected: Iterable[str]) -> Optional[list[int]]:
+        """
+        Get the sorted positions of the selected tasks and the tasks they transitively depend on
+        or `None` if a task cannot be resolved using the index of declared tasks.
+
+        The indices are rebuilt first because targets and dependencies may have been modified
+        after tasks were declared. Rebuilding them is much faster than creating all doit tasks.
+        """
+        if self._lazy_tasks:
+            return None
+        try:
+            self._rebuild_indices()
+        except ValueError:
+            # Let doit report tasks sharing a target.
+            return None
+        positions = set()
+        visited = set()
+        stack = list(selected)
+        while stack:
+            if (name := stack.pop()) in visited:
+                continue
+            visited.add(name)
+            if (found := self._positions.get(name)) is None:
+                if (producer := self._targets.get(name)) is None:
+                    return None
+                found = self._positions[normalize_task_name(producer)]
+            for position in found:
+                if position in positions:
+                    continue
+                positions.add(position)
+                task = self.tasks[position]
+                for key in ["task_dep", "setup", "calc_dep"]:
+                    stack.extend(map(normalize_task_name, task.get(key) or ()))
+                stack.extend(normalize_task_name(self._targets[dep]) for dep in
+                             map(os.fspath, task.get("file_dep") or ()) if dep in self._targets)
+                # Values computed by other tasks and results of other tasks used as up-to-date
+                # checks, e.g., by `doit.tools.result_dep`.
+                stack.extend(value[0] for value in (task.get("getargs") or {}).values())
+                stack.extend(uptodate.dep_name for uptodate in task.get("uptodate") or ()
+                             if hasattr(uptodate, "dep_name"))
+        return sorted(positions)
 
     @classmethod
     def get_instance(cls, strict: bool = False) -> Manager:
@@ -124,14 +838,26 @@ class Manager:
         """
         self.tasks.clear()
         self.context_stack.clear()
+        self._shared_meta.clear()
+        self._lazy_tasks.clear()
+        self._targets.clear()
+        self._positions.clear()
+        self._groups.clear()
+        self.frozen = False
+        self._consumed = False
 
     def doit_main(self, DOIT_CONFIG=None, **kwargs) -> DoitMain:
         """
-        Doit interface object.
+        Doit interface object using the resource-aware :class:`.runners.Run` command and the
+        :class:`.runners.SubgraphTaskLoader`.
         """
-        loader = NamespaceTaskLoader()
+        # Import doit's command line machinery only when it is needed to keep imports fast.
+        from doit.doit_cmd import DoitMain
+        from .runners import SubgraphTaskLoader
+
+        loader = SubgraphTaskLoader()
         loader.namespace = {"manager": self, "DOIT_CONFIG": DOIT_CONFIG or {}, **kwargs}
-        return DoitMain(loader)
+        return DoitMain(loader, extra_config={"COMMAND": {"run": "doit_interface.runners:Run"}})
 
     def run(self, args: list[str] = None, **kwargs) -> int:
         """
@@ -156,6 +882,28 @@ class Manager:
         frame = inspect.currentframe()
         while frame := frame.f_back:
             if frame.f_code.co_filename.endswith("dodo.py"):
-                frame.f_globals.setdefault("DOIT_CONFIG", _DEFAULT_DOIT_CONFIG)
+                from .config import DOIT_CONFIG
+                frame.f_globals.setdefault("DOIT_CONFIG", DOIT_CONFIG)
                 return
         # We didn't find the dodo file. Maybe we just imported the module from somewhere else.
+
+
+def _describe_task(task: dict) -> str:
+    """
+    Describe a task by its name and, if recorded, where it was declared.
+    """
+    meta = task.get("meta") or {}
+    if (location := meta.get("declared_at")) is None and "filename" in meta:
+        location = f"{meta['filename']}:{meta['lineno']}"
+    description = f"task `{normalize_task_name(task)}`"
+    return f"{description} declared at {location}" if location else description
+
+
+class _LazyTasks(NamedTuple):
+    """
+    Factory registered using :meth:`Manager.lazy` together with the state required to expand it.
+    """
+    position: int
+    factory: Callable[[], Iterable[dict]]
+    pipeline: list[Callable]
+    meta: dict
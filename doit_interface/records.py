@@ -0,0 +1,176 @@
+"""
+Compact representation of declared tasks for managers with very many tasks.
+"""
+from __future__ import annotations
+from collections.abc import MutableMapping
+import os
+import sys
+from typing import Any, Iterator
+
+
+_PATH_KEYS = ("file_dep", "targets")
+_NAME_KEYS = ("basename", "name")
+_SEQUENCE_KEYS = ("actions", "task_dep")
+_KEYS = (*_NAME_KEYS, "actions", *_PATH_KEYS, "task_dep", "meta")
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+class TaskRecord(MutableMapping):
+    """
+    Task declaration stored in slots rather than a dictionary.
+
+    Names, task dependencies, and paths are interned so strings shared by many tasks, e.g., a file
+    dependency of all tasks or the target of one task that is a file dependency of others, are
+    stored once. Targets and file dependencies are stored relative to their longest common
+    directory, e.g., an output directory added by :class:`.path_prefix`, which is also interned.
+    Lists are stored as tuples or, if they contain a single path, as a string, and :code:`meta`
+    information consisting only of the :code:`filename` and :code:`lineno` recorded by the manager
+    is stored without a dictionary until it is accessed. Other attributes are stored in a
+    dictionary.
+
+    Records behave like the task dictionaries they were created from, but lists are decoded on
+    access so lists returned by a record are copies. Modify lists by assigning values rather than
+    mutating them in place. Dictionaries, such as :code:`meta`, can be modified in place. Use
+    :meth:`to_dict` to convert a record to a task dictionary.
+
+    Args:
+        task: Task dictionary to store.
+
+    Example:
+
+        >>> record = TaskRecord({"basename": "task", "targets": ["outputs/a.txt"],
+        ...                      "file_dep": ["outputs/b.txt"]})
+        >>> record["targets"]
+        ['outputs/a.txt']
+        >>> record.to_dict()
+        {'basename': 'task', 'file_dep': ['outputs/b.txt'], 'targets': ['outputs/a.txt']}
+    """
+    __slots__ = ("basename", "name", "actions", "task_dep", "_root", "_file_dep", "_targets",
+                 "_filename", "_lineno", "_meta", "_extra")
+
+    def __init__(self, task: dict) -> None:
+        self.basename = self.name = self.actions = self.task_dep = None
+        self._root = self._file_dep = self._targets = None
+        self._filename = self._lineno = self._meta = self._extra = None
+        paths = {}
+        for key, value in task.items():
+            if key in _PATH_KEYS:
+                paths[key] = value
+            else:
+                self._set(key, value)
+        if paths:
+            self._set_paths(paths)
+
+    def _set(self, key: str, value: Any) -> None:
+        if key in _NAME_KEYS and type(value) is str:
+            setattr(self, key, sys.intern(value))
+        elif key in _SEQUENCE_KEYS and isinstance(value, (list, tuple)):
+            setattr(self, key, tuple(map(_intern, value)))
+        elif key == "meta" and type(value) is dict and len(value) == 2 \
+                and type(value.get("filename")) is str and "lineno" in value:
+            self._filename = sys.intern(value["filename"])
+            self._lineno = value["lineno"]
+        elif key == "meta" and isinstance(value, dict):
+            self._meta = value
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def _set_paths(self, paths: dict) -> None:
+        """
+        Store targets and file dependencies relative to their longest common directory.
+        """
+        if not all(isinstance(value, (list, tuple)) for value in paths.values()):
+            for key, value in paths.items():
+                self._set(key, value)
+            return
+        paths = {key: list(map(os.fspath, value)) for key, value in paths.items()}
+        flat = [path for value in paths.values() for path in value]
+        root = flat[0] if len(flat) == 1 else os.path.commonprefix(flat)
+        root = self._root = sys.intern(root[:root.rfind(os.sep) + 1])
+        start = len(root)
+        for key, value in paths.items():
+            # A single path, e.g., the target of most tasks, is stored without a tuple.
+            value = tuple(sys.intern(path[start:]) for path in value)
+            setattr(self, f"_{key}", value[0] if len(value) == 1 else value)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _PATH_KEYS:
+            if type(value := getattr(self, f"_{key}")) is str:
+                return [self._root + value]
+            if value is not None:
+                return [self._root + path for path in value]
+        elif key in _NAME_KEYS:
+            if (value := getattr(self, key)) is not None:
+                return value
+        elif key in _SEQUENCE_KEYS:
+            if (value := getattr(self, key)) is not None:
+                return list(value)
+        elif key == "meta":
+            if self._filename is not None:
+                # Store the location in a dictionary so changes to the returned value persist.
+                self._meta = {"filename": self._filename, "lineno": self._lineno}
+                self._filename = self._lineno = None
+            if self._meta is not None:
+                return self._meta
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self:
+            del self[key]
+        if key in _PATH_KEYS:
+            paths = {other: self.pop(other) for other in _PATH_KEYS if other in self}
+            paths[key] = value
+            self._set_paths(paths)
+        else:
+            self._set(key, value)
+
+    def __delitem__(self, key: str) -> None:
+        if self._extra is not None and key in self._extra:
+            del self._extra[key]
+            if not self._extra:
+                self._extra = None
+        elif key not in self:
+            raise KeyError(key)
+        elif key in _PATH_KEYS:
+            setattr(self, f"_{key}", None)
+        elif key == "meta":
+            self._filename = self._lineno = self._meta = None
+        else:
+            setattr(self, key, None)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in _KEYS:
+            if key in _PATH_KEYS:
+                present = getattr(self, f"_{key}") is not None
+            elif key == "meta":
+                present = self._filename is not None or self._meta is not None
+            else:
+                present = getattr(self, key) is not None
+            if present:
+                yield key
+        yield from self._extra or ()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> dict:
+        """
+        Convert the record to a task dictionary.
+        """
+        return {key: self[key] for key in self}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.to_dict()})"
@@ -1,39 +1,326 @@
+from __future__ import annotations
 import colorama
+from doit.exceptions import BaseFail
 from doit.reporter import ConsoleReporter
 from doit.task import Task
+import collections
+import heapq
+import json
+import sys
+import time
+from . import durations
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
 
 
 class DoitInterfaceReporter(ConsoleReporter):
+    r"""
+    Doit console reporter that includes a traceback for failed tasks and the end of the output of
+    :class:`.SubprocessAction`\s that write to a log file.
+
+    Wall-clock durations of successful tasks can be recorded in :attr:`DURATIONS_PATH` at the end
+    of each run so the :code:`run` command can dispatch tasks on the critical path first (see
+    :class:`.runners.Run`). Recording is disabled by default; set the path to
+    :data:`.durations.DEFAULT_PATH` in a subclass to enable it.
+
+    The reporter also records the start and end time of each task, the time taken to check
+    whether it is up to date, and the user and system CPU time of child processes that terminated
+    while the task was executed, as well as the peak resident set size in kilobytes of any child
+    process so far (see :func:`resource.getrusage`). CPU times are exact for serial runs but are
+    attributed to all tasks running concurrently when child processes terminate in parallel runs.
+    Records are available as :attr:`records` and can be written to :attr:`EVENTS_PATH` as JSON
+    lines and to :attr:`TRACE_PATH` in the Chrome trace event format, which can be opened as a
+    timeline using `Perfetto <https://ui.perfetto.dev>`__ or :code:`chrome://tracing`. Set the
+    paths in a subclass, e.g., :code:`class Reporter(DoitInterfaceReporter): TRACE_PATH =
+    "trace.json"`, and use it as the :code:`reporter` in the :code:`DOIT_CONFIG`.
     """
-    Doit console reporter that includes a traceback for failed tasks.
-    """
+    #: Path of the database of task durations or :code:`None` to disable recording.
+    DURATIONS_PATH = None
+    #: Path to write task records to as JSON lines or :code:`None` to disable writing records.
+    EVENTS_PATH = None
+    #: Path to write a Chrome trace to or :code:`None` to disable writing a trace.
+    TRACE_PATH = None
+
+    def __init__(self, outstream, options):
+        super().__init__(outstream, options)
+        self.durations = {}
+        self.records = []
+        self._active = {}
+
     def _write_failure(self, result: dict, write_exception=True):
         task: Task = result["task"]
         parts = [
             f"{colorama.Fore.RED}FAILED{colorama.Style.RESET_ALL}:",
             task.title(),
         ]
+        meta = getattr(task, "meta", None) or {}
         try:
-            meta = task.meta or {}
-            filename = meta["filename"]
-            lineno = meta["lineno"]
+            if (location := meta.get("declared_at")) is not None:
+                filename = location.filename
+                lineno = location.lineno
+            else:
+                filename = meta["filename"]
+                lineno = meta["lineno"]
             parts.append(f"(declared at {filename}:{lineno})")
         except (AttributeError, KeyError):
             parts.append("(declared at <unknown>)")
 
         msg = " ".join(parts) + "\n"
         self.write(msg)
+        if stack := meta.get("stack"):
+            self.write("".join(stack.format()))
+        for action in task.actions:
+            # Output of subprocesses writing to a log file is only kept in memory in part.
+            if getattr(action, "log", None) and action.err:
+                self.write(f"last lines of {action.get_log_path()}:\n{action.err}")
         if write_exception:
             self.write(result['exception'].get_msg())
             self.write("\n")
 
+    def _end_check(self, task: Task) -> dict:
+        """
+        Get the record of a task and store the time taken to check whether it is up to date.
+        """
+        record = self._active.setdefault(task.name, {"name": task.name})
+        if "check_start" in record and "check_time" not in record:
+            record["check_time"] = time.time() - record["check_start"]
+        return record
+
+    def _end_task(self, task: Task, status: str) -> dict:
+        """
+        Complete the record of a task.
+        """
+        record = self._end_check(task)
+        del self._active[task.name]
+        record["status"] = status
+        if "start" in record:
+            record["end"] = time.time()
+            if (usage := record.pop("usage")) is not None:
+                current = resource.getrusage(resource.RUSAGE_CHILDREN)
+                record["user_time"] = current.ru_utime - usage.ru_utime
+                record["system_time"] = current.ru_stime - usage.ru_stime
+                # The peak resident set size is reported in bytes on macOS.
+                record["max_rss"] = current.ru_maxrss // 1024 if sys.platform == "darwin" \
+                    else current.ru_maxrss
+        self.records.append(record)
+        return record
+
+    def _write_status(self, color: str, status: str, task: Task) -> None:
+        self.write(f"{color}{status}{colorama.Style.RESET_ALL}: {task.title()}\n")
+
+    def get_status(self, task):
+        self._active[task.name] = {"name": task.name, "check_start": time.time()}
+        super().get_status(task)
+
     def execute_task(self, task):
+        record = self._end_check(task)
+        record["start"] = time.time()
+        record["usage"] = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
         if task.actions:
-            self.write(f"{colorama.Fore.YELLOW}EXECUTE{colorama.Style.RESET_ALL}: {task.title()}\n")
+            self._write_status(colorama.Fore.YELLOW, "EXECUTE", task)
+
+    def add_failure(self, task, fail: BaseFail):
+        self._end_task(task, "failure")
+        super().add_failure(task, fail)
 
     def add_success(self, task):
+        record = self._end_task(task, "success")
         if task.actions:
-            self.write(f"{colorama.Fore.GREEN}SUCCESS{colorama.Style.RESET_ALL}: {task.title()}\n")
+            if "start" in record:
+                self.durations[task.name] = record["end"] - record["start"]
+            self._write_status(colorama.Fore.GREEN, "SUCCESS", task)
 
     def skip_uptodate(self, task):
-        self.write(f"{colorama.Fore.GREEN}UP TO DATE{colorama.Style.RESET_ALL}: {task.title()}\n")
+        self._end_task(task, "up-to-date")
+        self._write_status(colorama.Fore.GREEN, "UP TO DATE", task)
+
+    def complete_run(self):
+        if self.durations and self.DURATIONS_PATH:
+            durations.save(self.durations, self.DURATIONS_PATH)
+        if self.EVENTS_PATH:
+            with open(self.EVENTS_PATH, "w") as fp:
+                for record in self.records:
+                    fp.write(json.dumps(record) + "\n")
+        if self.TRACE_PATH:
+            with open(self.TRACE_PATH, "w") as fp:
+                json.dump(_to_chrome_trace(self.records), fp)
+        super().complete_run()
+
+
+class ProgressReporter(DoitInterfaceReporter):
+    """
+    Reporter showing a single progress line with the number of completed tasks, throughput, and
+    estimated time remaining instead of a line for each task.
+
+    The progress line is refreshed at most every :attr:`REFRESH_INTERVAL` seconds if the output
+    is a terminal and written as a new line every :attr:`LOG_INTERVAL` seconds otherwise, e.g.,
+    for log files. The time remaining is estimated from the durations recorded by previous runs
+    if :attr:`DURATIONS_PATH` is set (see :class:`DoitInterfaceReporter`) and the largest number of
+    tasks executed concurrently so far. Failures are reported in full. Use it by setting the
+    :code:`reporter` in the :code:`DOIT_CONFIG` or :code:`--reporter=doit_interface_progress` on
+    the command line.
+    """
+    #: Minimum time between refreshes of the progress line in seconds if the output is a terminal.
+    REFRESH_INTERVAL = 0.1
+    #: Minimum time between progress lines in seconds if the output is not a terminal.
+    LOG_INTERVAL = 10
+
+    def __init__(self, outstream, options):
+        super().__init__(outstream, options)
+        self.counts = collections.Counter()
+        self.total = 0
+        self._expected = {}
+        self._remaining = 0
+        self._running = set()
+        self._parallelism = 1
+        self._isatty = getattr(outstream, "isatty", lambda: False)()
+        self._start = self._last_refresh = time.monotonic()
+        self._line_visible = False
+
+    def initialize(self, tasks, selected_tasks):
+        super().initialize(tasks, selected_tasks)
+        # Find the selected tasks and their dependencies.
+        selected = set()
+        stack = list(selected_tasks or tasks)
+        while stack:
+            if (name := stack.pop()) in selected or name not in tasks:
+                continue
+            selected.add(name)
+            stack.extend(tasks[name].task_dep)
+            stack.extend(tasks[name].setup_tasks)
+        self.total = len(selected)
+
+        history = durations.load_recorded(self)
+        if history:
+            default = sum(history.values()) / len(history)
+            self._expected = {name: history.get(name, default) for name in selected
+                              if tasks[name].actions}
+            self._remaining = sum(self._expected.values())
+
+    def write(self, text):
+        # Clear the progress line so other output is not garbled.
+        if self._line_visible:
+            super().write("\r\033[K")
+            self._line_visible = False
+        super().write(text)
+
+    def _write_status(self, color: str, status: str, task: Task) -> None:
+        # The progress line replaces status lines for each task.
+        pass
+
+    def _complete(self, task: Task, status: str) -> None:
+        self.counts[status] += 1
+        self._remaining -= self._expected.pop(task.name, 0)
+        self._running.discard(task.name)
+        self._refresh()
+
+    def execute_task(self, task):
+        super().execute_task(task)
+        self._running.add(task.name)
+        self._parallelism = max(self._parallelism, len(self._running))
+
+    def add_failure(self, task, fail: BaseFail):
+        super().add_failure(task, fail)
+        self._complete(task, "FAILED")
+
+    def add_success(self, task):
+        super().add_success(task)
+        self._complete(task, "SUCCESS")
+
+    def skip_uptodate(self, task):
+        super().skip_uptodate(task)
+        self._complete(task, "UP TO DATE")
+
+    def skip_ignore(self, task):
+        self._complete(task, "IGNORED")
+
+    def _refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_refresh < (
+                self.REFRESH_INTERVAL if self._isatty else self.LOG_INTERVAL):
+            return
+        self._last_refresh = now
+        self.write(self.format_progress(now - self._start))
+        if self._isatty:
+            self._line_visible = True
+        else:
+            super().write("\n")
+
+    def format_progress(self, elapsed: float) -> str:
+        """
+        Format the progress line.
+
+        Args:
+            elapsed: Time since the run started in seconds.
+
+        Returns:
+            progress: Number of completed tasks by status, throughput, and estimated time
+                remaining.
+        """
+        done = sum(self.counts.values())
+        throughput = done / elapsed if elapsed else 0
+        parts = [f"{done}/{self.total} tasks"]
+        parts.extend(f"{self.counts[status]} {status.lower()}" for status in
+                     ["SUCCESS", "UP TO DATE", "FAILED", "IGNORED"] if self.counts[status])
+        parts.append(f"{throughput:.1f} tasks/s")
+        if self._expected:
+            # Assume remaining tasks are executed with the largest parallelism observed so far.
+            eta = max(self._remaining, 0) / self._parallelism
+        else:
+            eta = (self.total - done) / throughput if throughput else None
+        if eta is not None:
+            parts.append(f"ETA {_format_seconds(eta)}")
+        return ", ".join(parts)
+
+    def complete_run(self):
+        self._refresh(force=True)
+        # Keep the final progress line.
+        if self._line_visible:
+            super().write("\n")
+            self._line_visible = False
+        super().complete_run()
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def _to_chrome_trace(records: list[dict]) -> dict:
+    """
+    Convert task records to the Chrome trace event format with up-to-date checks on the first
+    thread and executed tasks distributed across as few other threads as possible without overlap.
+    """
+    events = [{"name": "thread_name", "ph": "M", "pid": 0, "tid": 0, "args": {"name": "checks"}}]
+    for record in records:
+        if "check_time" in record:
+            events.append({"name": record["name"], "cat": "check", "ph": "X", "pid": 0, "tid": 0,
+                           "ts": record["check_start"] * 1e6, "dur": record["check_time"] * 1e6})
+
+    # Assign each execution to the free lane with the smallest index.
+    lanes = []
+    free = []
+    for record in sorted((record for record in records if "start" in record),
+                         key=lambda record: record["start"]):
+        while lanes and lanes[0][0] <= record["start"]:
+            heapq.heappush(free, heapq.heappop(lanes)[1])
+        if free:
+            lane = heapq.heappop(free)
+        else:
+            lane = len(lanes) + 1
+            events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": lane,
+                           "args": {"name": f"lane {lane}"}})
+        heapq.heappush(lanes, (record["end"], lane))
+        events.append({
+            "name": record["name"], "cat": record["status"], "ph": "X", "pid": 0, "tid": lane,
+            "ts": record["start"] * 1e6, "dur": (record["end"] - record["start"]) * 1e6,
+            "args": {key: value for key, value in record.items()
+                     if key not in {"name", "start", "end"}},
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
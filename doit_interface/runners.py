@@ -0,0 +1,411 @@
+"""
+Scheduling and loading extensions for doit's :code:`run` command.
+"""
+from __future__ import annotations
+import asyncio
+import bisect
+import collections
+import contextlib
+from doit import cmd_run
+from doit.cmd_base import NamespaceTaskLoader
+from doit.control import TaskControl
+from doit.exceptions import BaseFail
+from doit.runner import Runner
+from doit.task import Task
+import functools
+import itertools
+import math
+import os
+import types
+from typing import Iterable, Iterator
+from . import durations
+from .actions import SubprocessAction
+from .checkers import HashChecker
+from .contexts import _create_parent_dirs, create_target_dirs
+
+
+def parse_resources(value: str) -> dict[str, float]:
+    """
+    Parse a resource budget from a comma-separated list of :code:`key=value` pairs.
+
+    Args:
+        value: Resource budget, e.g., :code:`cpu=32,mem_gb=128`.
+
+    Returns:
+        resources: Amount of each resource keyed by name.
+
+    Example:
+
+        >>> from doit_interface.runners import parse_resources
+        >>> parse_resources("cpu=32,mem_gb=127.5")
+        {'cpu': 32, 'mem_gb': 127.5}
+    """
+    resources = {}
+    for item in filter(None, (item.strip() for item in value.split(","))):
+        key, sep, amount = item.partition("=")
+        if not sep:
+            raise ValueError(f"resource `{item}` is not of the form `key=value`")
+        amount = float(amount)
+        resources[key.strip()] = int(amount) if amount.is_integer() else amount
+    return resources
+
+
+class ResourceDispatcher:
+    """
+    Wrapper for a :code:`doit.control.TaskDispatcher` that only dispatches tasks if the resources
+    they require fit within a budget.
+
+    Tasks declare the resources they require as :code:`resources` which are stored in the task
+    :code:`meta` information (see :class:`.Manager`). Resources that are not part of the
+    budget are not limited, and tasks without resources are always dispatched. A task requiring
+    more resources than the budget is dispatched once no other tasks are running so the run does
+    not stall. Ready tasks are dispatched in the order in which doit makes them available or in
+    descending order of `priority`, but tasks that fit may overtake tasks that do not.
+
+    Args:
+        dispatcher: Dispatcher to wrap.
+        budget: Amount of each resource available to all running tasks.
+        priority: Priority of tasks keyed by name, e.g., the length of the critical path starting
+            at each task (see :func:`.durations.critical_path`). Tasks without priority have the
+            lowest priority.
+    """
+    def __init__(self, dispatcher, budget: dict[str, float],
+                 priority: dict[str, float] = None) -> None:
+        self.dispatcher = dispatcher
+        self.budget = budget
+        self.priority = priority
+        self.usage = dict.fromkeys(budget, 0)
+        self.generator = self._generate()
+
+    def __getattr__(self, name: str):
+        # Delegate other attributes accessed by doit's runners, e.g., `tasks` and `nodes`.
+        return getattr(self.dispatcher, name)
+
+    def _generate(self) -> Iterator:
+        # Pending nodes and their budgeted resources are kept sorted by negative priority and
+        # arrival.
+        pending = []
+        arrivals = itertools.count()
+        running = {}
+        exhausted = False
+        completed = None
+        while True:
+            if completed is not None and (resources := running.pop(completed.task.name, None)):
+                for key, amount in resources.items():
+                    self.usage[key] -= amount
+            # Hand the completed task to the wrapped dispatcher and get all tasks that are ready.
+            while not exhausted:
+                try:
+                    node = self.dispatcher.generator.send(completed)
+                except StopIteration:
+                    exhausted = True
+                    break
+                completed = None
+                if node == "hold on":
+                    break
+                priority = self.priority.get(node.task.name, -math.inf) if self.priority else 0
+                meta = node.task.meta or {}
+                resources = {key: amount for key, amount in meta.get("resources", {}).items()
+                             if key in self.budget}
+                bisect.insort(pending, (-priority, next(arrivals), node, resources))
+
+            if (node := self._admit(pending, running)) is not None:
+                completed = yield node
+            elif pending or running or not exhausted:
+                completed = yield "hold on"
+            else:
+                return
+
+    def _admit(self, pending: list, running: dict):
+        """
+        Remove and return the first pending node whose resources fit the remaining budget.
+        """
+        for i, (*_, node, resources) in enumerate(pending):
+            if not running or all(self.usage[key] + amount <= self.budget[key]
+                                  for key, amount in resources.items()):
+                del pending[i]
+                for key, amount in resources.items():
+                    self.usage[key] += amount
+                running[node.task.name] = resources
+                return node
+        return None
+
+
+class AsyncioRunner(Runner):
+    r"""
+    Runner executing tasks concurrently in a single process using :mod:`asyncio`.
+
+    :class:`.SubprocessAction`\s are launched as :mod:`asyncio` subprocesses so waiting for them
+    does not require a thread or process each, and tasks do not need to be pickled. Other actions,
+    e.g., python functions, are executed in a thread pool. At most :code:`num_process` tasks are
+    executed concurrently.
+
+    Args:
+        dep_manager: Dependency manager to check whether tasks are up to date.
+        reporter: Reporter for progress and results.
+        continue_: Continue executing tasks after a task failed.
+        always_execute: Execute tasks even if they are up to date.
+        stream: Verbosity configuration.
+        num_process: Maximum number of concurrently executed tasks.
+    """
+    def __init__(self, dep_manager, reporter, continue_=False, always_execute=False, stream=None,
+                 num_process=1):
+        super().__init__(dep_manager, reporter, continue_=continue_,
+                         always_execute=always_execute, stream=stream)
+        self.num_process = max(num_process, 1)
+
+    def run_tasks(self, task_dispatcher):
+        asyncio.run(self._run_tasks(task_dispatcher))
+
+    async def _run_tasks(self, task_dispatcher):
+        ready = collections.deque()
+        completed = collections.deque()
+        running = set()
+        exhausted = False
+        while True:
+            # Notify the dispatcher of completed tasks and get all tasks that are ready.
+            while not exhausted:
+                try:
+                    node = task_dispatcher.generator.send(
+                        completed.popleft() if completed else None)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if node != "hold on":
+                    ready.append(node)
+                elif not completed:
+                    break
+
+            # Start as many tasks as we can. Tasks that do not need to be executed, e.g., because
+            # they are up to date, are completed immediately.
+            while ready and len(running) < self.num_process and not self._stop_running:
+                node = ready.popleft()
+                if self.select_task(node, task_dispatcher.tasks):
+                    running.add(asyncio.ensure_future(self._execute_node(node)))
+                else:
+                    completed.append(node)
+            if completed and not exhausted:
+                continue
+            if not running:
+                break
+
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                node, base_fail = future.result()
+                self.process_task_result(node, base_fail)
+                completed.append(node)
+
+    async def _execute_node(self, node):
+        return node, await self.execute_task_async(node.task)
+
+    async def execute_task_async(self, task) -> BaseFail:
+        """
+        Execute the actions of a task, mirroring :code:`doit.task.Task.execute`.
+        """
+        if task.teardown:
+            self.teardown_list.append(task)
+        self.reporter.execute_task(task)
+
+        task.executed = True
+        task.init_options()
+        out, err = self.stream._get_out_err(task.verbosity)
+        loop = asyncio.get_running_loop()
+        for action in task.actions:
+            if isinstance(action, SubprocessAction):
+                action_return = await action.execute_async(out, err)
+            else:
+                action_return = await loop.run_in_executor(None, action.execute, out, err)
+            if isinstance(action_return, BaseFail):
+                return action_return
+            task.result = action.result
+            task.values.update(action.values)
+
+
+def _create_target_dirs(tasks: dict[str, Task], selected: Iterable[str]) -> None:
+    """
+    Create the target directories of the selected tasks and the tasks they depend on in a single
+    pass and remove the actions creating them for each task (see :class:`.create_target_dirs`).
+    """
+    directories = set()
+    visited = set()
+    names = list(selected)
+    while names:
+        if (name := names.pop()) in visited or (task := tasks.get(name)) is None:
+            continue
+        visited.add(name)
+        names.extend(itertools.chain(task.task_dep, task.setup_tasks, task.calc_dep))
+        # Actions are only instantiated when the task is executed.
+        if task._action_instances is None and _create_parent_dirs in task._actions:
+            task._actions.remove(_create_parent_dirs)
+            directories.update(directory for target in task.targets
+                               if (directory := os.path.dirname(target)))
+    create_target_dirs.create_dirs(directories)
+
+
+class _ResourceTaskControl(TaskControl):
+    def __init__(self, *args, budget: dict[str, float], priority: str, reporter=None,
+                 **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.budget = budget
+        self.priority = priority
+        self.reporter = reporter
+
+    def task_dispatcher(self):
+        _create_target_dirs(self.tasks, self.selected_tasks)
+        priority = None
+        if self.priority == "critical-path":
+            priority = durations.critical_path(self.tasks,
+                                               durations.load_recorded(self.reporter))
+        return ResourceDispatcher(super().task_dispatcher(), self.budget, priority)
+
+
+opt_parallel_type = {
+    **cmd_run.opt_parallel_type,
+    "help": """Tasks can be executed in parallel in different ways:
+'process': uses python multiprocessing module
+'thread': uses threads
+'asyncio': uses asyncio subprocesses in a single process
+[default: %(default)s]
+""",
+}
+
+
+opt_resources = {
+    "name": "resources",
+    "long": "resources",
+    "type": parse_resources,
+    "default": None,
+    "help": "resources available to tasks as comma-separated key=value pairs, e.g., "
+    "--resources=cpu=32,mem_gb=128 [default: cpu=<number of cpus>]",
+}
+
+
+opt_priority = {
+    "name": "priority",
+    "long": "priority",
+    "type": str,
+    "choices": (
+        ("declaration", "dispatch ready tasks in the order doit makes them available"),
+        ("critical-path", "dispatch ready tasks with the longest chain of dependent tasks first "
+         "based on durations recorded by the reporter"),
+    ),
+    "default": "declaration",
+    "help": "order in which ready tasks are dispatched [default: %(default)s]",
+}
+
+
+class Run(cmd_run.Run):
+    """
+    Doit :code:`run` command that only executes tasks in parallel if the resources they require
+    fit within a budget and supports the :class:`AsyncioRunner` using
+    :code:`--parallel-type=asyncio`. Ready tasks are dispatched in descending order of the
+    length of the critical path starting at each task using :code:`--priority=critical-path`.
+
+    The budget can be specified using the :code:`--resources=cpu=32,mem_gb=128` command line
+    option (the equals sign is required because doit interprets :code:`key=value` arguments as
+    variables) or as :code:`resources` in the :code:`DOIT_CONFIG`. The command is used by
+    :meth:`.Manager.run`. To use it with the :code:`doit` command line interface, register it as a
+    plugin, e.g., by adding the following to your :code:`pyproject.toml`.
+
+    .. code-block:: toml
+
+        [tool.doit.plugins.command]
+        run = "doit_interface.runners:Run"
+    """
+    cmd_options = tuple(
+        opt_parallel_type if option is cmd_run.opt_parallel_type else option
+        for option in cmd_run.Run.cmd_options
+    ) + (opt_resources, opt_priority)
+
+    # doit passes options to `_execute` based on its signature so we cannot use `**kwargs`.
+    def _execute(self, outfile, verbosity=None, always=False, continue_=False,
+                 reporter="console", num_process=0, par_type="process", single=False,
+                 auto_delayed_regex=False, force_verbosity=False, failure_verbosity=0, pdb=False,
+                 resources: dict[str, float] = None, priority: str = "declaration"):
+        if resources is None:
+            resources = {"cpu": os.cpu_count() or 1}
+        # Pick up changes to the environment since the last run.
+        SubprocessAction.reset_caches()
+        # doit creates the task control and runner inline so we substitute them for the duration
+        # of the run.
+        # Durations are recorded by the reporter (see `DoitInterfaceReporter.DURATIONS_PATH`).
+        reporter_cls = self.reporters.get(reporter) if isinstance(reporter, str) else reporter
+        substitutes = {"TaskControl": functools.partial(_ResourceTaskControl, budget=resources,
+                                                        priority=priority, reporter=reporter_cls)}
+        if par_type == "asyncio":
+            substitutes["MThreadRunner"] = AsyncioRunner
+            par_type = "thread"
+        with _substitute(cmd_run, **substitutes), _prefetch_digests(self.dep_manager):
+            return super()._execute(
+                outfile, verbosity=verbosity, always=always, continue_=continue_,
+                reporter=reporter, num_process=num_process, par_type=par_type, single=single,
+                auto_delayed_regex=auto_delayed_regex, force_verbosity=force_verbosity,
+                failure_verbosity=failure_verbosity, pdb=pdb,
+            )
+
+
+class SubgraphTaskLoader(NamespaceTaskLoader):
+    """
+    Load only the tasks selected on the command line and the tasks they depend on from a
+    :class:`.Manager` in the namespace if a command executes tasks.
+
+    Positional arguments that start with a dash are task options and are ignored. All tasks are
+    loaded if no tasks are selected or a selected task cannot be resolved by the manager, e.g.,
+    because it is selected by a wildcard (see :meth:`.Manager._create_doit_tasks`).
+    """
+    def load_tasks(self, cmd, pos_args):
+        manager = self.namespace.get("manager")
+        selected = [arg for arg in pos_args if not arg.startswith("-")]
+        if not (cmd.execute_tasks and selected and hasattr(manager, "_select_positions")):
+            return super().load_tasks(cmd, pos_args)
+
+        # doit inspects the source of task creators so we use a function rather than a partial.
+        def create_doit_tasks():
+            return manager._create_doit_tasks(selected)
+
+        namespace = self.namespace
+        self.namespace = {**namespace, "manager": types.SimpleNamespace(
+            create_doit_tasks=create_doit_tasks)}
+        try:
+            return super().load_tasks(cmd, pos_args)
+        finally:
+            self.namespace = namespace
+
+
+@contextlib.contextmanager
+def _prefetch_digests(dep_manager):
+    """
+    Hash the file dependencies of each task concurrently before doit checks them one at a time
+    and write the memoized digests at the end of the run if the :class:`.HashChecker` is used.
+    """
+    checker = getattr(dep_manager, "checker", None)
+    if not isinstance(checker, HashChecker):
+        yield
+        return
+
+    def _wrap(method):
+        @functools.wraps(method)
+        def _wrapper(task, *args, **kwargs):
+            checker.prefetch((dep, dep_manager._get(task.name, dep)) for dep in task.file_dep)
+            return method(task, *args, **kwargs)
+        return _wrapper
+
+    dep_manager.get_status = _wrap(dep_manager.get_status)
+    dep_manager.save_success = _wrap(dep_manager.save_success)
+    try:
+        yield
+    finally:
+        del dep_manager.get_status, dep_manager.save_success
+        checker.flush()
+
+
+@contextlib.contextmanager
+def _substitute(module, **attributes):
+    previous = {name: getattr(module, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(module, name, value)
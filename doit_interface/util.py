@@ -1,4 +1,11 @@
-from typing import Union
+from __future__ import annotations
+from collections.abc import Mapping
+import contextlib
+import types
+from typing import Iterator, TYPE_CHECKING, Union
+
+if TYPE_CHECKING:  # pragma: no cover
+    import sqlite3
 
 
 def normalize_task_name(task: Union[dict, str]) -> str:
@@ -20,13 +27,55 @@ def normalize_task_name(task: Union[dict, str]) -> str:
     """
     if isinstance(task, str):
         return task
-    if not isinstance(task, dict):
+    if not isinstance(task, (dict, Mapping)):
         raise TypeError(f"{task} of type {type(task)} is not a valid task or task name")
     if name := task.get("name"):
         return f"{task['basename']}:{name}"
     return task["basename"]
 
 
+class DeclarationLocation:
+    """
+    Location where a task was declared, resolved lazily from a code object.
+
+    Args:
+        code: Code object of the frame that declared the task.
+        lineno: Line number at which the task was declared.
+    """
+    __slots__ = ("code", "lineno")
+
+    def __init__(self, code: types.CodeType, lineno: int) -> None:
+        self.code = code
+        self.lineno = lineno
+
+    @property
+    def filename(self) -> str:
+        return self.code.co_filename
+
+    def __repr__(self) -> str:
+        return f"{self.filename}:{self.lineno}"
+
+    def __reduce__(self):
+        # Code objects cannot be pickled so we resolve the location eagerly.
+        return _ResolvedDeclarationLocation, (self.filename, self.lineno)
+
+
+class _ResolvedDeclarationLocation(DeclarationLocation):
+    """
+    Location where a task was declared with an eagerly resolved filename.
+    """
+    __slots__ = ("_filename",)
+
+    def __init__(self, filename: str, lineno: int) -> None:
+        self.code = None
+        self._filename = filename
+        self.lineno = lineno
+
+    @property
+    def filename(self) -> str:
+        return self._filename
+
+
 class NoTasksError(Exception):
     """
     No tasks have been discovered.
@@ -57,3 +106,50 @@ def dict2args(*args, **kwargs):
                 raise ValueError(f"key {key} is supplied twice")
             result[key] = value
     return [f"--{key}={value}" for key, value in result.items()]
+
+
+def hash_file(filename: str) -> str:
+    """
+    Compute the SHA-256 digest of a file, reading it in chunks.
+
+    Args:
+        filename: File to hash.
+
+    Returns:
+        digest: Hexadecimal digest of the file contents.
+    """
+    # Import hashlib only when it is needed to keep imports fast.
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(2 ** 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def sqlite_transaction(path: str, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+    """
+    Connect to an SQLite database for a single transaction.
+
+    A new connection is used for each transaction because databases, e.g., of the
+    :class:`.ArtifactCache` or :class:`.WorkQueue`, are shared between threads and processes. The
+    transaction is committed if the block completes and rolled back otherwise, and the connection
+    is closed.
+
+    Args:
+        path: Path of the database.
+        immediate: Acquire the write lock when the transaction begins rather than on the first
+            write so no other connection can write between reading and updating a row.
+    """
+    # Import sqlite3 only when it is needed to keep imports fast.
+    import sqlite3
+
+    connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+    try:
+        with connection:
+            connection.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            yield connection
+    finally:
+        connection.close()
@@ -0,0 +1,171 @@
+"""
+Detection of changes to file dependencies using Linux inotify to re-execute the affected tasks.
+"""
+from __future__ import annotations
+import collections
+import ctypes
+import os
+import select
+import struct
+from typing import Iterable
+from .util import normalize_task_name
+
+
+# Constants from `sys/inotify.h`.
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    Watch files for changes using Linux inotify.
+
+    The directories containing the files are watched rather than the files themselves so files
+    replaced by editors that write a temporary file and rename it are detected. Files in
+    directories that do not exist are not watched.
+
+    Args:
+        paths: Paths of files to watch.
+    """
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+    def __init__(self, paths: Iterable[str]) -> None:
+        self.paths = {os.path.abspath(path) for path in paths}
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self.fd = self._check(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+        except AttributeError as ex:  # pragma: no cover
+            raise OSError("inotify is not available on this platform") from ex
+        self.directories = {}
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            if os.path.isdir(directory):
+                wd = self._check(self._add_watch(self.fd, os.fsencode(directory), self.MASK))
+                self.directories[wd] = directory
+
+    @staticmethod
+    def _check(result: int) -> int:
+        if result < 0:  # pragma: no cover
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        return result
+
+    def _read(self) -> set[str]:
+        """
+        Read pending events and return the watched files that changed.
+        """
+        changed = set()
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = _EVENT.unpack_from(buffer, offset)
+                offset += _EVENT.size
+                name = buffer[offset:offset + length].rstrip(b"\0")
+                offset += length
+                # Events were lost so any file may have changed.
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.paths)
+                elif (directory := self.directories.get(wd)) is not None:
+                    path = os.path.join(directory, os.fsdecode(name))
+                    if path in self.paths:
+                        changed.add(path)
+
+    def wait(self, debounce: float = 0.1, timeout: float = None) -> set[str]:
+        """
+        Wait for changes to the watched files.
+
+        Args:
+            debounce: Time in seconds without events after the first change before returning so
+                bursts of changes, e.g., saving many files, are reported together.
+            timeout: Maximum time in seconds to wait for the first change.
+
+        Returns:
+            changed: Absolute paths of the files that changed; empty if the timeout expired.
+        """
+        changed = set()
+        while True:
+            ready, _, _ = select.select([self.fd], [], [], debounce if changed else timeout)
+            if not ready:
+                return changed
+            changed |= self._read()
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def __enter__(self) -> Inotify:
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class DependencyIndex:
+    """
+    Reverse index mapping source files to the tasks they affect.
+
+    Source files are file dependencies that are not targets of other tasks. A task is affected if
+    one of its source files changed or if it depends on an affected task, either by a task
+    dependency or by a file dependency on a target of an affected task.
+
+    Args:
+        tasks: Task dictionaries.
+
+    Example:
+
+        >>> index = DependencyIndex([
+        ...     {"basename": "a", "file_dep": ["a.txt"], "targets": ["b.txt"]},
+        ...     {"basename": "b", "file_dep": ["b.txt"]},
+        ...     {"basename": "c", "task_dep": ["b"]},
+        ...     {"basename": "d", "file_dep": ["d.txt"]},
+        ... ])
+        >>> index.affected([os.path.abspath("a.txt")])
+        ['a', 'b', 'c']
+    """
+    def __init__(self, tasks: Iterable[dict]) -> None:
+        tasks = list(tasks)
+        self.order = {normalize_task_name(task): i for i, task in enumerate(tasks)}
+        producers = {os.path.abspath(target): normalize_task_name(task) for task in tasks
+                     for target in map(os.fspath, task.get("targets") or ())}
+        self.sources = collections.defaultdict(set)
+        self.dependents = collections.defaultdict(set)
+        for task in tasks:
+            name = normalize_task_name(task)
+            if task.get("name"):
+                self.dependents[name].add(task["basename"])
+            for dep in map(normalize_task_name, task.get("task_dep") or ()):
+                self.dependents[dep].add(name)
+            for dep in map(os.path.abspath, map(os.fspath, task.get("file_dep") or ())):
+                if (producer := producers.get(dep)) is None:
+                    self.sources[dep].add(name)
+                else:
+                    self.dependents[producer].add(name)
+
+    def affected(self, paths: Iterable[str]) -> list[str]:
+        """
+        Get the names of tasks affected by changes to files in declaration order.
+
+        Args:
+            paths: Absolute paths of files that changed.
+
+        Returns:
+            names: Names of affected tasks.
+        """
+        affected = set()
+        stack = [name for path in paths for name in self.sources.get(path, ())]
+        while stack:
+            if (name := stack.pop()) in affected:
+                continue
+            affected.add(name)
+            stack.extend(self.dependents.get(name, ()))
+        # Groups of subtasks are affected through their members but are not tasks themselves.
+        return sorted(affected & self.order.keys(), key=self.order.__getitem__)
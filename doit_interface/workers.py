@@ -0,0 +1,284 @@
+"""
+Execution of python scripts in processes forked from a warm worker with preloaded modules.
+"""
+from __future__ import annotations
+import array
+import asyncio
+import atexit
+from doit.exceptions import TaskFailed
+import importlib
+import os
+import pickle
+import runpy
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import traceback
+from typing import Iterable, Optional, Union
+from .actions import _TailBuffer, SubprocessAction
+
+
+class PythonWorkerAction(SubprocessAction):
+    """
+    Run a python script or module in a process forked from a warm worker instead of launching a
+    new interpreter.
+
+    Launching an interpreter and importing large packages, such as :mod:`numpy` or :mod:`torch`,
+    often takes longer than the work carried out by short tasks. The action starts a long-lived
+    worker process that imports the modules set using :meth:`set_preload` once. Each task is
+    executed in a new process forked from the worker so it starts in milliseconds with the
+    preloaded modules in memory. The forked process receives the command line arguments, working
+    directory, environment, and standard streams of the task, and a crash only affects the task
+    that caused it. Forking requires a POSIX platform.
+
+    The action supports the same substitutions and arguments as :class:`.SubprocessAction`.
+    The command must be a python script, :code:`-m module`, or :code:`-c code` followed by its
+    arguments, optionally preceded by :code:`$!`. Of the keyword arguments for launching
+    subprocesses, only :code:`cwd` is supported.
+
+    Example:
+
+        >>> # Compute statistics of the file dependency and write them to the first target.
+        >>> PythonWorkerAction("$! stats.py --input=$^ --output=$@")
+        <doit_interface.workers.PythonWorkerAction object at 0x...>
+
+        >>> # Import numpy once in the worker rather than for each task.
+        >>> PythonWorkerAction.set_preload(["numpy"])
+    """
+    _PRELOAD: list[str] = []
+    _WORKER: Optional[_Worker] = None
+    _LOCK = threading.Lock()
+
+    def _get_argv(self, args: Union[str, list[str]]) -> list[str]:
+        argv = shlex.split(args) if isinstance(args, str) else list(args)
+        if argv[:1] == [sys.executable]:
+            argv = argv[1:]
+        if not argv or (argv[0] in {"-c", "-m"} and len(argv) < 2):
+            raise ValueError(f"{self.args} is not a valid python command")
+        return argv
+
+    def _get_tail(self, path: str) -> str:
+        tail = _TailBuffer(self.tail)
+        with open(path, "rb") as fp:
+            # Only read as much of the end of the log file as the buffer can hold.
+            fp.seek(max(0, os.fstat(fp.fileno()).st_size - self.tail * tail.MAX_LINE_LENGTH))
+            while chunk := fp.read(self._CHUNK_SIZE):
+                tail.feed(chunk)
+        return tail.text()
+
+    @classmethod
+    def _get_worker(cls) -> _Worker:
+        with cls._LOCK:
+            if cls._WORKER is None or not cls._WORKER.is_alive():
+                cls._WORKER = _Worker(cls._PRELOAD)
+            return cls._WORKER
+
+    def execute(self, out=None, err=None) -> Optional[TaskFailed]:
+        args, kwargs = self._prepare()
+        argv = self._get_argv(args)
+        if self._restore_targets(key := self._get_cache_key(args)):
+            return
+        try:
+            cwd = os.path.abspath(kwargs.get("cwd") or os.curdir)
+            worker = self._get_worker()
+            if self.log is None:
+                returncode = worker.run(argv, cwd, kwargs["env"], (0, 1, 2))
+            else:
+                fp, _ = self._open_log()
+                with fp:
+                    returncode = worker.run(argv, cwd, kwargs["env"],
+                                            (0, fp.fileno(), fp.fileno()))
+                self.err = self._get_tail(fp.name)
+            if returncode is None:
+                raise RuntimeError(f"python worker executing `{shlex.join(argv)}` exited without "
+                                   "a status code, e.g., because it crashed")
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, argv)
+        except Exception as ex:
+            return TaskFailed(str(ex), exception=ex)
+        if failure := self._check_targets():
+            return failure
+        self._store_targets(key)
+
+    async def execute_async(self, out=None, err=None) -> Optional[TaskFailed]:
+        """
+        Execute the action in a thread so the :class:`.runners.AsyncioRunner` is not blocked while
+        waiting for the forked process.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.execute, out, err)
+
+    @classmethod
+    def set_preload(cls, modules: Iterable[str]) -> None:
+        r"""
+        Set the modules imported by the worker of all :class:`PythonWorkerAction`\s. A running
+        worker is stopped so the next action starts a worker importing the new modules.
+        """
+        cls._PRELOAD = list(modules)
+        with cls._LOCK:
+            if cls._WORKER is not None:
+                cls._WORKER.close()
+                cls._WORKER = None
+
+    @classmethod
+    def get_preload(cls) -> list[str]:
+        r"""
+        Get the modules imported by the worker of all :class:`PythonWorkerAction`\s.
+        """
+        return cls._PRELOAD
+
+
+class _Worker:
+    """
+    Client of a worker process that forks a new process for each request.
+
+    Requests are single bytes sent over a stream socket carrying the descriptors of a socket for
+    exchanging the command and status code with the forked process and its standard streams. Each
+    request is sent using a single :meth:`socket.socket.sendmsg` call so requests from different
+    threads or forked runner processes do not interleave.
+    """
+    def __init__(self, preload: list[str]) -> None:
+        self.socket, remote = socket.socketpair()
+        # Share the module search path so the worker can import the same modules.
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, sys.path))}
+        with remote:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", __name__, str(remote.fileno()), *preload],
+                pass_fds=[remote.fileno()], env=env,
+            )
+        if self.socket.recv(1) != b"\0":
+            self.close()
+            raise RuntimeError(f"python worker failed to preload modules {preload}")
+        atexit.register(self.close)
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(self, argv: list[str], cwd: str, env: dict[str, str], fds: tuple[int, int, int]) \
+            -> Optional[int]:
+        """
+        Execute a python command in a forked process.
+
+        Args:
+            argv: Command line arguments without the interpreter.
+            cwd: Working directory.
+            env: Environment variables.
+            fds: Descriptors of the standard input, output, and error streams.
+
+        Returns:
+            returncode: Status code of the forked process or `None` if it did not report one,
+                e.g., because it crashed.
+        """
+        connection, remote = socket.socketpair()
+        with connection:
+            with remote:
+                _send_fds(self.socket, b"\0", [remote.fileno(), *fds])
+            connection.sendall(pickle.dumps((argv, cwd, env)))
+            connection.shutdown(socket.SHUT_WR)
+            status = b"".join(iter(lambda: connection.recv(64), b""))
+        return int(status) if status else None
+
+    def close(self) -> None:
+        self.socket.close()
+        self.process.wait()
+
+
+def _send_fds(sock: socket.socket, data: bytes, fds: Iterable[int]) -> None:
+    """
+    Send data together with file descriptors over a Unix domain socket (:func:`socket.send_fds`
+    is not available in python 3.8).
+    """
+    sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))])
+
+
+def _recv_fds(sock: socket.socket, bufsize: int, maxfds: int) -> tuple[bytes, list[int]]:
+    """
+    Receive data and up to `maxfds` file descriptors from a Unix domain socket (see
+    :func:`_send_fds`).
+    """
+    fds = array.array("i")
+    message, ancdata, _, _ = sock.recvmsg(bufsize, socket.CMSG_LEN(maxfds * fds.itemsize))
+    for level, type_, data in ancdata:
+        if level == socket.SOL_SOCKET and type_ == socket.SCM_RIGHTS:
+            # Discard a truncated trailing descriptor.
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    return message, list(fds)
+
+
+def _run(argv: list[str], cwd: str, env: dict[str, str]) -> int:
+    """
+    Run a python command in the current process, mirroring the interpreter.
+    """
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(env)
+    try:
+        if argv[0] == "-c":
+            sys.argv = ["-c", *argv[2:]]
+            sys.path[0] = ""
+            exec(compile(argv[1], "<string>", "exec"), {"__name__": "__main__"})
+        elif argv[0] == "-m":
+            sys.argv = argv[1:]
+            sys.path[0] = cwd
+            runpy.run_module(argv[1], run_name="__main__", alter_sys=True)
+        else:
+            sys.argv = argv
+            sys.path[0] = os.path.dirname(os.path.abspath(argv[0]))
+            runpy.run_path(argv[0], run_name="__main__")
+        return 0
+    except SystemExit as ex:
+        if ex.code is None or isinstance(ex.code, int):
+            return ex.code or 0
+        print(ex.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def _handle(fds: list[int]) -> int:
+    """
+    Execute a request in a forked process and report its status code.
+    """
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    status, *streams = fds
+    for target, fd in enumerate(streams):
+        os.dup2(fd, target)
+    for fd in set(streams) - {0, 1, 2}:
+        os.close(fd)
+    with socket.socket(fileno=status) as connection:
+        argv, cwd, env = pickle.loads(b"".join(iter(lambda: connection.recv(2 ** 16), b"")))
+        returncode = _run(argv, cwd, env)
+        connection.sendall(str(returncode).encode())
+    return returncode
+
+
+def _serve(fd: int, preload: list[str]) -> None:
+    """
+    Preload modules and fork a process for each request received on a socket until the socket is
+    closed by all clients.
+    """
+    server = socket.socket(fileno=fd)
+    for module in preload:
+        importlib.import_module(module)
+    # Reap forked processes automatically.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    server.sendall(b"\0")
+    while True:
+        message, fds = _recv_fds(server, 1, 4)
+        if not message:
+            return
+        if not os.fork():  # pragma: no cover (executed by the forked process)
+            server.close()
+            os._exit(_handle(fds))
+        for fd in fds:
+            os.close(fd)
+
+
+if __name__ == "__main__":
+    _serve(int(sys.argv[1]), sys.argv[2:])
@@ -0,0 +1,236 @@
+"""
+Queue of tasks in an SQLite database on a shared filesystem so tasks can be executed by workers
+on many hosts without a broker.
+"""
+from __future__ import annotations
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import ContextManager, Iterable, Iterator, Mapping, Optional
+from .util import sqlite_transaction
+
+
+class WorkQueue:
+    """
+    Queue of tasks and their dependencies shared by workers through an SQLite database.
+
+    Tasks are published together with the names of the tasks they depend on, and each task keeps
+    count of its dependencies that have not yet completed. Workers claim pending tasks without
+    remaining dependencies in a transaction so each task is claimed by exactly one worker, in
+    descending order of priority and then in the order they were published. Completing a task
+    successfully decrements the count of the tasks depending on it, and tasks depending on a
+    failed task are never claimed.
+
+    Workers hold a lease on the tasks they claim and renew it while the task is executed, e.g.,
+    using :meth:`keep_alive`. If a worker is killed or its host is lost, the lease expires after
+    `lease` seconds and the task is returned to the queue when the next task is claimed. The lease
+    should be much longer than the interval between renewals and the clock skew between hosts.
+
+    The database uses SQLite's default rollback journal because its write-ahead log requires
+    shared memory and does not work if workers on different hosts access the database over a
+    network filesystem. Use :code:`journal_mode="wal"` for faster claims if all workers run on
+    the same host.
+
+    Args:
+        path: Path of the database.
+        journal_mode: SQLite journal mode of the database.
+        lease: Time in seconds after which tasks whose lease has not been renewed are returned to
+            the queue.
+
+    Example:
+
+        >>> queue = WorkQueue("queue.sqlite")
+        >>> queue.publish({"a": [], "b": ["a"]})
+        >>> queue.claim("worker")
+        'a'
+        >>> queue.claim("worker") is None
+        True
+        >>> queue.complete("a", 0)
+        >>> queue.claim("worker")
+        'b'
+        >>> queue.counts()
+        {'done': 1, 'running': 1}
+    """
+    def __init__(self, path: str, journal_mode: str = "delete", lease: float = 300) -> None:
+        self.path = os.path.abspath(path)
+        self.journal_mode = journal_mode
+        self.lease = lease
+        # The journal mode cannot be changed within a transaction.
+        with contextlib.closing(sqlite3.connect(self.path, timeout=60)) as connection:
+            connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS tasks (position INTEGER PRIMARY KEY, "
+                               "name TEXT UNIQUE NOT NULL, priority REAL NOT NULL, "
+                               "remaining INTEGER NOT NULL, status TEXT NOT NULL, worker TEXT, "
+                               "started REAL, finished REAL, returncode INTEGER, "
+                               "heartbeat REAL)")
+            # Add the lease to queues created by earlier versions.
+            if "heartbeat" not in {row[1] for row in
+                                   connection.execute("PRAGMA table_info(tasks)")}:
+                connection.execute("ALTER TABLE tasks ADD COLUMN heartbeat REAL")
+            connection.execute("CREATE INDEX IF NOT EXISTS ready ON tasks (status, remaining, "
+                               "priority DESC, position)")
+            connection.execute("CREATE TABLE IF NOT EXISTS deps (task TEXT NOT NULL, "
+                               "dep TEXT NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS dependents ON deps (dep)")
+
+    def _connect(self) -> ContextManager[sqlite3.Connection]:
+        # Transactions acquire the write lock immediately so no two workers claim the same task.
+        return sqlite_transaction(self.path, immediate=True)
+
+    def publish(self, graph: Mapping[str, Iterable[str]],
+                priority: Mapping[str, float] = None) -> None:
+        """
+        Replace the tasks in the queue.
+
+        Args:
+            graph: Names of the tasks each task depends on keyed by task name in the order tasks
+                should be claimed if they have the same priority. Dependencies on tasks not in
+                the graph are ignored.
+            priority: Priority of tasks keyed by name, e.g., the length of the critical path
+                starting at each task (see :func:`.durations.critical_path`).
+        """
+        priority = priority or {}
+        deps = {name: set(graph[name]) & graph.keys() for name in graph}
+        with self._connect() as connection:
+            connection.execute("DELETE FROM tasks")
+            connection.execute("DELETE FROM deps")
+            connection.executemany(
+                "INSERT INTO tasks (name, priority, remaining, status) VALUES (?, ?, ?, 'pending')",
+                [(name, priority.get(name, 0), len(deps[name])) for name in graph],
+            )
+            connection.executemany("INSERT INTO deps VALUES (?, ?)",
+                                   [(name, dep) for name in graph for dep in deps[name]])
+
+    def claim(self, worker: str) -> Optional[str]:
+        """
+        Claim the pending task with the highest priority whose dependencies have completed after
+        returning tasks whose lease has expired to the queue.
+
+        Args:
+            worker: Identifier of the worker claiming the task.
+
+        Returns:
+            name: Name of the claimed task or `None` if no task is ready.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("UPDATE tasks SET status = 'pending', worker = NULL, "
+                               "started = NULL, heartbeat = NULL WHERE status = 'running' AND "
+                               "COALESCE(heartbeat, started) < ?", (now - self.lease,))
+            row = connection.execute("SELECT name FROM tasks WHERE status = 'pending' AND "
+                                     "remaining = 0 ORDER BY priority DESC, position "
+                                     "LIMIT 1").fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE tasks SET status = 'running', worker = ?, started = ?, "
+                               "heartbeat = ? WHERE name = ?", (worker, now, now, row[0]))
+        return row[0]
+
+    def renew(self, name: str, worker: str) -> bool:
+        """
+        Renew the lease on a claimed task.
+
+        Args:
+            name: Name of the task.
+            worker: Identifier of the worker that claimed the task.
+
+        Returns:
+            renewed: Whether the worker still holds the lease, i.e., the task has not been
+                returned to the queue because the lease expired.
+        """
+        with self._connect() as connection:
+            return bool(connection.execute(
+                "UPDATE tasks SET heartbeat = ? WHERE name = ? AND worker = ? AND "
+                "status = 'running'", (time.time(), name, worker)).rowcount)
+
+    @contextlib.contextmanager
+    def keep_alive(self, name: str, worker: str, interval: float = None) -> Iterator[None]:
+        """
+        Renew the lease on a claimed task in a background thread until the context exits.
+
+        Args:
+            name: Name of the task.
+            worker: Identifier of the worker that claimed the task.
+            interval: Time in seconds between renewals (defaults to a third of the lease).
+        """
+        interval = self.lease / 3 if interval is None else interval
+        stop = threading.Event()
+
+        def _renew() -> None:
+            while not stop.wait(interval):
+                self.renew(name, worker)
+
+        thread = threading.Thread(target=_renew, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, name: str, returncode: int) -> None:
+        """
+        Record the completion of a claimed task. Completions of tasks that are not running, e.g.,
+        because another worker completed the task after its lease expired, are ignored so
+        dependent tasks are not released twice.
+
+        Args:
+            name: Name of the task.
+            returncode: Status code of executing the task; zero indicates success.
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE tasks SET status = ?, finished = ?, returncode = ? WHERE name = ? AND "
+                "status = 'running'",
+                ("failed" if returncode else "done", time.time(), returncode, name))
+            if cursor.rowcount and not returncode:
+                connection.execute("UPDATE tasks SET remaining = remaining - 1 WHERE name IN "
+                                   "(SELECT task FROM deps WHERE dep = ?)", (name,))
+
+    def requeue(self, worker: str = None) -> int:
+        """
+        Return running tasks to the queue, e.g., after their worker crashed.
+
+        Args:
+            worker: Only return tasks claimed by this worker (defaults to all running tasks).
+
+        Returns:
+            num_tasks: Number of tasks returned to the queue.
+        """
+        query = "UPDATE tasks SET status = 'pending', worker = NULL, started = NULL, " \
+            "heartbeat = NULL WHERE status = 'running'"
+        with self._connect() as connection:
+            if worker is None:
+                return connection.execute(query).rowcount
+            return connection.execute(f"{query} AND worker = ?", (worker,)).rowcount
+
+    def is_finished(self) -> bool:
+        """
+        Check whether no task is running and no pending task can be claimed, i.e., all tasks have
+        completed or depend on failed tasks. Tasks whose lease has expired are still running
+        until they are returned to the queue by :meth:`claim`.
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT 1 FROM tasks WHERE status = 'running' OR "
+                                     "(status = 'pending' AND remaining = 0) LIMIT 1").fetchone()
+        return row is None
+
+    def counts(self) -> dict[str, int]:
+        """
+        Count the tasks in the queue by status: :code:`pending`, :code:`running`, :code:`done`,
+        or :code:`failed`.
+        """
+        with self._connect() as connection:
+            return dict(connection.execute(
+                "SELECT status, COUNT(*) FROM tasks GROUP BY status ORDER BY status"))
+
+
+def default_worker_id() -> str:
+    """
+    Get an identifier of the current process that is unique across hosts.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
@@ -21,7 +21,7 @@ for pattern, repl in substitutions:
 setup(
     name="doit_interface",
     description="A functional interface for creating doit tasks",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     version=VERSION,
     install_requires=[
         "colorama",
@@ -46,6 +46,7 @@ setup(
     entry_points={
         "doit.REPORTER": [
             "doit_interface = doit_interface.reporters:DoitInterfaceReporter",
+            "doit_interface_progress = doit_interface.reporters:ProgressReporter",
         ],
     },
 )
@@ -1,6 +1,8 @@
 import doit_interface as di
+from doit_interface.actions import _TailBuffer
 import os
 import pytest
+import shutil
 import sys
 from unittest import mock
 from .conftest import get_mocked_stdout
@@ -83,7 +85,6 @@ def test_subprocess_substitutions(manager: di.Manager, shell: bool):
         ("no_multiple_deps", ["$^"], {}),
         ("interpreter", ["$!"], {}),
         ("target", ["$@"], {"targets": ["target1", "target2"]}),
-        ("single_dep", ["$<"], {"file_dep": ["dep1", "dep2"]}),
         ("multiple_dep", ["$^"], {"file_dep": ["dep1", "dep2"]}),
         ("name_sub", ["echo", "hello {name}"], {}),
     ]
@@ -93,12 +94,18 @@ def test_subprocess_substitutions(manager: di.Manager, shell: bool):
     for task in ["no_target", "no_multiple_deps"]:
         assert manager.run([task]) == 3
 
+    # First dependency substitution is rejected when the action is created.
+    with pytest.raises(ValueError, match="first dependency substitution is not supported"):
+        di.SubprocessAction(_maybe_join(["$<"]))
+
     with mock.patch("subprocess.check_call") as check_call, \
             mock.patch("os.path.isfile", return_value=True) as isfile:
         assert not manager.run(["interpreter"])
         check_call.assert_called_once()
-        (args, *_), _ = check_call.call_args
-        assert args == _maybe_join([sys.executable])
+        (args, *_), kwargs = check_call.call_args
+        # Simple shell commands are launched without a shell.
+        assert args == [sys.executable]
+        assert not kwargs["shell"] and kwargs["executable"] == sys.executable
         check_call.reset_mock()
 
         assert not manager.run(["target"])
@@ -109,12 +116,6 @@ def test_subprocess_substitutions(manager: di.Manager, shell: bool):
         assert {call_args[0] for call_args, _ in isfile.call_args_list} == {"target1", "target2"}
         isfile.reset_mock()
 
-        with mock.patch("sys.stderr.write") as write:
-            assert manager.run(["single_dep"]) == 3
-        assert "first dependency substitution is not supported" in get_mocked_stdout(write)
-        check_call.assert_not_called()
-        check_call.reset_mock()
-
         assert not manager.run(["multiple_dep"])
         check_call.assert_called_once()
         (args, *_), _ = check_call.call_args
@@ -129,6 +130,125 @@ def test_subprocess_substitutions(manager: di.Manager, shell: bool):
         check_call.reset_mock()
 
 
+@pytest.mark.parametrize("template, message", [
+    ("{unknown}", "`unknown` is not a valid attribute of tasks"),
+    ("{0}", "`0` is not a valid attribute of tasks"),
+    ("{name", "invalid template"),
+    ("{name:{unknown}}", "`unknown` is not a valid attribute of tasks"),
+])
+def test_subprocess_invalid_template(template: str, message: str):
+    with pytest.raises(ValueError, match=message):
+        di.SubprocessAction(template)
+    with pytest.raises(ValueError, match=message):
+        di.SubprocessAction(["echo", template])
+    with pytest.raises(ValueError, match=message):
+        di.SubprocessAction("true", log=template)
+
+
+def test_subprocess_template(manager: di.Manager):
+    manager(basename="task", doc="docs", actions=[
+        di.SubprocessAction(["echo", "{{literal}}", "{name}-{doc!r:>8}", "{targets[0]}"])],
+        targets=["target"])
+    with mock.patch("subprocess.check_call") as check_call, \
+            mock.patch("os.path.isfile", return_value=True):
+        assert not manager.run()
+    (args, *_), _ = check_call.call_args
+    assert args == ["echo", "{literal}", "task-  'docs'", "target"]
+
+
+def test_subprocess_check_task(manager: di.Manager):
+    with di.SubprocessAction.use_as_default():
+        with pytest.raises(ValueError, match="`no_target` substitutes `\\$@`"):
+            manager(basename="no_target", actions=["touch $@"])
+        with pytest.raises(ValueError, match="`no_dep` substitutes `\\$\\^`"):
+            manager(basename="no_dep", actions=[di.SubprocessAction(["cat", "$^"])])
+        # Dependencies may be calculated at run time.
+        manager(basename="calc_dep", actions=["cat $^"], calc_dep=["other"])
+        manager(basename="valid", actions=["cp $^ $@", print], file_dep=["a"], targets=["b"])
+
+
+@pytest.mark.parametrize("command, argv", [
+    ("true", ["true"]),
+    ("true 'a b' \"c d\" --flag=value", ["true", "a b", "c d", "--flag=value"]),
+    ("true | cat", None),
+    ("true > file", None),
+    ("true *.txt", None),
+    ("true $HOME", None),
+    ("true ~", None),
+    ("true 'unterminated", None),
+    ("cd /", None),
+    ("VAR=value true", None),
+    ("", None),
+    ("program-that-does-not-exist", None),
+])
+def test_subprocess_split_command(manager: di.Manager, command: str, argv: list):
+    manager(basename="task", actions=[di.SubprocessAction(command)])
+    with mock.patch("subprocess.check_call") as check_call:
+        assert not manager.run()
+    (args, *_), kwargs = check_call.call_args
+    if argv is None:
+        assert args == command and kwargs["shell"]
+    else:
+        assert args == argv and not kwargs["shell"] and not kwargs["close_fds"]
+        assert kwargs["executable"] == shutil.which("true")
+
+
+@pytest.mark.parametrize("kwargs", [{"shell": True}, {"executable": "/bin/true"}, {"cwd": "."}])
+def test_subprocess_split_command_explicit(manager: di.Manager, kwargs: dict):
+    manager(basename="task", actions=[di.SubprocessAction("true", **kwargs)])
+    with mock.patch("subprocess.check_call") as check_call:
+        assert not manager.run()
+    (args, *_), actual = check_call.call_args
+    assert args == "true" and actual["shell"]
+
+
+def test_subprocess_split_command_run(manager: di.Manager):
+    manager(basename="task", actions=[di.SubprocessAction("touch 'a b.txt' \"$@\"")],
+            targets=["c.txt"])
+    assert not manager.run()
+    assert os.path.isfile("a b.txt") and os.path.isfile("c.txt")
+
+
+def test_subprocess_env_cache():
+    first = di.SubprocessAction([])
+    second = di.SubprocessAction([], env={"PATH": None, "OTHER_VAR": 3})
+    env = first._get_env()
+    # The shared environment is reused until the environment changes.
+    assert first._get_env() is env
+    assert second._get_env() == {**{key: value for key, value in env.items() if key != "PATH"},
+                                 "OTHER_VAR": "3"}
+    try:
+        os.environ["doit_interface_TEST_VAR"] = "VALUE"
+        assert first._get_env()["doit_interface_TEST_VAR"] == "VALUE"
+        os.environ["doit_interface_TEST_VAR"] = "OTHER"
+        assert first._get_env()["doit_interface_TEST_VAR"] == "OTHER"
+        di.SubprocessAction.get_global_env()["doit_interface_TEST_VAR"] = "GLOBAL"
+        assert first._get_env()["doit_interface_TEST_VAR"] == "GLOBAL"
+        env = first._get_env()
+        assert first._get_env() is env
+        # Global variables are also used if the environment is not inherited.
+        assert di.SubprocessAction([], inherit_env=False)._get_env() == \
+            {"doit_interface_TEST_VAR": "GLOBAL"}
+    finally:
+        os.environ.pop("doit_interface_TEST_VAR")
+        di.SubprocessAction.set_global_env({})
+    assert "doit_interface_TEST_VAR" not in first._get_env()
+
+
+def test_subprocess_env_python_action(manager: di.Manager):
+    # Changes to the environment made by earlier actions are passed to later subprocesses.
+    manager(basename="task", actions=[
+        (os.environ.__setitem__, ["doit_interface_TEST_VAR", "VALUE"]),
+        di.SubprocessAction("echo $doit_interface_TEST_VAR > output.txt", shell=True),
+    ])
+    try:
+        assert not manager.run()
+    finally:
+        os.environ.pop("doit_interface_TEST_VAR", None)
+    with open("output.txt") as fp:
+        assert fp.read().strip() == "VALUE"
+
+
 def test_subprocess_invalid_args(manager: di.Manager):
     manager(basename="task", actions=[di.SubprocessAction(74)])
     with mock.patch("sys.stderr.write") as write:
@@ -162,3 +282,38 @@ def test_target_not_created(manager: di.Manager, check_targets: bool, create_tar
     manager(basename="task", actions=[action], targets=["target"])
     expected = 1 if not create_target and check_targets else 0
     assert manager.run() == expected
+
+
+@pytest.mark.parametrize("par_type", ["serial", "process", "asyncio"])
+def test_subprocess_log(manager: di.Manager, par_type: str):
+    code = "import sys; [print(i) for i in range(100)]; print('error', file=sys.stderr, end=''); " \
+        "sys.exit(int(sys.argv[1]))"
+    for status in [0, 1]:
+        manager(basename=f"status{status}", actions=[
+            di.SubprocessAction(["$!", "-c", code, str(status)], log="logs/{name}.log", tail=3)])
+    args = [] if par_type == "serial" else ["-n", "2", "-P", par_type]
+
+    with mock.patch("sys.stdout.write") as write:
+        assert manager.run(args, DOIT_CONFIG={"reporter": di.DoitInterfaceReporter}) == 1
+    stdout = get_mocked_stdout(write)
+    assert "last lines of logs/status1.log:\n98\n99\nerror\n" in stdout
+    assert "status0.log" not in stdout
+    for status in [0, 1]:
+        with open(f"logs/status{status}.log") as fp:
+            lines = fp.read().splitlines()
+        assert len(lines) == 101
+        assert lines[-1] == "error"
+
+
+def test_tail_buffer():
+    tail = _TailBuffer(2)
+    assert tail.text() == ""
+    for chunk in [b"first\nsec", b"ond\n", b"third\nfou"]:
+        tail.feed(chunk)
+    assert tail.text() == "third\nfou\n"
+    tail.feed(b"x" * 2 * tail.MAX_LINE_LENGTH)
+    assert len(tail.partial) == tail.MAX_LINE_LENGTH
+
+    tail = _TailBuffer(None)
+    tail.feed(b"a\nb\n")
+    assert tail.text() == "a\nb\n"
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import doit_interface as di
+import os
+import pytest
+import sys
+from unittest import mock
+from .conftest import get_mocked_stdout
+
+
+# Create all targets except `skip.txt` and record the number of targets of each batch.
+CODE = """
+import sys
+for target in sys.argv[2:]:
+    if target != "skip.txt":
+        open(target, "w").close()
+with open("batches.txt", "a") as fp:
+    print(sys.argv[1], len(sys.argv) - 2, file=fp)
+"""
+
+
+def _read_batches() -> list[tuple[str, int]]:
+    with open("batches.txt") as fp:
+        return sorted((prefix, int(size)) for prefix, size in map(str.split, fp))
+
+
+@pytest.mark.parametrize("par_type", ["serial", "thread", "asyncio"])
+def test_batch_action(manager: di.Manager, par_type: str):
+    for i in range(10):
+        with open(f"{i}.in", "w") as fp:
+            fp.write(str(i))
+        manager(basename="task", name=str(i), file_dep=[f"{i}.in"], targets=[f"{i}.txt"],
+                actions=[di.BatchAction(["$!", "-c", CODE, "task"], "$@", batch_size=4)])
+    args = [] if par_type == "serial" else ["-n", "10", "-P", par_type]
+    assert not manager.run(args)
+    assert all(os.path.isfile(f"{i}.txt") for i in range(10))
+    batches = _read_batches()
+    if par_type == "serial":
+        assert batches == [("task", 1)] * 10
+    else:
+        assert batches == [("task", 2), ("task", 4), ("task", 4)]
+
+    # Tasks are up to date individually.
+    os.unlink("batches.txt")
+    os.unlink("3.txt")
+    assert not manager.run(args)
+    assert _read_batches() == [("task", 1)]
+
+
+def test_batch_action_grouping(manager: di.Manager):
+    for basename in ["a", "b"]:
+        for i in range(3):
+            manager(basename=basename, name=str(i), targets=[f"{basename}{i}.txt"],
+                    actions=[di.BatchAction(["$!", "-c", CODE, basename], ["$@"])])
+    manager(basename="c", targets=["c.txt"], actions=[
+        di.BatchAction(["$!", "-c", CODE, "b"], ["$@"], env={"VAR": "value"})])
+    assert not manager.run(["-n", "10", "-P", "asyncio"])
+    assert _read_batches() == [("a", 3), ("b", 1), ("b", 3)]
+
+
+def test_batch_action_failure(manager: di.Manager):
+    for target in ["skip.txt", "other.txt"]:
+        manager(basename=target, targets=[target],
+                actions=[di.BatchAction(["$!", "-c", CODE, "batch"], ["$@"])])
+    with mock.patch("sys.stdout.write") as write:
+        assert manager.run(["--continue", "-n", "2", "-P", "thread"],
+                           DOIT_CONFIG={"reporter": di.DoitInterfaceReporter}) == 1
+    # Targets are checked for each task.
+    stdout = get_mocked_stdout(write)
+    assert "target skip.txt was not created" in stdout
+    assert "FAILED: other.txt" not in stdout
+    assert _read_batches() == [("batch", 2)]
+
+    # All tasks fail if the subprocess fails.
+    manager.clear()
+    for i in range(2):
+        manager(basename=f"fail{i}", actions=[di.BatchAction(["false"], [str(i)])])
+    with mock.patch("sys.stdout.write") as write:
+        assert manager.run(["--continue", "-n", "2", "-P", "asyncio"],
+                           DOIT_CONFIG={"reporter": di.DoitInterfaceReporter}) == 1
+    stdout = get_mocked_stdout(write)
+    assert "batch including task fail0 failed" in stdout
+    assert "batch including task fail1 failed" in stdout
+
+
+def test_batch_action_invalid():
+    with pytest.raises(ValueError, match="batch size must be positive"):
+        di.BatchAction("true", [], batch_size=0)
+    with pytest.raises(ValueError, match="first dependency substitution"):
+        di.BatchAction([sys.executable, "$<"], [])
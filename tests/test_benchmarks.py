@@ -0,0 +1,24 @@
+import benchmarks
+from benchmarks.__main__ import __main__
+import json
+
+
+def test_benchmarks_smoke():
+    assert not __main__(["--size", "3", "--repeat", "1", "--output", "results.json"])
+    with open("results.json") as fp:
+        report = json.load(fp)
+    assert {result["name"] for result in report["results"]} == set(benchmarks.BENCHMARKS)
+    assert all(result["num_items"] == 3 for result in report["results"]
+               if "size" in result["params"])
+    assert all(result["metrics"]["import_time"] > 0 for result in report["results"]
+               if result["name"] == "imports.startup")
+
+    # Compare with itself and an artificially faster baseline.
+    assert not __main__(["--size", "3", "--repeat", "1", "--filter", "bare",
+                         "--compare", "results.json", "--threshold", "1e9"])
+    for result in report["results"]:
+        result["best"] = 1e-12
+    with open("baseline.json", "w") as fp:
+        json.dump(report, fp)
+    assert __main__(["--size", "3", "--repeat", "1", "--filter", "bare",
+                     "--compare", "baseline.json"]) == 1
@@ -0,0 +1,151 @@
+import doit_interface as di
+import glob
+import os
+import pytest
+import sys
+from unittest import mock
+
+
+@pytest.fixture
+def cache():
+    cache = di.ArtifactCache("cache")
+    di.SubprocessAction.set_artifact_cache(cache)
+    assert di.SubprocessAction.get_artifact_cache() is cache
+    yield cache
+    di.SubprocessAction.set_artifact_cache(None)
+
+
+def test_cache_key(cache: di.ArtifactCache):
+    with open("input.txt", "w") as fp:
+        fp.write("input")
+    key = cache.key("cp $^ $@", {}, ["input.txt"], ["output.txt"])
+    assert key == cache.key("cp $^ $@", {}, ["input.txt"], ["output.txt"])
+    assert key != cache.key("cp $^ $@", {"VAR": "1"}, ["input.txt"], ["output.txt"])
+    assert key != cache.key(["cp", "$^", "$@"], {}, ["input.txt"], ["output.txt"])
+    # The working directory is part of the key if it is given.
+    cwd_key = cache.key("cp $^ $@", {}, ["input.txt"], ["output.txt"], "sub")
+    assert cwd_key not in {key, cache.key("cp $^ $@", {}, ["input.txt"], ["output.txt"], "other")}
+    assert cwd_key == cache.key("cp $^ $@", {}, ["input.txt"], ["output.txt"],
+                                os.path.abspath("sub"))
+    with open("input.txt", "w") as fp:
+        fp.write("modified")
+    assert key != cache.key("cp $^ $@", {}, ["input.txt"], ["output.txt"])
+
+
+@pytest.mark.parametrize("par_type", ["serial", "asyncio"])
+def test_cache_subprocess_action(manager: di.Manager, cache: di.ArtifactCache, par_type: str):
+    with open("input.txt", "w") as fp:
+        fp.write("input")
+    with di.SubprocessAction.use_as_default():
+        manager(basename="copy", file_dep=["input.txt"], targets=["outputs/output.txt"],
+                actions=["echo run >> runs.txt && mkdir -p outputs && cp $^ $@"])
+    args = [] if par_type == "serial" else ["-n", "2", "-P", par_type]
+
+    assert not manager.run(args)
+    assert cache.stats() == {"entries": 1, "size": 5, "hits": 0, "misses": 1, "stores": 1,
+                             "evictions": 0}
+
+    # Remove the target and doit's state to simulate a fresh checkout.
+    os.remove("outputs/output.txt")
+    for filename in glob.glob(".doit.db*"):
+        os.remove(filename)
+    assert not manager.run(args)
+    with open("outputs/output.txt") as fp:
+        assert fp.read() == "input"
+    with open("runs.txt") as fp:
+        assert fp.read().split() == ["run"]
+    assert cache.stats()["hits"] == 1
+
+    # Changing the input invalidates the cache.
+    with open("input.txt", "w") as fp:
+        fp.write("modified")
+    assert not manager.run(args)
+    with open("runs.txt") as fp:
+        assert fp.read().split() == ["run", "run"]
+    assert cache.stats()["entries"] == 2
+
+
+def test_cache_cwd(manager: di.Manager, cache: di.ArtifactCache):
+    # The same command creates the same target with different contents in different working
+    # directories.
+    for name in ["a", "b"]:
+        os.makedirs(name)
+        with open(os.path.join(name, "input.txt"), "w") as fp:
+            fp.write(name)
+        manager.clear()
+        manager(basename="copy", targets=["output.txt"],
+                actions=[di.SubprocessAction("cp input.txt ../output.txt", cwd=name)])
+        assert not manager.run(["--always"])
+        with open("output.txt") as fp:
+            assert fp.read() == name
+    assert cache.stats()["hits"] == 0
+
+
+def test_cache_ineligible(manager: di.Manager, cache: di.ArtifactCache):
+    manager(basename="disabled", targets=["disabled.txt"],
+            actions=[di.SubprocessAction("touch $@", cache=False)])
+    manager(basename="multiple", targets=["multiple.txt"],
+            actions=[di.SubprocessAction("touch $@"), di.SubprocessAction("true")])
+    manager(basename="no_targets", actions=[di.SubprocessAction("true")])
+    manager(basename="missing_target", targets=["missing.txt"],
+            actions=[di.SubprocessAction("true", check_targets=False)])
+    assert not manager.run([])
+    assert cache.stats()["entries"] == 0
+
+    # Missing file dependencies (e.g., if they are removed concurrently) are not cached.
+    action = di.SubprocessAction("true")
+    action.task = mock.Mock(targets=["target.txt"], file_dep=["missing.txt"], actions=[action])
+    assert action._get_cache_key("true") is None
+
+
+def test_cache_store_failure(manager: di.Manager, cache: di.ArtifactCache):
+    manager(basename="task", targets=["output.txt"], actions=[di.SubprocessAction("touch $@")])
+    with mock.patch.object(cache, "store", side_effect=OSError("disk full")), \
+            pytest.warns(UserWarning, match="disk full"):
+        assert not manager.run([])
+
+
+@pytest.mark.parametrize("method", ["reflink", "hardlink", "copy"])
+def test_cache_methods(method: str):
+    cache = di.ArtifactCache("cache", methods=[method])
+    with open("output.txt", "w") as fp:
+        fp.write("output")
+    try:
+        cache.store("key", ["output.txt"])
+    except OSError:
+        assert method == "reflink" and sys.platform != "darwin"
+        pytest.skip("file system does not support reflinks")
+    os.remove("output.txt")
+    assert cache.restore("key", ["output.txt"])
+    with open("output.txt") as fp:
+        assert fp.read() == "output"
+    # Targets are stored by copy if only hardlinks are allowed but restored by hardlink.
+    assert (os.stat("output.txt").st_nlink == 2) == (method == "hardlink")
+
+
+def test_cache_restore_evicted(cache: di.ArtifactCache):
+    with open("output.txt", "w") as fp:
+        fp.write("output")
+    cache.store("key", ["output.txt"])
+    os.remove(os.path.join(cache._path("key"), "0"))
+    assert not cache.restore("key", ["output.txt"])
+    assert cache.stats()["misses"] == 1
+
+
+def test_cache_eviction():
+    cache = di.ArtifactCache("cache", max_size=25)
+    for i in range(3):
+        with open(f"output{i}.txt", "w") as fp:
+            fp.write("x" * 10)
+        cache.store(f"key{i}", [f"output{i}.txt"])
+        # Access the first entry so the second entry is evicted.
+        assert cache.restore("key0", ["restored.txt"])
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+    assert not cache.restore("key1", ["restored.txt"])
+    assert cache.restore("key2", ["restored.txt"])
+
+
+def test_cache_invalid_method():
+    with pytest.raises(ValueError, match="invalid methods"):
+        di.ArtifactCache("cache", methods=["symlink"])
@@ -0,0 +1,144 @@
+import doit_interface as di
+import os
+import pickle
+import pytest
+from unittest import mock
+
+
+class SmallBlockChecker(di.HashChecker):
+    BLOCK_SIZE = 16
+
+
+@pytest.mark.parametrize("size", [0, 10, 16, 100])
+def test_hash_file(size: int):
+    with open("data.bin", "wb") as fp:
+        fp.write(os.urandom(size))
+    checker = SmallBlockChecker()
+    digest = checker.hash_file("data.bin")
+    # Digests of small files are plain digests.
+    assert (digest == di.HashChecker().hash_file("data.bin")) == (size <= 16)
+    # Digests must not depend on the thread pool.
+    os.unlink(checker.memo_path)
+    assert SmallBlockChecker().hash_file("data.bin") == digest
+
+
+def test_hash_file_memo():
+    with open("data.txt", "w") as fp:
+        fp.write("hello")
+    checker = di.HashChecker()
+    digest = checker.hash_file("data.txt")
+    stat = os.stat("data.txt")
+    # Digests are only written to the memo when the checker is flushed.
+    assert not di.HashChecker()._lookup(os.path.abspath("data.txt"), checker._get_key(stat))
+    checker.flush()
+
+    # Change the contents but restore the modification time so the memoized digest is used.
+    with open("data.txt", "w") as fp:
+        fp.write("world")
+    os.utime("data.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert di.HashChecker().hash_file("data.txt") == digest
+
+    # Modify the file so it is hashed again.
+    os.utime("data.txt", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert checker.hash_file("data.txt") != digest
+
+
+def test_check_modified_and_get_state():
+    with open("data.txt", "w") as fp:
+        fp.write("hello")
+    checker = di.HashChecker()
+    state = checker.get_state("data.txt", None)
+    assert checker.get_state("data.txt", state) is None
+    assert not checker.check_modified("data.txt", os.stat("data.txt"), state)
+
+    # Same size and contents but different modification time.
+    os.utime("data.txt", (0, 0))
+    assert not checker.check_modified("data.txt", os.stat("data.txt"), state)
+    assert checker.get_state("data.txt", state) != state
+
+    # Same size but different contents.
+    with open("data.txt", "w") as fp:
+        fp.write("world")
+    os.utime("data.txt", (1, 1))
+    assert checker.check_modified("data.txt", os.stat("data.txt"), state)
+
+    # Different size.
+    with open("data.txt", "w") as fp:
+        fp.write("hello world")
+    assert checker.check_modified("data.txt", os.stat("data.txt"), state)
+
+
+def test_prefetch():
+    for i in range(5):
+        with open(f"data{i}.txt", "w") as fp:
+            fp.write(f"hello {i}")
+    os.mkdir("large")
+    with open("large/data.bin", "wb") as fp:
+        fp.write(os.urandom(100))
+    checker = SmallBlockChecker()
+    state = checker.get_state("data0.txt", None)
+    checker.flush()
+    checker = SmallBlockChecker()
+    deps = [(f"data{i}.txt", None) for i in range(1, 5)]
+    checker.PREFETCH_CHUNK_SIZE = 3
+    with mock.patch.object(checker, "_hash_small_files", wraps=checker._hash_small_files) \
+            as hash_:
+        # Unchanged, large, and missing files are skipped.
+        checker.prefetch([*deps, ("data0.txt", state), ("large/data.bin", None),
+                          ("missing.txt", None)])
+    assert [[os.path.basename(path) for path in paths] for (paths,), _ in hash_.call_args_list] \
+        == [["data1.txt", "data2.txt", "data3.txt"], ["data4.txt"]]
+    with mock.patch.object(checker, "_hash_small_files") as hash_:
+        checker.prefetch(deps)
+        assert checker.get_state("data1.txt", None)[2] == \
+            di.HashChecker().hash_file("data1.txt")
+    hash_.assert_not_called()
+
+    # Files removed while they are hashed are skipped.
+    assert checker._hash_small_files(["missing.txt"]) == [None]
+    with mock.patch.object(checker, "_hash_small_files", side_effect=lambda paths: [None] * 3):
+        checker._pending.clear()
+        checker.prefetch(deps)
+    assert not checker._pending
+
+    # Digests are written in a single transaction when the interpreter exits.
+    checker.prefetch(deps)
+    di.checkers._flush_checkers()
+    assert not checker._pending
+    checker.flush()
+    assert SmallBlockChecker()._lookup(os.path.abspath("data1.txt"),
+                                       checker._get_key(os.stat("data1.txt")))
+
+
+def test_pickle():
+    checker = SmallBlockChecker()
+    with open("data.bin", "wb") as fp:
+        fp.write(os.urandom(100))
+    checker.hash_file("data.bin")
+    other = pickle.loads(pickle.dumps(checker))
+    assert other._connection is None and other._executor is None and not other._pending
+    assert other.hash_file("data.bin") == checker.hash_file("data.bin")
+
+
+def test_checker_run(manager: di.Manager):
+    with open("input.txt", "w") as fp:
+        fp.write("hello")
+    manager(basename="copy", actions=["cp input.txt output.txt && echo run >> runs.txt"],
+            file_dep=["input.txt"], targets=["output.txt"])
+    config = {"check_file_uptodate": di.HashChecker}
+
+    def _num_runs():
+        assert not manager.run([], DOIT_CONFIG=config)
+        with open("runs.txt") as fp:
+            return len(fp.readlines())
+
+    assert _num_runs() == 1
+    # Digests are written to the memo at the end of the run.
+    assert di.HashChecker()._lookup(os.path.abspath("input.txt"),
+                                    di.HashChecker()._get_key(os.stat("input.txt")))
+    # Touching the file does not rerun the task.
+    os.utime("input.txt", (0, 0))
+    assert _num_runs() == 1
+    with open("input.txt", "w") as fp:
+        fp.write("world")
+    assert _num_runs() == 2
@@ -1,8 +1,12 @@
 import doit_interface as di
+from doit.cmd_base import ModuleTaskLoader
+from doit.doit_cmd import DoitMain
+from doit_interface import contexts
 from doit_interface.contexts import _BaseContext
 import os
 import pathlib
 import pytest
+import shutil
 from unittest import mock
 from .conftest import get_mocked_stdout
 
@@ -41,15 +45,84 @@ def test_group(manager: di.Manager):
     assert os.path.isfile("file2")
 
 
+def test_group_fan_in(manager: di.Manager):
+    # Groups are not split by default.
+    assert di.group_tasks("default", manager=manager).fan_in is None
+    with di.group_tasks("group", fan_in=3) as group:
+        for i in range(10):
+            manager(basename=f"task{i}", actions=[f"touch file{i}"])
+            # Membership is checked using the index so members are only added once.
+            group._declared(manager.tasks[-1])
+    assert len(group["task_dep"]) == 10
+    assert str(group).endswith("with 10 tasks aggregated by 6 intermediate tasks")
+
+    tasks = {task["basename"]: task for task in manager.create_doit_tasks()}
+    # Ten tasks are aggregated by four tasks with three or two dependencies each, which are
+    # aggregated by two tasks.
+    assert [tasks[f"_group.{i}"]["task_dep"] for i in range(6)] == [
+        ["task0", "task1"], ["task2", "task3", "task4"], ["task5", "task6"],
+        ["task7", "task8", "task9"], ["_group.0", "_group.1"], ["_group.2", "_group.3"],
+    ]
+    assert tasks["group"]["task_dep"] == ["_group.4", "_group.5"]
+    assert len(group["task_dep"]) == 10
+
+    with mock.patch("sys.stdout.write") as write:
+        assert not manager.run(["group"])
+        assert not manager.run(["list"])
+    assert all(os.path.isfile(f"file{i}") for i in range(10))
+    assert "_group" not in get_mocked_stdout(write)
+
+
+def test_group_invalid_fan_in(manager: di.Manager):
+    with pytest.raises(ValueError, match="fan-in must be at least two"):
+        di.group_tasks("group", fan_in=1)
+
+
 def test_create_target_dirs(manager: di.Manager):
     with di.create_target_dirs():
         task = manager(basename="basename", name="bar", targets=["foo/bar"],
                        actions=["touch foo/bar"])
+        other = manager(basename="basename", name="baz", targets=["foo/baz/qux", "top"],
+                        actions=["touch foo/baz/qux top"])
     assert len(task["actions"]) == 2
+    # Tasks share the action.
+    assert task["actions"][0] is other["actions"][0]
+
+    # Directories are created once before tasks are executed, and the actions are removed.
+    for _ in range(2):
+        with mock.patch("os.makedirs", wraps=os.makedirs) as makedirs, \
+                mock.patch.object(contexts, "_create_parent_dirs") as create_parent_dirs:
+            assert not manager.run(["--always"])
+        # `os.makedirs` calls itself to create missing parents.
+        assert makedirs.call_args_list == [mock.call("foo/baz", exist_ok=True),
+                                           mock.call("foo", exist_ok=True)]
+        create_parent_dirs.assert_not_called()
+        assert os.path.isfile("foo/bar")
+        # Directories are created again in the next run.
+        shutil.rmtree("foo")
+
+    # Directories are created by the tasks if they are executed without the manager's command.
+    assert not DoitMain(ModuleTaskLoader({"manager": manager})).run(["--always"])
+    assert os.path.isfile("foo/baz/qux")
+
+
+def test_create_target_dirs_selected(manager: di.Manager):
+    with di.create_target_dirs():
+        manager(basename="first", targets=["first/a.txt"], actions=["touch first/a.txt"])
+        manager(basename="second", targets=["second/b.txt"], file_dep=["first/a.txt"],
+                actions=["touch second/b.txt"])
+        manager(basename="other", targets=["other/c.txt"], actions=["touch other/c.txt"])
+    # Only directories of the selected task and its dependencies are created, even if all tasks
+    # are loaded because the selection contains a wildcard.
+    assert not manager.run(["sec*"])
+    assert os.path.isfile("second/b.txt")
+    assert not os.path.exists("other")
 
-    assert not manager.run()
-    assert os.path.isdir("foo")
-    assert os.path.isfile("foo/bar")
+
+def test_create_dirs():
+    with mock.patch("os.makedirs") as makedirs:
+        contexts.create_target_dirs.create_dirs(["a/b", "a/b/c", "a/b-x", "d", "a"])
+    assert [call.args[0] for call in makedirs.call_args_list] == ["a/b/c", "a/b-x", "d"]
 
 
 def test_missing_target_dir(manager: di.Manager):
@@ -128,3 +201,59 @@ def test_prefix(manager: di.Manager):
         task = manager(basename="value")
         assert task["basename"] == "prefix_value"
         assert "not_a_property" not in task
+
+
+def test_fused_context_stack(manager: di.Manager):
+    with di.defaults(basename="outer", doc="outer"), di.defaults(doc="inner"), \
+            di.path_prefix("a"), di.path_prefix(targets="b"), di.prefix(name="x_"), \
+            di.prefix(name="y_", basename="base_"):
+        # Adjacent defaults and prefixes with the same operation are merged.
+        assert len(manager._get_pipeline()) == 3
+        task = manager(name="name", targets=["file.txt"], file_dep=["dep.txt"])
+        # Compare with applying each context in turn.
+        expected = {"name": "name", "targets": ["file.txt"], "file_dep": ["dep.txt"]}
+        for context in reversed(manager.context_stack):
+            expected = context(expected)
+    assert task == {**expected, "meta": task["meta"]}
+    assert task["basename"] == "outer"
+    assert task["doc"] == "inner"
+    assert task["name"] == "x_y_name"
+    assert task["targets"] == ["a/b/file.txt"]
+    assert task["file_dep"] == ["a/dep.txt"]
+
+
+def test_fused_context_stack_unmergeable(manager: di.Manager):
+    with di.prefix(basename="prefix_", op=lambda x, y: f"{x}{y}"), di.prefix(basename="other_"), \
+            di.path_prefix(pathlib.Path("a")), di.path_prefix("b"):
+        assert len(manager._get_pipeline()) == 4
+        task = manager(basename="value", targets=["file.txt"])
+    assert task["basename"] == "prefix_other_value"
+    assert task["targets"] == ["a/b/file.txt"]
+
+
+def test_fused_context_stack_invalidation(manager: di.Manager):
+    with di.defaults(basename="outer"):
+        assert manager(name="first")["basename"] == "outer"
+        with di.defaults(basename="inner"):
+            assert manager(name="second")["basename"] == "inner"
+        assert manager(name="third")["basename"] == "outer"
+        # Direct modifications of the stack are also picked up.
+        manager.context_stack.append(lambda task: {**task, "doc": "lambda"})
+        assert manager(name="fourth")["doc"] == "lambda"
+        manager.context_stack.pop()
+        assert "doc" not in manager(name="fifth")
+
+
+def test_fused_context_stack_live(manager: di.Manager):
+    with di.defaults(basename="outer") as outer, di.defaults(doc="inner") as inner, \
+            di.prefix(name="x_") as first, di.prefix(name="y_"):
+        assert len(manager._get_pipeline()) == 2
+        # Modifications of merged contexts take effect after the stack was compiled.
+        inner.defaults["doc"] = "modified"
+        outer.defaults["basename"] = "other"
+        first.kwargs["name"] = "z_"
+        task = manager(name="name")
+        assert (task["basename"], task["doc"], task["name"]) == ("other", "modified", "z_y_name")
+        # Prefixes that can no longer be combined are applied in turn.
+        first.op = lambda x, y: f"{x}-{y}"
+        assert manager(name="name")["name"] == "z_-y_name"
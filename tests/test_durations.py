@@ -0,0 +1,30 @@
+from doit.task import Task
+from doit_interface import durations
+
+
+def test_load_save():
+    assert durations.load() == {}
+    durations.save({"a": 1, "b": 2.5})
+    durations.save({"a": 3})
+    assert durations.load() == {"a": 3, "b": 2.5}
+
+
+def test_critical_path():
+    tasks = [
+        Task("group", None, task_dep=["a", "b"]),
+        Task("a", ["true"], setup=["s"]),
+        Task("b", ["true"], task_dep=["a", "external"]),
+        Task("s", ["true"]),
+    ]
+    tasks = {task.name: task for task in tasks}
+    assert durations.critical_path(tasks, {}) == {"group": 0, "a": 2, "b": 1, "s": 3}
+    assert durations.critical_path(tasks, {"a": 4, "b": 2}) == \
+        {"group": 0, "a": 6, "b": 2, "s": 9}
+
+
+def test_critical_path_cycle():
+    tasks = [Task("a", ["true"], task_dep=["b"]), Task("b", ["true"], task_dep=["a"]),
+             Task("c", ["true"], task_dep=["a"])]
+    # Paths are not propagated along cycles, which doit reports when it runs the tasks.
+    assert durations.critical_path({task.name: task for task in tasks}, {"c": 2}) == \
+        {"a": 4, "b": 2, "c": 2}
@@ -0,0 +1,105 @@
+import doit_interface as di
+import importlib
+import os
+import pytest
+import sys
+
+
+@pytest.fixture
+def declaration_module():
+    # Create a module that declares tasks and imports a local helper module.
+    os.mkdir("project")
+    with open("project/helper.py", "w") as fp:
+        fp.write("NUM_TASKS = 2\n")
+    with open("project/declaration.py", "w") as fp:
+        fp.write(
+            "import doit_interface as di\n"
+            "import glob\n"
+            "import helper\n"
+            "calls = 0\n"
+            "def declare():\n"
+            "    global calls\n"
+            "    calls += 1\n"
+            "    manager = di.Manager.get_instance()\n"
+            "    for i in range(helper.NUM_TASKS):\n"
+            "        manager(basename=f'task{i}', actions=['true'])\n"
+            "    for filename in sorted(glob.glob('project/data/*.txt')):\n"
+            "        manager(basename=filename, actions=['true'])\n"
+        )
+    os.mkdir("project/data")
+    sys.path.insert(0, os.path.abspath("project"))
+    try:
+        yield importlib.import_module("declaration")
+    finally:
+        sys.path.pop(0)
+        sys.modules.pop("declaration", None)
+        sys.modules.pop("helper", None)
+
+
+def _declare_cached(module, inputs=("project/data/*.txt",)):
+    with di.Manager() as manager, di.SubprocessAction.use_as_default(), \
+            di.group_tasks("group") as group:
+        manager.declare_cached(module.declare, "tasks.cache", inputs=inputs)
+    return manager, group
+
+
+def test_declare_cached(declaration_module):
+    manager, group = _declare_cached(declaration_module)
+    assert declaration_module.calls == 1
+    assert len(manager.tasks) == 3
+    assert group["task_dep"] == ["task0", "task1"]
+    assert os.path.isfile("tasks.cache")
+
+    # Load from the cache without calling the declaration code.
+    other, other_group = _declare_cached(declaration_module)
+    assert declaration_module.calls == 1
+    assert [task["basename"] for task in other.tasks] == ["group", "task0", "task1"]
+    assert isinstance(other.tasks[1]["actions"][0], di.SubprocessAction)
+    assert other.tasks[1]["meta"] == manager.tasks[1]["meta"]
+    assert other_group["task_dep"] == ["task0", "task1"]
+    assert not other.run()
+
+    # Adding an input file invalidates the cache.
+    with open("project/data/input.txt", "w") as fp:
+        fp.write("input")
+    other, _ = _declare_cached(declaration_module)
+    assert declaration_module.calls == 2
+    assert len(other.tasks) == 4
+    _declare_cached(declaration_module)
+    assert declaration_module.calls == 2
+
+    # Modifying a local module invalidates the cache.
+    with open("project/helper.py", "w") as fp:
+        fp.write("NUM_TASKS = 3\n")
+    _declare_cached(declaration_module)
+    assert declaration_module.calls == 3
+
+
+def test_declare_cached_corrupt(declaration_module):
+    with open("tasks.cache", "w") as fp:
+        fp.write("not a pickle")
+    _declare_cached(declaration_module)
+    assert declaration_module.calls == 1
+
+    # Different input patterns invalidate the cache.
+    _declare_cached(declaration_module, inputs=["*.csv"])
+    assert declaration_module.calls == 2
+
+
+def test_declare_cached_unpicklable(manager: di.Manager):
+    def declare():
+        manager(basename="task", actions=[lambda: None])
+
+    with pytest.warns(UserWarning, match="could not be cached"):
+        tasks = manager.declare_cached(declare, "tasks.cache")
+    assert len(tasks) == 1
+    assert not os.path.exists("tasks.cache")
+
+
+def test_declare_cached_lazy(manager: di.Manager):
+    def declare():
+        manager.lazy(lambda: [{"basename": "lazy", "actions": []}])
+
+    assert manager.declare_cached(declare, "tasks.cache") == []
+    tasks = manager.declare_cached(declare, "tasks.cache")
+    assert [task["basename"] for task in tasks] == ["lazy"]
@@ -0,0 +1,22 @@
+import doit_interface as di
+import os
+import pytest
+import subprocess
+import sys
+
+
+def test_lazy_attributes():
+    assert set(di.__all__) <= set(dir(di))
+    for name in di.__all__:
+        assert getattr(di, name) is not None
+    with pytest.raises(AttributeError, match="has no attribute 'missing'"):
+        di.missing
+
+
+def test_lazy_import():
+    # Importing the package and using contexts should not import doit or colorama.
+    code = "import doit_interface as di, sys; di.group_tasks; di.defaults; " \
+        "print(sorted(name for name in sys.modules if name.startswith(('doit.', 'colorama'))))"
+    root = os.path.dirname(os.path.dirname(di.__file__))
+    output = subprocess.check_output([sys.executable, "-c", code], text=True, cwd=root)
+    assert output.strip() == "[]"
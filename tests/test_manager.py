@@ -1,7 +1,11 @@
+from __future__ import annotations
+import doit_interface as di
 from doit_interface import Manager
 from doit_interface.util import NoTasksError
+import os
 import pytest
 from unittest import mock
+from .conftest import get_mocked_stdout
 
 
 def test_get_default_manager():
@@ -81,3 +85,296 @@ def test_no_tasks(manager: Manager):
 def test_no_basename(manager: Manager):
     with pytest.raises(ValueError):
         manager()
+
+
+@pytest.mark.parametrize("provenance", Manager.PROVENANCE_MODES)
+def test_provenance(provenance: str):
+    with Manager(provenance=provenance) as manager:
+        tasks = [manager(basename=f"task{i}") for i in range(2)]
+        other = manager(basename="other", meta={"key": "value"})
+    lineno = tasks[0]["meta"]["declared_at"].lineno if provenance == "lazy" else None
+
+    for task in tasks + [other]:
+        meta = task.get("meta", {})
+        if provenance == "none":
+            assert "declared_at" not in meta and "filename" not in meta
+        elif provenance == "lazy":
+            location = meta["declared_at"]
+            assert location.filename == __file__
+            assert str(location) == f"{__file__}:{location.lineno}"
+        else:
+            assert meta["filename"] == __file__
+            assert ("stack" in meta) == (provenance == "stack")
+
+    if provenance == "lazy":
+        # Tasks declared on the same line share the location and meta information.
+        assert tasks[0]["meta"] is tasks[1]["meta"]
+        assert other["meta"]["key"] == "value"
+        assert other["meta"]["declared_at"].lineno == lineno + 1
+
+
+def test_invalid_provenance():
+    with pytest.raises(ValueError, match="provenance mode"):
+        Manager(provenance="invalid")
+
+
+def test_sweep(manager: Manager):
+    with di.group_tasks("group") as group:
+        tasks = manager.sweep(
+            "train", {"seed": range(2), "lr": [0.1, 0.01]},
+            lambda seed, lr: {"targets": [f"{seed}-{lr}.pt"]},
+            actions=[["train.py"], "evaluate.py", di.SubprocessAction("true")],
+            file_dep=["data.pt"],
+        )
+    assert len(tasks) == 4
+    assert tasks == manager.tasks[1:]
+    assert len(group["task_dep"]) == 4
+    first, *_, last = tasks
+    assert first["name"] == "seed-0_lr-0.1"
+    assert first["targets"] == ["0-0.1.pt"]
+    assert first["file_dep"] == ["data.pt"]
+    assert first["actions"][:2] == [["train.py", "--seed=0", "--lr=0.1"],
+                                    "evaluate.py --seed=0 --lr=0.1"]
+    assert isinstance(first["actions"][2], di.SubprocessAction)
+    assert last["name"] == "seed-1_lr-0.01"
+    assert all(task["meta"]["filename"] == __file__ for task in tasks)
+
+
+def test_sweep_custom_name(manager: Manager):
+    tasks = manager.sweep("task", {"x": [1, 2]}, name=lambda x: f"x{x}", actions=[["run"]],
+                          append_args=False)
+    assert [task["name"] for task in tasks] == ["x1", "x2"]
+    assert all(task["actions"] == [["run"]] for task in tasks)
+    assert tasks[0]["actions"] is not tasks[1]["actions"]
+
+    # Sweeps without parameters declare a single task.
+    task, = manager.sweep("single", {}, actions=["run"])
+    assert "name" not in task
+    assert task["actions"] == ["run"]
+
+
+def test_lazy(manager: Manager):
+    def factory():
+        for i in range(2):
+            yield {"basename": f"lazy{i}", "actions": [di.SubprocessAction("touch $@")],
+                   "targets": [f"lazy{i}.txt"]}
+
+    manager(basename="first", actions=[])
+    with di.group_tasks("group") as group, di.path_prefix(targets="outputs"):
+        manager.lazy(factory)
+    manager(basename="last", actions=[])
+    # Lazy tasks are only transformed when they are loaded.
+    assert not group["task_dep"]
+    assert len(manager.tasks) == 3
+
+    for _ in range(2):
+        tasks = list(manager.create_doit_tasks())
+        assert [task["basename"] for task in tasks] == ["first", "lazy0", "lazy1", "last", "group"]
+        assert tasks[1]["targets"] == ["outputs/lazy0.txt"]
+        assert tasks[1]["meta"]["filename"] == __file__
+        assert tasks[-1]["task_dep"] == ["lazy0", "lazy1"]
+
+    os.mkdir("outputs")
+    assert not manager.run(["group"])
+    assert os.path.isfile("outputs/lazy1.txt")
+
+
+def test_lazy_group_copy(manager: Manager):
+    # Groups declared within `defaults` are stored as copies but are still deferred.
+    with di.defaults(doc="group"), di.group_tasks("group"), di.prefix(basename="prefix_"):
+        manager.lazy(lambda: [{"basename": "lazy"}])
+    tasks = list(manager.create_doit_tasks())
+    assert [task["basename"] for task in tasks] == ["prefix_lazy", "group"]
+    assert tasks[-1]["task_dep"] == ["prefix_lazy"]
+
+
+@pytest.mark.parametrize("provenance", Manager.PROVENANCE_MODES)
+def test_lazy_provenance(provenance: str):
+    with Manager(provenance=provenance) as manager:
+        manager.lazy(lambda: [{"basename": "a"}, {"basename": "b"}, {"basename": "c", "meta": {}}])
+    a, b, c = manager.create_doit_tasks()
+    if provenance == "none":
+        assert "meta" not in a
+    elif provenance == "lazy":
+        assert a["meta"] is b["meta"]
+        assert c["meta"]["declared_at"] is a["meta"]["declared_at"]
+    else:
+        assert a["meta"] is not b["meta"]
+        assert a["meta"]["filename"] == c["meta"]["filename"] == __file__
+
+
+def test_lazy_missing_basename(manager: Manager):
+    manager.lazy(lambda: [{"name": "missing"}])
+    with pytest.raises(ValueError, match="missing a basename"):
+        list(manager.create_doit_tasks())
+
+
+def test_freeze(manager: Manager):
+    task = manager(basename="task", actions=["touch task.txt"], targets=["task.txt"])
+    assert manager.freeze() is manager
+    with pytest.raises(RuntimeError, match="manager is frozen"):
+        manager(basename="other")
+    with pytest.raises(RuntimeError, match="manager is frozen"):
+        manager.sweep("other", {"x": [1]})
+    with pytest.raises(RuntimeError, match="manager is frozen"):
+        manager.lazy(list)
+
+    # Tasks are handed over without copies and released.
+    tasks = list(manager.create_doit_tasks())
+    assert tasks == [task] and tasks[0] is task
+    assert not manager.tasks
+    with pytest.raises(RuntimeError, match="already been loaded"):
+        list(manager.create_doit_tasks())
+
+    manager.clear()
+    assert not manager.frozen
+    manager(basename="task", actions=["touch task.txt"], targets=["task.txt"])
+    manager.freeze()
+    assert not manager.run()
+    assert os.path.isfile("task.txt")
+
+
+def test_duplicate_targets(manager: Manager):
+    manager(basename="first", targets=["output.txt"])
+    with pytest.raises(ValueError, match=r"target `output.txt` of task `second` declared at .*"
+                       r"is already a target of task `first` declared at .*test_manager.py"):
+        manager(basename="second", targets=["output.txt"])
+
+    # Targets modified after declaration are detected by validation.
+    task = manager(basename="third", targets=["other.txt"])
+    task["targets"].append("output.txt")
+    with pytest.raises(ValueError, match="already a target of task `first`"):
+        manager.validate()
+
+    manager.clear()
+    manager(basename="first", targets=["output.txt"])
+
+
+def test_duplicate_targets_no_side_effects(manager: Manager):
+    manager(basename="first", targets=["output/a.txt"])
+    with di.group_tasks("group") as group, di.create_target_dirs():
+        with pytest.raises(ValueError, match="already a target of task `first`"):
+            manager(basename="second", targets=["other/b.txt", "output/a.txt"])
+        manager(basename="third", actions=[])
+    # The failed declaration left no trace in the group, the manager, or its indices.
+    assert group["task_dep"] == ["third"]
+    assert "other/b.txt" not in manager._targets
+    assert "second" not in manager._positions
+    assert [task["basename"] for task in manager.tasks] == ["first", "group", "third"]
+
+
+@pytest.mark.parametrize("provenance", ["none", "lazy"])
+def test_duplicate_targets_provenance(provenance: str):
+    with Manager(provenance=provenance) as manager:
+        manager(basename="first", targets=["output.txt"])
+        with pytest.raises(ValueError, match="already a target of task `first`"):
+            manager(basename="second", targets=["output.txt"])
+
+
+@pytest.mark.parametrize("declarations, cycle", [
+    ([{"basename": "a", "task_dep": ["a"]}], "a -> a"),
+    ([{"basename": "a", "file_dep": ["b.txt"], "targets": ["a.txt"]},
+      {"basename": "b", "name": "x", "setup": ["c"], "targets": ["b.txt"]},
+      {"basename": "c", "task_dep": ["a", "external", "a*"]}], "a -> b:x -> c -> a"),
+    ([{"basename": "a", "task_dep": ["b"]},
+      {"basename": "b", "name": "x"},
+      {"basename": "b", "name": "y", "task_dep": ["a"]}], "a -> b -> b:y -> a"),
+])
+def test_validate_cycle(manager: Manager, declarations: list[dict], cycle: str):
+    for task in declarations:
+        manager(**task)
+    with pytest.raises(ValueError, match=f"cyclic dependency: {cycle}$"):
+        manager.validate()
+
+
+def test_validate_infer_task_dep(manager: Manager):
+    shared = ["d"]
+    manager(basename="a", actions=["echo a > a.txt"], targets=["a.txt"])
+    manager(basename="b", actions=["cat a.txt a.txt > b.txt"], file_dep=["a.txt", "a.txt"],
+            targets=["b.txt"], task_dep=shared)
+    manager(basename="c", actions=None, task_dep=[], file_dep=["b.txt", "a.txt"])
+    manager(basename="d", actions=None, file_dep=["a.txt"], task_dep=["a"])
+    manager.validate()
+    assert "task_dep" not in manager.tasks[0]
+    assert manager.tasks[1]["task_dep"] == ["d"]
+
+    manager.validate(infer_task_dep=True)
+    assert manager.tasks[1]["task_dep"] == ["d", "a"]
+    assert manager.tasks[2]["task_dep"] == ["b", "a"]
+    assert manager.tasks[3]["task_dep"] == ["a"]
+    # Lists shared with other tasks are not modified.
+    assert shared == ["d"]
+
+
+def _names(tasks) -> list[str]:
+    return [di.util.normalize_task_name(task) for task in tasks]
+
+
+def test_create_doit_tasks_selected(manager: Manager):
+    from doit.tools import result_dep
+
+    for i in range(3):
+        manager(basename="a", name=str(i), targets=[f"a{i}.txt"])
+    manager(basename="b", file_dep=["a1.txt", "input.txt"], targets=["b.txt"])
+    manager(basename="c", task_dep=["b"], setup=["d"], getargs={"x": ("e", "x")})
+    manager(basename="d", calc_dep=["f"])
+    manager(basename="e", uptodate=[result_dep("a"), True])
+    manager(basename="f")
+    manager(basename="unrelated")
+
+    assert _names(manager.create_doit_tasks(["b.txt"])) == ["a:1", "b"]
+    assert _names(manager.create_doit_tasks(["c"])) == \
+        ["a:0", "a:1", "a:2", "b", "c", "d", "e", "f"]
+    assert _names(manager.create_doit_tasks(["d", "f"])) == ["d", "f"]
+    # Unresolved tasks are left to doit.
+    assert len(list(manager.create_doit_tasks(["a*"]))) == 9
+    assert len(list(manager.create_doit_tasks(["missing"]))) == 9
+
+    # Tasks of a frozen manager are released.
+    manager.freeze()
+    assert _names(manager.create_doit_tasks(["b"])) == ["a:1", "b"]
+    assert manager.tasks == []
+
+
+def test_create_doit_tasks_selected_lazy(manager: Manager):
+    manager(basename="a")
+    manager.lazy(lambda: [{"basename": "b"}])
+    assert _names(manager.create_doit_tasks(["a"])) == ["a", "b"]
+
+
+def test_create_doit_tasks_selected_modified(manager: Manager):
+    # Tasks modified after they were declared are resolved without validating the manager.
+    task = manager(basename="a", targets=["a.txt"])
+    other = manager(basename="b", file_dep=["c.txt"])
+    manager(basename="c", targets=["d.txt"])
+    task["targets"] = ["c.txt"]
+    assert _names(manager.create_doit_tasks(["b"])) == ["a", "b"]
+    other["file_dep"].append("d.txt")
+    assert _names(manager.create_doit_tasks(["b"])) == ["a", "b", "c"]
+    # All tasks are left to doit if tasks share a target after they were modified.
+    task["targets"].append("d.txt")
+    assert _names(manager.create_doit_tasks(["b"])) == ["a", "b", "c"]
+    assert manager._select_positions(["b"]) is None
+
+
+def test_run_subgraph(manager: Manager):
+    for name in ["a", "b", "c"]:
+        manager(basename=name, targets=[f"{name}.txt"], actions=["touch %(targets)s"],
+                file_dep=["a.txt"] if name == "b" else [])
+    with mock.patch.object(manager, "_select_positions", wraps=manager._select_positions) \
+            as select_positions, mock.patch("sys.stdout.write"):
+        assert not manager.run(["--verbosity=0", "b"])
+        # Only commands executing tasks load a subgraph.
+        assert not manager.run(["list", "c"])
+    select_positions.assert_called_once_with(["b"])
+    assert os.path.isfile("b.txt") and not os.path.exists("c.txt")
+
+
+def test_list_undocumented(manager: Manager):
+    manager(basename="documented", doc="documentation", actions=[])
+    manager(basename="undocumented", actions=[])
+    with mock.patch("sys.stdout.write") as write:
+        assert not manager.run(["list"])
+    # The task creator does not lend its documentation to undocumented tasks.
+    assert [line.rstrip() for line in get_mocked_stdout(write).splitlines()] == \
+        ["documented     documentation", "undocumented"]
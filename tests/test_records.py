@@ -0,0 +1,98 @@
+import doit_interface as di
+import os
+import pathlib
+import pytest
+
+
+def test_task_record():
+    task = {"basename": "task", "name": "0", "actions": ["true"], "task_dep": ["other"],
+            "targets": [pathlib.Path("outputs/0/a.txt"), "outputs/0/b.txt"],
+            "file_dep": ["outputs/input.txt"], "meta": {"filename": "dodo.py", "lineno": 3},
+            "doc": "documentation"}
+    record = di.TaskRecord(task)
+    assert record.to_dict() == {**task, "targets": ["outputs/0/a.txt", "outputs/0/b.txt"]}
+    assert len(record) == 8 and di.util.normalize_task_name(record) == "task:0"
+    assert record._root == "outputs/" and record._targets == ("0/a.txt", "0/b.txt")
+    assert record.get("missing") is None and "verbosity" not in record
+    assert repr(record).startswith("TaskRecord({'basename': 'task'")
+
+    # Strings shared by tasks are stored once.
+    other = di.TaskRecord({"basename": "task", "name": "1",
+                           "file_dep": ["outputs/0/b.txt", "outputs/input.txt"]})
+    assert other["basename"] is record["basename"]
+    assert other._file_dep[0] is record._targets[1]
+
+    # Single paths are stored without a tuple.
+    assert other._root == "outputs/" and di.TaskRecord({"targets": ["a.txt"]})._targets == "a.txt"
+
+    # Changes to meta information persist.
+    record["meta"]["declared_at"] = "dodo.py:3"
+    assert record["meta"] == {"filename": "dodo.py", "lineno": 3, "declared_at": "dodo.py:3"}
+    assert record._filename is None
+
+    # Lists are modified by assignment.
+    record["targets"] = ["other/c.txt"]
+    assert record._root == "" and record["file_dep"] == ["outputs/input.txt"]
+    record["meta"] = {"filename": "dodo.py", "lineno": 3, "declared_at": "dodo.py:3"}
+    record["doc"] = "changed"
+    del record["task_dep"]
+    del record["doc"]
+    record["verbosity"] = 2
+    del record["verbosity"]
+    assert record.to_dict() == {
+        "basename": "task", "name": "0", "actions": ["true"], "file_dep": ["outputs/input.txt"],
+        "targets": ["other/c.txt"],
+        "meta": {"filename": "dodo.py", "lineno": 3, "declared_at": "dodo.py:3"},
+    }
+    del record["file_dep"]
+    del record["meta"]
+    assert list(record) == ["basename", "name", "actions", "targets"]
+    with pytest.raises(KeyError):
+        del record["meta"]
+
+
+def test_task_record_unusual_values():
+    # Values that cannot be compacted are stored as they are.
+    task = {"basename": "task", "name": None, "targets": "target.txt", "file_dep": ["a.txt"],
+            "task_dep": None, "meta": {"lineno": 3}}
+    record = di.TaskRecord(task)
+    assert record.to_dict() == task
+    assert record._extra.keys() == {"name", "targets", "file_dep", "task_dep"}
+
+
+def test_compact_manager(manager: di.Manager):
+    manager.compact = True
+    with di.SubprocessAction.use_as_default(), di.path_prefix(targets="outputs"), \
+            di.normalize_dependencies(), di.group_tasks("group") as group:
+        first = manager(basename="first", targets=["first.txt"],
+                        actions=["mkdir -p outputs && echo hello > $@"])
+        second = manager(basename="second", file_dep=[first], targets=["second.txt"],
+                         actions=["cp $^ $@"])
+    assert isinstance(first, di.TaskRecord) and isinstance(second, di.TaskRecord)
+    assert not isinstance(manager.tasks[0], di.TaskRecord)
+    assert group["task_dep"] == ["first", "second"]
+    assert second["file_dep"] == ["outputs/first.txt"]
+
+    manager.validate(infer_task_dep=True)
+    assert second["task_dep"] == ["first"]
+    assert not manager.run(["group"])
+    with open("outputs/second.txt") as fp:
+        assert fp.read().strip() == "hello"
+
+    manager.freeze()
+    tasks = list(manager.create_doit_tasks(["second"]))
+    assert all(type(task) is dict for task in tasks)
+
+
+def _declare():
+    manager = di.Manager.get_instance(strict=True)
+    manager(basename="task", targets=["outputs/a.txt"], actions=["true"])
+
+
+def test_compact_declare_cached():
+    for _ in range(2):
+        with di.Manager(compact=True) as manager:
+            tasks = manager.declare_cached(_declare, "tasks.cache")
+        assert os.path.isfile("tasks.cache")
+        assert isinstance(tasks[0], di.TaskRecord) and tasks[0] is manager.tasks[0]
+        assert manager.tasks[0]["targets"] == ["outputs/a.txt"]
@@ -1,4 +1,9 @@
+from doit.task import Task
 import doit_interface as di
+from doit_interface import durations
+from doit_interface.reporters import _to_chrome_trace
+import io
+import json
 import pytest
 import re
 from unittest import mock
@@ -14,11 +19,23 @@ def test_reporter_traceback(manager: di.Manager, with_meta: bool):
     with mock.patch("sys.stdout.write") as write:
         assert doit_main.run(["false"])
     if with_meta:
-        assert re.search(r"false \(declared at .*?test_reporters.py:10\)", get_mocked_stdout(write))
+        assert re.search(r"false \(declared at .*?test_reporters.py:15\)", get_mocked_stdout(write))
     else:
         assert re.search(r"false \(declared at <unknown>\)", get_mocked_stdout(write))
 
 
+@pytest.mark.parametrize("provenance", ["lazy", "stack"])
+def test_reporter_provenance(provenance: str):
+    with di.Manager(provenance=provenance) as manager:
+        manager(basename="false", actions=["false"])
+    doit_main = manager.doit_main(DOIT_CONFIG={"reporter": di.DoitInterfaceReporter})
+    with mock.patch("sys.stdout.write") as write:
+        assert doit_main.run(["false"])
+    stdout = get_mocked_stdout(write)
+    assert re.search(r"false \(declared at .*?test_reporters.py:30\)", stdout)
+    assert ("in test_reporter_provenance" in stdout) == (provenance == "stack")
+
+
 def test_reporter_labels(manager: di.Manager):
     manager(basename="success", actions=["true"])
     manager(basename="failed", actions=["false"])
@@ -47,3 +64,126 @@ def test_reporter_labels(manager: di.Manager):
         assert not doit_main.run(["uptodate"])
         stdout = get_mocked_stdout(write)
     assert "UP TO DATE: uptodate" in stdout
+
+
+def test_reporter_durations(manager: di.Manager):
+    class _Reporter(di.DoitInterfaceReporter):
+        DURATIONS_PATH = durations.DEFAULT_PATH
+
+    manager(basename="success", actions=["true"])
+    manager(basename="failed", actions=["false"])
+    manager(basename="group", actions=None, task_dep=["success"])
+    assert manager.run(["--continue"], DOIT_CONFIG={"reporter": _Reporter})
+    assert set(durations.load()) == {"success"}
+
+    # Durations are not recorded by default.
+    manager.clear()
+    manager(basename="other", actions=["true"])
+    assert not manager.run(DOIT_CONFIG={"reporter": di.DoitInterfaceReporter})
+    assert set(durations.load()) == {"success"}
+
+
+def test_reporter_records(manager: di.Manager):
+    class _Reporter(di.DoitInterfaceReporter):
+        EVENTS_PATH = "events.jsonl"
+        TRACE_PATH = "trace.json"
+
+    child = {"basename": "child", "actions": ["python -c 'sum(range(10 ** 6))' && touch child.txt"],
+             "targets": ["child.txt"], "uptodate": [True]}
+    manager(**child)
+    manager(basename="failed", actions=["false"])
+    assert manager.run(["--continue"], DOIT_CONFIG={"reporter": _Reporter})
+    with open("events.jsonl") as fp:
+        records = {record["name"]: record for record in map(json.loads, fp)}
+    assert records["child"]["status"] == "success"
+    assert records["child"]["end"] > records["child"]["start"] > records["child"]["check_start"]
+    assert records["child"]["check_time"] >= 0
+    assert records["child"]["user_time"] > 0
+    assert records["child"]["max_rss"] > 0
+    assert records["failed"]["status"] == "failure"
+
+    with open("trace.json") as fp:
+        trace = json.load(fp)
+    executions = [event for event in trace["traceEvents"] if event.get("cat") == "success"]
+    assert [event["name"] for event in executions] == ["child"]
+    assert executions[0]["args"]["user_time"] == records["child"]["user_time"]
+
+    # Up-to-date tasks are only checked.
+    manager.clear()
+    manager(**child)
+    assert not manager.run(DOIT_CONFIG={"reporter": _Reporter})
+    with open("events.jsonl") as fp:
+        record, = map(json.loads, fp)
+    assert record["status"] == "up-to-date" and "start" not in record
+
+
+def test_chrome_trace_lanes():
+    records = [
+        {"name": "a", "status": "success", "start": 0, "end": 2},
+        {"name": "b", "status": "success", "start": 1, "end": 3},
+        {"name": "c", "status": "failure", "start": 2, "end": 4},
+        {"name": "d", "status": "up-to-date", "check_start": 4, "check_time": 1},
+    ]
+    events = _to_chrome_trace(records)["traceEvents"]
+    assert {event["name"]: event["tid"] for event in events if event["ph"] == "X"} == \
+        {"a": 1, "b": 2, "c": 1, "d": 0}
+    assert sum(event["ph"] == "M" for event in events) == 3
+
+
+def test_progress_reporter(manager: di.Manager):
+    for i in range(3):
+        manager(basename=f"task{i}", actions=[f"touch {i}.txt"], targets=[f"{i}.txt"],
+                uptodate=[True])
+    manager(basename="failed", actions=["false"])
+    manager(basename="ignored", actions=["true"])
+    manager(basename="group", actions=None, task_dep=["task0"])
+    doit_main = manager.doit_main(DOIT_CONFIG={"reporter": di.ProgressReporter})
+    assert not doit_main.run(["ignore", "ignored"])
+
+    with mock.patch("sys.stdout.write") as write:
+        assert doit_main.run(["--continue"])
+    stdout = get_mocked_stdout(write)
+    assert "EXECUTE" not in stdout and "SUCCESS:" not in stdout
+    assert re.search(r"FAILED: failed \(declared at .*?test_reporters.py:\d+\)", stdout)
+    assert re.search(r"^6/6 tasks, 4 success, 1 failed, 1 ignored, .*? tasks/s, ETA \d+s$", stdout,
+                     re.MULTILINE)
+
+    # Up-to-date tasks with an estimate based on previous durations.
+    with mock.patch("sys.stdout.write") as write:
+        assert not doit_main.run(["task0", "task1"])
+    stdout = get_mocked_stdout(write)
+    assert re.search(r"^2/2 tasks, 2 up to date, .*? tasks/s, ETA 0s$", stdout, re.MULTILINE)
+
+
+class _Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_progress_reporter_terminal():
+    durations.save({"a": 90, "b": 3600})
+
+    class _Reporter(di.ProgressReporter):
+        DURATIONS_PATH = durations.DEFAULT_PATH
+        REFRESH_INTERVAL = 0
+
+    tasks = {name: Task(name, ["true"]) for name in ["a", "b", "c"]}
+    outstream = _Terminal()
+    reporter = _Reporter(outstream, {})
+    reporter.initialize(tasks, None)
+    assert reporter.total == 3
+    # The unknown task `c` is assumed to take the mean duration.
+    assert reporter.format_progress(0).endswith("ETA 1h32m15s")
+    for name in ["a", "b"]:
+        reporter.get_status(tasks[name])
+        reporter.execute_task(tasks[name])
+    reporter.add_success(tasks["a"])
+    # The first progress line does not need to be cleared.
+    assert re.fullmatch(r"1/3 tasks, 1 success, .*? tasks/s, ETA 45m22s", outstream.getvalue())
+    reporter.write("message\n")
+    assert outstream.getvalue().endswith("\r\033[Kmessage\n")
+    reporter.add_success(tasks["b"])
+    reporter.skip_uptodate(tasks["c"])
+    reporter.complete_run()
+    assert re.search(r"\r\033\[K3/3 tasks, 2 success, 1 up to date, .*? tasks/s, ETA 0s\n$",
+                     outstream.getvalue())
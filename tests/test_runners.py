@@ -0,0 +1,144 @@
+import doit_interface as di
+from doit_interface import durations
+from doit_interface.runners import parse_resources
+import inspect
+import os
+import pytest
+import sys
+import threading
+import time
+from unittest import mock
+from .conftest import get_mocked_stdout
+
+
+def test_parse_resources():
+    assert parse_resources("cpu=4, mem_gb=1.5,") == {"cpu": 4, "mem_gb": 1.5}
+    with pytest.raises(ValueError, match="not of the form"):
+        parse_resources("cpu")
+
+
+def test_resources_meta(manager: di.Manager):
+    lineno = inspect.currentframe().f_lineno + 1
+    task = manager(basename="task", meta={"key": "value"}, resources={"cpu": 2})
+    assert "resources" not in task
+    assert task["meta"] == {"key": "value", "resources": {"cpu": 2}, "filename": __file__,
+                            "lineno": lineno}
+    with pytest.raises(TypeError, match="must be a dictionary"):
+        manager(basename="other", resources=3)
+
+    manager.lazy(lambda: [{"basename": "lazy", "actions": [], "resources": {"cpu": 1}}])
+    lazy, = [task for task in manager.create_doit_tasks() if task["basename"] == "lazy"]
+    assert lazy["meta"]["resources"] == {"cpu": 1}
+
+
+class _Monitor:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_usage = 0
+        self.max_running = 0
+
+    def action(self, name, cpu):
+        def _action():
+            with self.lock:
+                self.running[name] = cpu
+                self.max_usage = max(self.max_usage, sum(self.running.values()))
+                self.max_running = max(self.max_running, len(self.running))
+            time.sleep(0.05)
+            with self.lock:
+                self.running.pop(name)
+        return _action
+
+
+@pytest.mark.parametrize("option", ["config", "command_line"])
+def test_resource_scheduling(manager: di.Manager, option: str):
+    monitor = _Monitor()
+    for i in range(6):
+        manager(basename=f"small{i}", actions=[monitor.action(f"small{i}", 2)],
+                resources={"cpu": 2, "other": 100})
+    manager(basename="large", actions=[monitor.action("large", 8)], resources={"cpu": 8})
+    manager(basename="free", actions=[monitor.action("free", 0)])
+
+    args = ["-n", "8", "-P", "thread"]
+    if option == "config":
+        assert not manager.run(args, DOIT_CONFIG={"resources": {"cpu": 4}})
+    else:
+        assert not manager.run(args + ["--resources=cpu=4"])
+    # The large task exceeds the budget and runs on its own.
+    assert monitor.max_usage == 8
+    assert monitor.max_running == 3
+
+
+def test_resource_scheduling_dependencies(manager: di.Manager):
+    # Resources that are not part of the default budget are not limited.
+    monitor = _Monitor()
+    first = manager(basename="first", actions=[monitor.action("first", 1)], resources={"gpu": 1})
+    for i in range(3):
+        manager(basename=f"second{i}", actions=[monitor.action(f"second{i}", 1)],
+                task_dep=[first["basename"]], resources={"gpu": 1})
+    assert not manager.run(["-n", "4", "-P", "thread"])
+    assert monitor.max_running > 1
+
+
+class _DurationsReporter(di.DoitInterfaceReporter):
+    DURATIONS_PATH = "custom-durations.sqlite"
+
+
+@pytest.mark.parametrize("priority, reporter, expected", [
+    ("declaration", _DurationsReporter, ["single", "first", "second"]),
+    # Without recorded durations, the chain of two tasks is the critical path, and the remaining
+    # tasks have the same priority.
+    ("critical-path", "console", ["first", "single", "second"]),
+    ("critical-path", _DurationsReporter, ["single", "first", "second"]),
+])
+def test_critical_path_priority(manager: di.Manager, priority: str, reporter, expected: list):
+    order = []
+    manager(basename="single", actions=[lambda: order.append("single")])
+    manager(basename="first", actions=[lambda: order.append("first")])
+    manager(basename="second", actions=[lambda: order.append("second")], task_dep=["first"])
+    # Durations are read from the path of the reporter rather than the default path.
+    durations.save({"single": 10, "first": 1, "second": 1}, _DurationsReporter.DURATIONS_PATH)
+    durations.save({"single": 0.1, "first": 1, "second": 1})
+    with mock.patch("sys.stdout.write"):
+        assert not manager.run([f"--priority={priority}"], DOIT_CONFIG={"reporter": reporter})
+    assert order == expected
+
+
+def test_asyncio_runner(manager: di.Manager):
+    monitor = _Monitor()
+    with di.SubprocessAction.use_as_default():
+        first = manager(basename="first", actions=["echo {name} > $@"], targets=["first.txt"])
+        for i in range(3):
+            manager(basename=f"second{i}", file_dep=first["targets"], targets=[f"second{i}.txt"],
+                    actions=[[sys.executable, "-c", "import sys; open(sys.argv[2], 'w')", "$^",
+                              "$@"], monitor.action(f"second{i}", 1)],
+                    teardown=[monitor.action(f"teardown{i}", 0)])
+    assert not manager.run(["-n", "4", "-P", "asyncio"])
+    with open("first.txt") as fp:
+        assert fp.read().strip() == "first"
+    assert all(os.path.isfile(f"second{i}.txt") for i in range(3))
+    assert monitor.max_running == 3
+
+    # Tasks are up to date and not executed again.
+    monitor.max_running = 0
+    assert not manager.run(["-n", "4", "-P", "asyncio"])
+    assert monitor.max_running == 0
+
+
+@pytest.mark.parametrize("continue_", [False, True])
+def test_asyncio_runner_failure(manager: di.Manager, continue_: bool):
+    manager(basename="fail", actions=[di.SubprocessAction("false")])
+    manager(basename="missing_program", actions=[di.SubprocessAction(["missing-program"])])
+    manager(basename="missing_target", actions=[di.SubprocessAction("true")], targets=["missing"])
+    manager(basename="success", actions=[di.SubprocessAction("touch $@")], targets=["success"],
+            task_dep=["fail"])
+    args = ["-n", "2", "-P", "asyncio"] + (["--continue"] if continue_ else [])
+    with mock.patch("sys.stdout.write") as write:
+        # Tasks with unmet dependencies are errors rather than failures.
+        assert manager.run(args, DOIT_CONFIG={"reporter": di.DoitInterfaceReporter}) == \
+            (2 if continue_ else 1)
+    stdout = get_mocked_stdout(write)
+    assert "FAILED: fail" in stdout
+    assert "FAILED: missing_program" in stdout
+    assert ("FAILED: missing_target" in stdout) == continue_
+    assert not os.path.exists("success")
@@ -1,4 +1,6 @@
 import doit_interface as di
+import hashlib
+import pickle
 import pytest
 
 
@@ -15,3 +17,32 @@ def test_dict2args():
     assert di.dict2args({"hello": "world"}, foo="bar") == ["--hello=world", "--foo=bar"]
     with pytest.raises(ValueError):
         assert di.dict2args({"hello": "world"}, hello="other")
+
+
+def test_declaration_location_pickle():
+    location = di.DeclarationLocation(test_declaration_location_pickle.__code__, 17)
+    other = pickle.loads(pickle.dumps(location))
+    assert other.filename == location.filename == __file__
+    assert other.lineno == 17
+    assert repr(other) == repr(location)
+
+
+@pytest.mark.parametrize("immediate", [False, True])
+def test_sqlite_transaction(immediate: bool):
+    with di.util.sqlite_transaction("db.sqlite", immediate) as connection:
+        connection.execute("CREATE TABLE values_ (value INTEGER)")
+        connection.execute("INSERT INTO values_ VALUES (1)")
+    # Transactions are rolled back if the block raises.
+    with pytest.raises(RuntimeError), di.util.sqlite_transaction("db.sqlite", immediate) \
+            as connection:
+        connection.execute("INSERT INTO values_ VALUES (2)")
+        raise RuntimeError
+    with di.util.sqlite_transaction("db.sqlite") as connection:
+        assert connection.execute("SELECT value FROM values_").fetchall() == [(1,)]
+
+
+def test_hash_file():
+    data = b"x" * (2 ** 20 + 3)
+    with open("data.bin", "wb") as fp:
+        fp.write(data)
+    assert di.util.hash_file("data.bin") == hashlib.sha256(data).hexdigest()
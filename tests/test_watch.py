@@ -0,0 +1,89 @@
+import doit_interface as di
+from doit_interface import watch
+import os
+import pytest
+import threading
+import time
+from unittest import mock
+
+
+def test_dependency_index():
+    index = watch.DependencyIndex([
+        {"basename": "a", "name": "0", "file_dep": ["in0.txt"], "targets": ["a0.txt"]},
+        {"basename": "a", "name": "1", "file_dep": ["in1.txt"], "targets": ["a1.txt"]},
+        {"basename": "b", "file_dep": ["a1.txt", "in2.txt"], "targets": ["b.txt"]},
+        {"basename": "c", "task_dep": ["a"]},
+        {"basename": "d", "file_dep": ["b.txt"]},
+    ])
+    assert set(index.sources) == {os.path.abspath(f"in{i}.txt") for i in range(3)}
+    assert index.affected([os.path.abspath("in0.txt")]) == ["a:0", "c"]
+    assert index.affected([os.path.abspath("in1.txt")]) == ["a:1", "b", "c", "d"]
+    assert index.affected([os.path.abspath("in2.txt"), os.path.abspath("a1.txt")]) == ["b", "d"]
+    assert index.affected([os.path.abspath("in0.txt"), os.path.abspath("in1.txt")]) == \
+        ["a:0", "a:1", "b", "c", "d"]
+
+
+def test_inotify():
+    os.makedirs("data")
+    paths = [os.path.abspath(path) for path in ["data/a.txt", "data/b.txt", "missing/c.txt"]]
+    with watch.Inotify(paths) as inotify:
+        assert inotify.wait(timeout=0.01) == set()
+        # Writes, renames, and unrelated files.
+        for path in ["data/a.txt", "data/other.txt", "data/tmp"]:
+            with open(path, "w") as fp:
+                fp.write("content")
+        os.rename("data/tmp", "data/b.txt")
+        assert inotify.wait(0.01) == set(paths[:2])
+        os.unlink("data/a.txt")
+        assert inotify.wait(0.01) == {paths[0]}
+
+
+def test_inotify_overflow():
+    with watch.Inotify(["a.txt"]) as inotify, \
+            mock.patch("os.read", side_effect=[
+                watch._EVENT.pack(-1, watch.IN_Q_OVERFLOW, 0, 0), BlockingIOError]):
+        assert inotify._read() == {os.path.abspath("a.txt")}
+
+
+def _wait_for(path: str) -> None:
+    for _ in range(500):
+        if os.path.exists(path):
+            return
+        time.sleep(0.01)
+    raise TimeoutError(path)  # pragma: no cover
+
+
+def test_watch(manager: di.Manager):
+    for name in ["input", "other"]:
+        with open(f"{name}.txt", "w") as fp:
+            fp.write(name)
+    manager(basename="copy", file_dep=["input.txt"], targets=["copy.txt"],
+            actions=["cp %(dependencies)s %(targets)s"])
+    manager(basename="final", file_dep=["copy.txt"], targets=["final.txt"],
+            actions=["cp %(dependencies)s %(targets)s", "echo final >> log.txt"])
+    manager(basename="other", file_dep=["other.txt"], actions=["echo other >> log.txt"])
+
+    statuses = []
+    thread = threading.Thread(target=lambda: statuses.append(
+        manager.watch(["--verbosity=0"], debounce=0.05, max_runs=1)))
+    with mock.patch("sys.stdout.write"):
+        thread.start()
+        _wait_for("final.txt")
+        time.sleep(0.1)
+        # Write the file twice in quick succession so the changes are debounced.
+        for content in ["changed", "changed again"]:
+            with open("input.txt", "w") as fp:
+                fp.write(content)
+        thread.join(10)
+    assert not thread.is_alive() and statuses == [0]
+    with open("final.txt") as fp:
+        assert fp.read() == "changed again"
+    with open("log.txt") as fp:
+        assert sorted(fp.read().split()) == ["final", "final", "other"]
+
+
+def test_watch_frozen(manager: di.Manager):
+    manager(basename="task")
+    manager.freeze()
+    with pytest.raises(RuntimeError, match="cannot be watched"):
+        manager.watch()
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import doit_interface as di
+from doit_interface import workers
+import os
+import pickle
+import pytest
+import signal
+import socket
+import sys
+from unittest import mock
+from .conftest import get_mocked_stdout
+
+
+SCRIPT = """
+import os
+import sys
+
+with open(sys.argv[1], "w") as fp:
+    fp.write(f"{os.getcwd()} {os.environ.get('doit_interface_TEST_VAR')} {__name__}")
+"""
+
+
+@pytest.fixture(autouse=True)
+def preload():
+    yield
+    di.PythonWorkerAction.set_preload([])
+
+
+@pytest.mark.parametrize("par_type", ["serial", "process", "asyncio"])
+def test_python_worker(manager: di.Manager, par_type: str):
+    os.makedirs("subdir")
+    with open("script.py", "w") as fp:
+        fp.write(SCRIPT)
+    for i in range(3):
+        manager(basename=f"task{i}", targets=[f"output{i}.txt"], actions=[
+            di.PythonWorkerAction(f"$! ../script.py ../$@ {i}", cwd="subdir",
+                                  env={"doit_interface_TEST_VAR": i})])
+    args = [] if par_type == "serial" else ["-n", "2", "-P", par_type]
+    assert not manager.run(args)
+    for i in range(3):
+        with open(f"output{i}.txt") as fp:
+            assert fp.read() == f"{os.path.abspath('subdir')} {i} __main__"
+
+
+def test_python_worker_module_and_code(manager: di.Manager):
+    manager(basename="module", actions=[
+        di.PythonWorkerAction(["-m", "json.tool", "--help"], log="module.log")])
+    manager(basename="code", targets=["code.txt"], actions=[di.PythonWorkerAction(
+        ["$!", "-c", "import sys; open(sys.argv[1], 'w').write(' '.join(sys.argv))", "$@"])])
+    assert not manager.run()
+    with open("module.log") as fp:
+        assert "usage:" in fp.read()
+    with open("code.txt") as fp:
+        assert fp.read() == "-c code.txt"
+
+
+@pytest.mark.parametrize("code, message", [
+    ("import sys; sys.exit(3)", "returned non-zero exit status 3"),
+    ("import sys; sys.exit('message')", "returned non-zero exit status 1"),
+    ("raise RuntimeError('boom')", "returned non-zero exit status 1"),
+    ("import os, signal; os.kill(os.getpid(), signal.SIGKILL)", "exited without a status code"),
+    ("pass", "target target.txt was not created"),
+])
+def test_python_worker_failure(manager: di.Manager, code: str, message: str):
+    manager(basename="task", targets=["target.txt"], actions=[
+        di.PythonWorkerAction(["-c", code], log="task.log", tail=1)])
+    with mock.patch("sys.stdout.write") as write:
+        assert manager.run(DOIT_CONFIG={"reporter": di.DoitInterfaceReporter}) == 1
+    assert message in get_mocked_stdout(write)
+
+
+@pytest.mark.parametrize("args", ["$!", "-m", ["-c"], 7])
+def test_python_worker_invalid_command(manager: di.Manager, args):
+    manager(basename="task", actions=[di.PythonWorkerAction(args)])
+    with mock.patch("sys.stderr.write") as write:
+        assert manager.run() == 3
+    assert "not a valid" in get_mocked_stdout(write)
+
+
+def test_python_worker_preload(manager: di.Manager):
+    di.PythonWorkerAction.set_preload(["colorsys"])
+    assert di.PythonWorkerAction.get_preload() == ["colorsys"]
+    manager(basename="task", actions=[
+        di.PythonWorkerAction(["-c", "import sys; sys.exit('colorsys' not in sys.modules)"])])
+    assert not manager.run()
+    worker = di.PythonWorkerAction._WORKER
+    assert worker.is_alive()
+
+    # Changing the preloaded modules stops the worker.
+    di.PythonWorkerAction.set_preload(["module_that_does_not_exist"])
+    assert not worker.is_alive() and di.PythonWorkerAction._WORKER is None
+    with mock.patch("sys.stderr.write"):
+        assert manager.run() == 1
+
+
+def test_python_worker_cache(manager: di.Manager):
+    di.SubprocessAction.set_artifact_cache(di.ArtifactCache("cache"))
+    try:
+        manager(basename="task", targets=["output.txt"], actions=[
+            di.PythonWorkerAction(["-c", "open('output.txt', 'w').write('output')"])])
+        assert not manager.run()
+        os.unlink("output.txt")
+        with mock.patch.object(workers._Worker, "run") as run:
+            assert not manager.run()
+        run.assert_not_called()
+        assert os.path.isfile("output.txt")
+    finally:
+        di.SubprocessAction.set_artifact_cache(None)
+
+
+@pytest.mark.parametrize("argv, expected", [
+    (["-c", "import sys; sys.exit(sys.argv != ['-c', 'a'])", "a"], 0),
+    (["-m", "json.tool", "--help"], 0),
+    (["script.py", "b"], 3),
+    (["-c", "raise SystemExit"], 0),
+    (["-c", "raise SystemExit(True)"], 1),
+    (["-c", "raise SystemExit('message')"], 1),
+    (["-c", "raise KeyboardInterrupt"], 1),
+])
+def test_run(argv: list[str], expected: int):
+    with open("script.py", "w") as fp:
+        fp.write("import sys; sys.exit(3 if sys.argv == ['script.py', 'b'] else 0)")
+    with mock.patch.dict(os.environ), mock.patch.object(sys, "argv"), \
+            mock.patch.object(sys, "path", list(sys.path)), mock.patch("sys.stderr.write"):
+        assert workers._run(argv, os.getcwd(), {"VAR": "value"}) == expected
+        assert dict(os.environ) == {"VAR": "value"}
+
+
+def test_handle_and_serve():
+    connection, remote = socket.socketpair()
+    streams = [os.dup(fd) for fd in range(3)]
+    server, client = socket.socketpair()
+    handler = signal.getsignal(signal.SIGCHLD)
+    try:
+        with connection, remote, server, client:
+            # Send a request to the server which is handled without forking.
+            workers._send_fds(client, b"\0", [remote.fileno(), *streams])
+            client.shutdown(socket.SHUT_WR)
+            with mock.patch("os.fork", return_value=1):
+                workers._serve(os.dup(server.fileno()), ["colorsys"])
+            assert client.recv(1) == b"\0"
+
+            # Handle the request as the forked process would.
+            connection.sendall(pickle.dumps((["-c", "pass"], os.getcwd(), dict(os.environ))))
+            connection.shutdown(socket.SHUT_WR)
+            with mock.patch.object(sys, "argv"), mock.patch.object(sys, "path", list(sys.path)):
+                assert workers._handle([os.dup(remote.fileno()), *map(os.dup, streams)]) == 0
+            assert connection.recv(1) == b"0"
+    finally:
+        for fd in streams:
+            os.close(fd)
+        signal.signal(signal.SIGCHLD, handler)
@@ -0,0 +1,195 @@
+import doit_interface as di
+import multiprocessing
+import os
+import pytest
+import sqlite3
+import sys
+import time
+from unittest import mock
+
+
+def test_work_queue():
+    queue = di.WorkQueue("queue.sqlite")
+    queue.publish({"a": [], "b": ["a", "missing"], "c": ["a"], "d": ["b", "c"], "e": []},
+                  priority={"e": 1})
+    assert queue.counts() == {"pending": 5}
+
+    # Tasks are claimed by priority and then in the order they were published.
+    assert [queue.claim("worker"), queue.claim("worker"), queue.claim("worker")] == \
+        ["e", "a", None]
+    assert not queue.is_finished()
+    queue.complete("e", 0)
+    queue.complete("a", 0)
+    assert queue.claim("worker") == "b"
+    assert queue.claim("other") == "c"
+
+    # Tasks claimed by crashed workers can be returned to the queue.
+    assert queue.requeue("other") == 1
+    assert queue.claim("worker") == "c"
+    assert queue.requeue() == 2
+    assert queue.claim("worker") == "b"
+
+    # Tasks depending on failed tasks are never claimed.
+    queue.complete("b", 1)
+    assert queue.claim("worker") == "c"
+    queue.complete("c", 0)
+    assert queue.claim("worker") is None
+    assert queue.is_finished()
+    assert queue.counts() == {"done": 3, "failed": 1, "pending": 1}
+
+    # Publishing replaces the tasks.
+    queue.publish({"x": []})
+    assert queue.counts() == {"pending": 1}
+
+
+def test_work_queue_lease():
+    queue = di.WorkQueue("queue.sqlite", lease=10)
+    queue.publish({"a": [], "b": ["a"]})
+    with mock.patch("time.time", return_value=0):
+        assert queue.claim("dead") == "a"
+    with mock.patch("time.time", return_value=5):
+        assert queue.renew("a", "dead")
+        assert queue.claim("other") is None
+    # The task is still running until the lease has expired.
+    with mock.patch("time.time", return_value=14):
+        assert queue.claim("other") is None
+        assert not queue.is_finished()
+    with mock.patch("time.time", return_value=16):
+        assert queue.claim("other") == "a"
+        assert not queue.renew("a", "dead")
+
+    # Dependent tasks are only released once if both workers complete the task.
+    queue.complete("a", 0)
+    queue.complete("a", 1)
+    assert queue.counts() == {"done": 1, "pending": 1}
+    assert queue.claim("other") == "b"
+    queue.complete("b", 0)
+    assert queue.is_finished()
+
+
+def test_work_queue_keep_alive():
+    queue = di.WorkQueue("queue.sqlite")
+    queue.publish({"a": []})
+    queue.claim("worker")
+    with sqlite3.connect("queue.sqlite") as connection:
+        (claimed,), = connection.execute("SELECT heartbeat FROM tasks")
+        with queue.keep_alive("a", "worker", interval=0.01):
+            time.sleep(0.1)
+        (renewed,), = connection.execute("SELECT heartbeat FROM tasks")
+    assert renewed > claimed
+
+
+def test_work_queue_add_lease():
+    with sqlite3.connect("queue.sqlite") as connection:
+        connection.execute("CREATE TABLE tasks (position INTEGER PRIMARY KEY, name TEXT UNIQUE "
+                           "NOT NULL, priority REAL NOT NULL, remaining INTEGER NOT NULL, status "
+                           "TEXT NOT NULL, worker TEXT, started REAL, finished REAL, returncode "
+                           "INTEGER)")
+        connection.execute("INSERT INTO tasks (name, priority, remaining, status, worker, started) "
+                           "VALUES ('a', 0, 0, 'running', 'dead', 0)")
+    connection.close()
+    # Tasks claimed before the lease was added expire based on the time they were claimed.
+    assert di.WorkQueue("queue.sqlite").claim("worker") == "a"
+
+
+def _declare_tasks(manager: di.Manager, fail: bool = False) -> None:
+    # Write the process identifier of the worker to the target.
+    code = "import os, sys, time; time.sleep(0.05); " \
+        "open(sys.argv[1], 'w').write(str(os.getppid())); sys.exit(int(sys.argv[2]))"
+    for i in range(4):
+        manager(basename="first", name=str(i), targets=[f"first{i}.txt"],
+                actions=[di.SubprocessAction(["$!", "-c", code, "$@", str(int(fail and i == 0))])])
+    manager(basename="second", file_dep=[f"first{i}.txt" for i in range(4)],
+            targets=["second.txt"], actions=[di.SubprocessAction(["$!", "-c", code, "$@", "0"])])
+    manager(basename="other", targets=["other.txt"],
+            actions=[di.SubprocessAction(["$!", "-c", code, "$@", "0"])])
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_publish_and_work(manager: di.Manager, fail: bool):
+    _declare_tasks(manager, fail)
+    with pytest.raises(ValueError, match="task `missing` does not exist"):
+        manager.publish("queue.sqlite", ["missing"])
+    # The tasks creating the file dependencies of `second` are published.
+    assert manager.publish("queue.sqlite", ["second"]) == 5
+    with mock.patch("sys.stdout.write"):
+        assert manager.work("queue.sqlite", ["--verbosity=0"]) == fail
+    counts = di.WorkQueue("queue.sqlite").counts()
+    if fail:
+        assert counts == {"done": 3, "failed": 1, "pending": 1}
+        assert not os.path.exists("second.txt")
+    else:
+        assert counts == {"done": 5}
+        assert os.path.isfile("second.txt")
+    assert not os.path.exists("other.txt")
+
+
+def test_publish_durations(manager: di.Manager):
+    class Reporter(di.DoitInterfaceReporter):
+        DURATIONS_PATH = "custom-durations.sqlite"
+
+    manager(basename="a", actions=["true"])
+    manager(basename="b", actions=["true"])
+    di.durations.save({"a": 1, "b": 5}, Reporter.DURATIONS_PATH)
+    di.durations.save({"a": 5, "b": 1})
+    # Tasks are prioritized by the durations recorded by the reporter.
+    manager.publish("queue.sqlite", reporter=Reporter)
+    assert di.WorkQueue("queue.sqlite").claim("worker") == "b"
+    # The default reporter does not record durations so tasks are claimed in declaration order.
+    manager.publish("queue.sqlite")
+    assert di.WorkQueue("queue.sqlite").claim("worker") == "a"
+
+
+def _work(path: str) -> None:
+    manager = di.Manager.get_instance(strict=True)
+    sys.exit(manager.work(path, ["--reporter=zero"], poll_interval=0.01))
+
+
+def test_work_processes(manager: di.Manager):
+    _declare_tasks(manager)
+    assert manager.publish("queue.sqlite") == 7
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_work, args=("queue.sqlite",)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+
+    # All tasks were executed, and independent tasks were executed by different workers.
+    assert di.WorkQueue("queue.sqlite").counts() == {"done": 7}
+    pids = set()
+    for filename in [f"first{i}.txt" for i in range(4)] + ["second.txt", "other.txt"]:
+        with open(filename) as fp:
+            pids.add(int(fp.read()))
+    assert pids <= {process.pid for process in processes} and len(pids) > 1
+
+
+def test_work_interrupted(manager: di.Manager):
+    manager(basename="task", actions=["true"])
+    manager.publish("queue.sqlite")
+    with mock.patch.object(manager, "run", side_effect=KeyboardInterrupt), \
+            pytest.raises(KeyboardInterrupt):
+        manager.work("queue.sqlite")
+    assert di.WorkQueue("queue.sqlite").counts() == {"pending": 1}
+
+
+def test_work_poll(manager: di.Manager):
+    manager(basename="task", actions=["true"])
+    manager.publish("queue.sqlite")
+    queue = di.WorkQueue("queue.sqlite")
+    queue.claim("other")
+
+    # Complete the task claimed by another worker while polling.
+    with mock.patch("time.sleep", side_effect=lambda _: queue.complete("task", 0)) as sleep:
+        assert manager.work("queue.sqlite") == 0
+    sleep.assert_called_once_with(1.0)
+
+
+def test_work_expired_lease(manager: di.Manager):
+    manager(basename="task", actions=["true"])
+    manager.publish("queue.sqlite")
+    # Claim the task by a worker that is killed before completing it.
+    di.WorkQueue("queue.sqlite").claim("dead")
+    assert manager.work("queue.sqlite", ["--reporter=zero"], poll_interval=0.01, lease=0.1) == 0
+    assert di.WorkQueue("queue.sqlite").counts() == {"done": 1}